@@ -0,0 +1,305 @@
+"""Admission control for write endpoints.
+
+Every write passes through ``AdmissionController.admit`` before doing any
+work.  Load shedding comes first: while the vote queue is deep or the event
+loop is lagging, writes get a 503 so reads keep flowing.  Then per-IP and
+per-fan token buckets (one pair per rule) cap how fast a single client can
+write, answering 429.  Both carry ``Retry-After``.
+
+Clients are keyed on the socket peer.  ``X-Forwarded-For`` is only read
+when the peer is one of the configured trusted proxies, and then the client
+is the right-most hop that is not itself trusted: everything left of that
+was written by the client and can be anything.  Fan buckets are only used
+for fan ids the caller has checked against the ``fans`` collection.
+
+Buckets live in one LRU-ordered dict: a check is O(1), the dict never grows
+past ``max_keys``, and keys idle longer than ``idle_s`` are dropped as new
+ones arrive.  An idle bucket has refilled completely, so forgetting it does
+not change anyone's limit.
+
+Admin endpoints (exports, rebuilds, backfills, the profiler) go through
+``AdminGuard`` instead: a per-client ``admin`` bucket, then the shared
+``ADMIN_TOKEN`` in ``X-Admin-Token``.  With no token configured they are
+refused outright.
+"""
+import hmac
+import ipaddress
+import math
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple, Union
+
+from fastapi import HTTPException, Request
+
+from metrics import registry
+
+admission_rejections = registry.counter(
+    "admission_rejections_total", "Write requests refused by admission control", ("rule", "reason")
+)
+
+
+@dataclass(frozen=True)
+class RateRule:
+    rate: float  # tokens per second
+    burst: int
+
+    @property
+    def refill_s(self) -> float:
+        return self.burst / self.rate if self.rate > 0 else float("inf")
+
+
+# Defaults per write route; ADMISSION_<NAME>_RATE / _BURST override them
+RULES: Dict[str, RateRule] = {
+    "votes": RateRule(rate=1.0, burst=10),
+    "downloads": RateRule(rate=2.0, burst=20),
+    "questions": RateRule(rate=0.1, burst=3),
+}
+
+# Admin endpoints share one bucket per client; ADMISSION_ADMIN_RATE / _BURST override it
+ADMIN_RULE = RateRule(rate=0.2, burst=5)
+
+
+Network = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+def parse_networks(value: str) -> Tuple[Network, ...]:
+    """``"10.0.0.0/8, 127.0.0.1"`` -> networks; a bare address is a /32 (or /128)."""
+    return tuple(ipaddress.ip_network(part.strip(), strict=False) for part in value.split(",") if part.strip())
+
+
+def _trusted(address: str, trusted: Sequence[Network]) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in trusted)
+
+
+def forwarded_client(peer: str, forwarded: Optional[str], trusted: Sequence[Network]) -> str:
+    """The address to rate limit: ``peer``, or the right-most untrusted hop behind a trusted proxy."""
+    if not forwarded or not _trusted(peer, trusted):
+        return peer
+    hop = peer
+    for hop in reversed([part.strip() for part in forwarded.split(",") if part.strip()]):
+        if not _trusted(hop, trusted):
+            return hop
+    # Every hop is one of ours; the left-most is as close to the client as it gets
+    return hop
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.updated = now
+
+
+class RateLimiter:
+    def __init__(self, max_keys: int = 100_000, idle_s: float = 600):
+        self.max_keys = max_keys
+        self.idle_s = idle_s
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self.evictions = 0
+
+    def acquire(self, key: str, rule: RateRule, cost: float = 1.0) -> float:
+        """Take ``cost`` tokens; returns 0 when allowed, else seconds until it would be."""
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(rule.burst, now)
+            self._evict(now)
+        else:
+            bucket.tokens = min(rule.burst, bucket.tokens + (now - bucket.updated) * rule.rate)
+            bucket.updated = now
+            self._buckets.move_to_end(key)
+        if bucket.tokens >= cost:
+            bucket.tokens -= cost
+            return 0.0
+        return (cost - bucket.tokens) / rule.rate if rule.rate > 0 else float("inf")
+
+    def _evict(self, now: float):
+        buckets = self._buckets
+        while len(buckets) > self.max_keys:
+            buckets.popitem(last=False)
+            self.evictions += 1
+        # Oldest-touched first, so this stops at the first recent key
+        for _ in range(8):
+            oldest = next(iter(buckets.values()))
+            if now - oldest.updated < self.idle_s or len(buckets) == 1:
+                break
+            buckets.popitem(last=False)
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class LoadShedder:
+    def __init__(
+        self,
+        queue_depth: Callable[[], int],
+        loop_lag: Callable[[], float],
+        max_queue_depth: int = 5000,
+        max_loop_lag_ms: float = 250,
+        retry_after_s: int = 2,
+    ):
+        self.queue_depth = queue_depth
+        self.loop_lag = loop_lag
+        self.max_queue_depth = max_queue_depth
+        self.max_loop_lag_ms = max_loop_lag_ms
+        self.retry_after_s = retry_after_s
+
+    def overloaded(self) -> Optional[str]:
+        if self.max_queue_depth and self.queue_depth() >= self.max_queue_depth:
+            return "queue_depth"
+        if self.max_loop_lag_ms and self.loop_lag() * 1000 >= self.max_loop_lag_ms:
+            return "loop_lag"
+        return None
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        shedder: LoadShedder,
+        rules: Optional[Dict[str, RateRule]] = None,
+        limiter: Optional[RateLimiter] = None,
+        enabled: bool = True,
+    ):
+        self.shedder = shedder
+        self.rules = dict(rules or RULES)
+        self.limiter = limiter or RateLimiter()
+        self.enabled = enabled
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {}
+
+    @classmethod
+    def from_env(cls, queue_depth: Callable[[], int], loop_lag: Callable[[], float]) -> "AdmissionController":
+        env = os.environ
+        rules = {
+            name: RateRule(
+                rate=float(env.get(f"ADMISSION_{name.upper()}_RATE", rule.rate)),
+                burst=int(env.get(f"ADMISSION_{name.upper()}_BURST", rule.burst)),
+            )
+            for name, rule in RULES.items()
+        }
+        shedder = LoadShedder(
+            queue_depth,
+            loop_lag,
+            max_queue_depth=int(env.get("SHED_MAX_QUEUE_DEPTH", "5000")),
+            max_loop_lag_ms=float(env.get("SHED_MAX_LOOP_LAG_MS", "250")),
+        )
+        limiter = RateLimiter(
+            max_keys=int(env.get("ADMISSION_MAX_KEYS", "100000")),
+            idle_s=max(float(env.get("ADMISSION_IDLE_S", "600")), max(r.refill_s for r in rules.values())),
+        )
+        return cls(shedder, rules, limiter, enabled=env.get("ADMISSION_ENABLED", "true").lower() == "true")
+
+    def share(self, workers: int):
+        """Split every rule across ``workers`` processes that each keep their own buckets."""
+        if workers > 1:
+            self.rules = {
+                name: RateRule(rate=rule.rate / workers, burst=max(1, round(rule.burst / workers)))
+                for name, rule in self.rules.items()
+            }
+
+    def _reject(self, rule: str, reason: str, status: int, retry_after: float, detail: str):
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        admission_rejections.inc(rule, reason)
+        raise HTTPException(
+            status_code=status,
+            detail=detail,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+    def admit(self, rule_name: str, client: str):
+        """Raise a 503/429 ``HTTPException`` unless this write may proceed."""
+        if not self.enabled:
+            return
+        reason = self.shedder.overloaded()
+        if reason is not None:
+            self._reject(
+                rule_name, reason, 503, self.shedder.retry_after_s, "Server is busy, please retry shortly"
+            )
+        wait = self.limiter.acquire(f"{rule_name}:ip:{client}", self.rules[rule_name])
+        if wait:
+            self._reject(rule_name, "rate_limited", 429, wait, "Too many requests, slow down")
+        self.admitted += 1
+
+    def admit_fan(self, rule_name: str, fan_id: Any):
+        """The per-fan bucket, for a write already admitted by IP from a fan known to exist."""
+        if not self.enabled:
+            return
+        wait = self.limiter.acquire(f"{rule_name}:fan:{fan_id}", self.rules[rule_name])
+        if wait:
+            self._reject(rule_name, "rate_limited", 429, wait, "Too many requests, slow down")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "keys": len(self.limiter),
+            "max_keys": self.limiter.max_keys,
+            "evictions": self.limiter.evictions,
+            "overloaded": self.shedder.overloaded(),
+            "rules": {name: {"rate": r.rate, "burst": r.burst} for name, r in self.rules.items()},
+        }
+
+
+class AdminGuard:
+    def __init__(
+        self,
+        token: str,
+        trusted: Sequence[Network] = (),
+        rule: RateRule = ADMIN_RULE,
+        limiter: Optional[RateLimiter] = None,
+        enabled: bool = True,
+    ):
+        self.token = token
+        self.trusted = tuple(trusted)
+        self.rule = rule
+        self.limiter = limiter or RateLimiter(max_keys=10_000)
+        self.enabled = enabled
+
+    @classmethod
+    def from_env(cls) -> "AdminGuard":
+        env = os.environ
+        return cls(
+            env.get("ADMIN_TOKEN", ""),
+            parse_networks(env.get("TRUSTED_PROXIES", "127.0.0.1,::1")),
+            RateRule(
+                rate=float(env.get("ADMISSION_ADMIN_RATE", ADMIN_RULE.rate)),
+                burst=int(env.get("ADMISSION_ADMIN_BURST", ADMIN_RULE.burst)),
+            ),
+            enabled=env.get("ADMISSION_ENABLED", "true").lower() == "true",
+        )
+
+    def check(self, request: Request):
+        """Raise a 429/401/403 ``HTTPException`` unless this is an admin within their rate."""
+        if self.enabled:
+            peer = request.client.host if request.client else ""
+            client = forwarded_client(peer, request.headers.get("x-forwarded-for"), self.trusted)
+            # Before the token, so guesses are rate limited too
+            wait = self.limiter.acquire(f"admin:ip:{client}", self.rule)
+            if wait:
+                admission_rejections.inc("admin", "rate_limited")
+                raise HTTPException(
+                    status_code=429,
+                    detail="Too many requests, slow down",
+                    headers={"Retry-After": str(max(1, math.ceil(wait)))},
+                )
+        if not self.token:
+            raise HTTPException(status_code=403, detail="Admin endpoints are disabled; set ADMIN_TOKEN")
+        supplied = request.headers.get("x-admin-token")
+        if not supplied:
+            raise HTTPException(status_code=401, detail="Admin token required")
+        if not hmac.compare_digest(supplied.encode(), self.token.encode()):
+            raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+async def require_admin(request: Request):
+    """Route dependency for admin endpoints; the guard is set up by ``create_app``."""
+    request.app.state.admin.check(request)
@@ -0,0 +1,483 @@
+"""Application factory shared by ``server.py`` and ``main.py``.
+
+``create_app()`` builds the app from cheap pieces only: CORS from config, the
+metrics middleware, the liveness and health routes, ``/api/metrics`` and
+the admin guard (see ``admission.AdminGuard``).
+Everything else is a feature: a module with an ``APIRouter`` named
+``router`` and optional ``startup(timer)``, ``shutdown()`` and ``health()``
+hooks, listed in ``FEATURES`` with the path prefixes it serves.
+
+Nothing a feature imports is loaded with the app.  A feature is imported,
+started and its router included the first time a request hits one of its
+prefixes, and ``preload`` features are loaded in the background as soon as
+the app is serving.  A request that arrives while its feature is loading
+waits for it, so routes never see half-loaded state while ``/health``
+answers from the first moment.
+
+A feature that fails to import or start answers 503 and is retried by the
+next request after ``RETRY_AFTER_S``; startup hooks therefore start their
+background tasks last.  ``/api/health`` reports the failure, and how long
+every startup phase took from process start to the first request served.
+``startup_bench.py`` holds that cold start to a budget.
+"""
+import asyncio
+import importlib
+import logging
+import os
+import time
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Literal, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+from fastapi import APIRouter, Depends, FastAPI
+from pydantic import BaseModel
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import BaseRoute, Match, NoMatchFound
+
+from admission import AdminGuard, require_admin
+from fast_json import FastJSONResponse
+from metrics import MetricsMiddleware, SamplingProfiler, registry
+
+_IMPORTED_AT = time.perf_counter()
+
+ROOT_DIR = Path(__file__).parent
+
+# Seconds before a feature that failed to load is tried again
+RETRY_AFTER_S = 10
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Feature:
+    name: str
+    module: str
+    prefixes: Tuple[str, ...] = ()
+    requires: Tuple[str, ...] = ()
+    # Loaded in the background once the app is serving instead of on first use
+    preload: bool = True
+
+
+FEATURES: Tuple[Feature, ...] = (
+    Feature("core", "core", ("/api/cache", "/api/admission")),
+    Feature("status", "status_api", ("/api/status",), requires=("core",)),
+    Feature("images", "images_api", ("/api/images",), requires=("core",)),
+    Feature("votes", "votes_api", ("/api/votes", "/api/outfits", "/api/fans"), requires=("core", "images")),
+    Feature("wallpapers", "wallpapers_api", ("/api/wallpapers", "/api/counters"), requires=("core", "images")),
+    Feature("questions", "questions_api", ("/api/questions",), requires=("core",)),
+    # Sub-requests load whichever features their sections need
+    Feature("home", "home_api", ("/api/home", "/api/batch"), preload=False),
+    Feature("exports", "exports_api", ("/api/export",), requires=("core",), preload=False),
+)
+
+
+@dataclass(frozen=True)
+class AppSettings:
+    cors_origins: Tuple[str, ...] = ("*",)
+    cors_allow_credentials: bool = True
+    cors_max_age_s: int = 600
+    # None enables every feature
+    features: Optional[Tuple[str, ...]] = None
+    preload: bool = True
+    profiler_enabled: bool = False
+    profiler_interval_ms: float = 5.0
+    profiler_threshold_ms: float = 500.0
+
+    @classmethod
+    def from_env(cls) -> "AppSettings":
+        env = os.environ
+        features = env.get("APP_FEATURES", "all").strip()
+        return cls(
+            cors_origins=tuple(origin.strip() for origin in env.get("CORS_ORIGINS", "*").split(",") if origin.strip()),
+            cors_allow_credentials=env.get("CORS_ALLOW_CREDENTIALS", "true").lower() == "true",
+            cors_max_age_s=int(env.get("CORS_MAX_AGE_S", "600")),
+            features=None if features == "all" else tuple(name.strip() for name in features.split(",") if name.strip()),
+            preload=env.get("APP_PRELOAD", "true").lower() == "true",
+            profiler_enabled=env.get("PROFILER_ENABLED", "false").lower() == "true",
+            profiler_interval_ms=float(env.get("PROFILER_INTERVAL_MS", "5")),
+            profiler_threshold_ms=float(env.get("PROFILER_SLOW_REQUEST_MS", "500")),
+        )
+
+
+def process_age_s() -> Optional[float]:
+    """Seconds since this process started, where ``/proc`` is available."""
+    try:
+        with open("/proc/self/stat") as f:
+            # Fields after the parenthesised command name; starttime is field 22
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StartupTimer:
+    """Startup phases and milestones, in ms since the process started.
+
+    Without ``/proc`` the clock starts when this module was imported.
+    """
+
+    def __init__(self):
+        age = process_age_s()
+        self.since = "process_start" if age is not None else "app_import"
+        self.origin = time.perf_counter() - age if age is not None else _IMPORTED_AT
+        self.phases: List[Dict[str, Any]] = []
+        self.marks: Dict[str, float] = {}
+        if age is not None:
+            # Interpreter start and every import before create_app()
+            self.phases.append({"name": "boot", "start_ms": 0.0, "ms": self.now_ms()})
+
+    def now_ms(self) -> float:
+        return round((time.perf_counter() - self.origin) * 1000, 3)
+
+    @contextmanager
+    def phase(self, name: str):
+        start = self.now_ms()
+        try:
+            yield
+        finally:
+            self.phases.append({"name": name, "start_ms": start, "ms": round(self.now_ms() - start, 3)})
+
+    def scoped(self, prefix: str) -> "ScopedTimer":
+        return ScopedTimer(self, prefix)
+
+    def mark(self, name: str):
+        """Record the first time ``name`` happened."""
+        self.marks.setdefault(name, self.now_ms())
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "since": self.since,
+            **{f"{name}_ms": at for name, at in self.marks.items()},
+            "phases": sorted(self.phases, key=lambda phase: phase["start_ms"]),
+        }
+
+
+class ScopedTimer:
+    """The timer handed to a feature's ``startup``; phases are named ``<feature>.<phase>``."""
+
+    def __init__(self, timer: StartupTimer, prefix: str):
+        self.timer = timer
+        self.prefix = prefix
+
+    def phase(self, name: str):
+        return self.timer.phase(f"{self.prefix}.{name}")
+
+
+class FeatureUnavailable(RuntimeError):
+    def __init__(self, name: str, error: str):
+        super().__init__(f"{name} is unavailable: {error}")
+        self.name = name
+
+
+def _under(path: str, prefixes: Sequence[str]) -> bool:
+    return any(path == prefix or path.startswith(prefix + "/") for prefix in prefixes)
+
+
+class LazyFeatureRoute(BaseRoute):
+    """Stands in for a feature's routes until the feature is loaded."""
+
+    def __init__(self, loader: "FeatureLoader", feature: Feature):
+        self.loader = loader
+        self.feature = feature
+
+    def matches(self, scope) -> Tuple[Match, Dict[str, Any]]:
+        if (
+            scope["type"] == "http"
+            and self.feature.name not in self.loader.modules
+            and _under(scope["path"], self.feature.prefixes)
+        ):
+            return Match.FULL, {}
+        return Match.NONE, {}
+
+    def url_path_for(self, name: str, /, **path_params: Any):
+        raise NoMatchFound(name, path_params)
+
+    async def handle(self, scope, receive, send):
+        try:
+            await self.loader.load(self.feature.name)
+        except FeatureUnavailable as e:
+            response = JSONResponse({"detail": str(e)}, status_code=503, headers={"Retry-After": str(RETRY_AFTER_S)})
+            await response(scope, receive, send)
+            return
+        # Route again; the feature's own routes match now instead of this one
+        await self.loader.app.router(scope, receive, send)
+
+
+class FeatureLoader:
+    def __init__(self, app: FastAPI, features: Sequence[Feature], timer: StartupTimer, preload: bool = True):
+        self.app = app
+        self.features = {feature.name: feature for feature in features}
+        self.timer = timer
+        self.preload_enabled = preload
+        self.modules: Dict[str, Any] = {}
+        self.failures: Dict[str, Dict[str, Any]] = {}
+        self._loading: Dict[str, asyncio.Task] = {}
+
+    def install(self):
+        for feature in self.features.values():
+            self.app.router.routes.append(LazyFeatureRoute(self, feature))
+
+    async def load(self, name: str):
+        module = self.modules.get(name)
+        if module is not None:
+            return module
+        failure = self.failures.get(name)
+        if failure is not None and time.monotonic() - failure["at"] < RETRY_AFTER_S:
+            raise FeatureUnavailable(name, failure["error"])
+        task = self._loading.get(name)
+        if task is None:
+            task = self._loading[name] = asyncio.create_task(self._load(self.features[name]))
+
+            def done(task):
+                self._loading.pop(name, None)
+                if not task.cancelled():
+                    # Retrieved here too, in case every waiter gave up
+                    task.exception()
+
+            task.add_done_callback(done)
+        # A request that gives up does not cancel a load others are waiting for
+        return await asyncio.shield(task)
+
+    async def _load(self, feature: Feature):
+        for dependency in feature.requires:
+            await self.load(dependency)
+        timer = self.timer.scoped(feature.name)
+        try:
+            with timer.phase("import"):
+                # Off the event loop, so requests that need no feature are not held up
+                module = await asyncio.to_thread(importlib.import_module, feature.module)
+            startup = getattr(module, "startup", None)
+            if startup is not None:
+                with timer.phase("startup"):
+                    await startup(timer)
+        except Exception as e:
+            logger.exception("Feature %s failed to load", feature.name)
+            self.failures[feature.name] = {"error": f"{type(e).__name__}: {e}", "at": time.monotonic()}
+            raise FeatureUnavailable(feature.name, self.failures[feature.name]["error"]) from e
+        router = getattr(module, "router", None)
+        if router is not None:
+            for route in router.routes:
+                if not _under(getattr(route, "path", ""), feature.prefixes):
+                    logger.warning("%s is outside the %s prefixes; it only answers once the feature is loaded",
+                                   getattr(route, "path", route), feature.name)
+            self.app.include_router(router)
+            # Built on the first /openapi.json request; rebuild it with these routes
+            self.app.openapi_schema = None
+        self.failures.pop(feature.name, None)
+        self.modules[feature.name] = module
+        return module
+
+    async def preload(self):
+        async def preload_one(name):
+            try:
+                await self.load(name)
+            except FeatureUnavailable:
+                # Logged by _load, reported by /api/health and retried on use
+                pass
+
+        # Independent features start concurrently; dependencies are awaited in load()
+        await asyncio.gather(*(preload_one(name) for name, feature in self.features.items() if feature.preload))
+        self.timer.mark("preloaded")
+
+    async def shutdown(self):
+        loading = list(self._loading.values())
+        for task in loading:
+            task.cancel()
+        await asyncio.gather(*loading, return_exceptions=True)
+        # Dependents finish loading after what they require, so core stops last
+        for name in reversed(list(self.modules)):
+            hook = getattr(self.modules[name], "shutdown", None)
+            if hook is None:
+                continue
+            try:
+                await hook()
+            except Exception:
+                logger.exception("Feature %s failed to shut down", name)
+        self.modules.clear()
+
+    @property
+    def ready(self) -> bool:
+        if self.failures:
+            return False
+        return not self.preload_enabled or all(
+            name in self.modules for name, feature in self.features.items() if feature.preload
+        )
+
+    def health(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = {}
+        for module in self.modules.values():
+            hook = getattr(module, "health", None)
+            if hook is not None:
+                data.update(hook())
+        return data
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {}
+        for name, feature in self.features.items():
+            if name in self.modules:
+                status = "loaded"
+            elif name in self._loading:
+                status = "loading"
+            elif name in self.failures:
+                status = "failed"
+            else:
+                status = "idle"
+            stats[name] = {"status": status, "preload": feature.preload}
+            if name in self.failures:
+                stats[name]["error"] = self.failures[name]["error"]
+        return stats
+
+
+def enabled_features(features: Sequence[Feature], names: Optional[Sequence[str]]) -> List[Feature]:
+    """``features`` limited to ``names`` and everything they require."""
+    if names is None:
+        return list(features)
+    by_name = {feature.name: feature for feature in features}
+    unknown = set(names) - set(by_name)
+    if unknown:
+        raise ValueError(f"Unknown features in APP_FEATURES: {', '.join(sorted(unknown))}")
+    enabled, pending = set(), list(names)
+    while pending:
+        name = pending.pop()
+        if name not in enabled:
+            enabled.add(name)
+            pending.extend(by_name[name].requires)
+    return [feature for feature in features if feature.name in enabled]
+
+
+class StartupTimingMiddleware:
+    """Marks when the first HTTP response has been sent."""
+
+    def __init__(self, app, timer: StartupTimer):
+        self.app = app
+        self.timer = timer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or "first_request" in self.timer.marks:
+            return await self.app(scope, receive, send)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.timer.mark("first_request")
+
+
+class ProfilerSettings(BaseModel):
+    enabled: bool
+    threshold_ms: Optional[float] = None
+    interval_ms: Optional[float] = None
+
+
+def builtin_router(loader: FeatureLoader, timer: StartupTimer, profiler: SamplingProfiler) -> APIRouter:
+    """Routes that answer before, and regardless of, any feature."""
+    router = APIRouter(default_response_class=FastJSONResponse)
+
+    @router.get("/")
+    async def root():
+        return {"status": "ok"}
+
+    @router.get("/health")
+    async def liveness():
+        return {"ok": True}
+
+    @router.get("/api/")
+    async def api_root():
+        return {"message": "Hello World"}
+
+    @router.get("/api/health")
+    async def health():
+        return {
+            "success": loader.ready,
+            "message": "Fan Hub Pro API is running!",
+            "timestamp": datetime.utcnow(),
+            "data": {**loader.health(), "features": loader.stats(), "startup": timer.snapshot()},
+        }
+
+    @router.get("/api/metrics")
+    async def get_metrics():
+        return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+    @router.get("/api/metrics/profiler", dependencies=[Depends(require_admin)])
+    async def get_profiler():
+        return profiler.status()
+
+    @router.post("/api/metrics/profiler", dependencies=[Depends(require_admin)])
+    async def set_profiler(settings: ProfilerSettings):
+        if settings.enabled:
+            profiler.start(interval_ms=settings.interval_ms, threshold_ms=settings.threshold_ms)
+        else:
+            profiler.stop()
+        return profiler.status()
+
+    @router.get("/api/metrics/profiles", dependencies=[Depends(require_admin)])
+    async def get_slow_request_profiles(format: Literal['json', 'folded'] = 'json'):
+        if format == 'folded':
+            lines = [line for profile in profiler.profiles for line in profile["folded"]]
+            return PlainTextResponse("\n".join(lines) + "\n")
+        return {"success": True, "data": list(profiler.profiles)}
+
+    return router
+
+
+def create_app(
+    settings: Optional[AppSettings] = None,
+    features: Sequence[Feature] = FEATURES,
+    mongo_client: Any = None,
+) -> FastAPI:
+    """Build the app; ``mongo_client`` replaces the client built from ``MONGO_URL`` (for benches and tests)."""
+    load_dotenv(ROOT_DIR / '.env')
+    if mongo_client is not None:
+        from database import use_client
+
+        use_client(mongo_client)
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    settings = settings or AppSettings.from_env()
+    timer = StartupTimer()
+    with timer.phase("create_app"):
+        profiler = SamplingProfiler(
+            interval_ms=settings.profiler_interval_ms,
+            threshold_ms=settings.profiler_threshold_ms,
+        )
+
+        @asynccontextmanager
+        async def lifespan(app: FastAPI):
+            if settings.profiler_enabled:
+                profiler.start()
+            preload = asyncio.create_task(loader.preload()) if settings.preload else None
+            timer.mark("serving")
+            try:
+                yield
+            finally:
+                profiler.stop()
+                if preload is not None and not preload.done():
+                    preload.cancel()
+                    await asyncio.gather(preload, return_exceptions=True)
+                await loader.shutdown()
+
+        app = FastAPI(lifespan=lifespan)
+        loader = FeatureLoader(app, enabled_features(features, settings.features), timer, settings.preload)
+        app.state.features = loader
+        app.state.startup = timer
+        app.state.admin = AdminGuard.from_env()
+        app.include_router(builtin_router(loader, timer, profiler))
+        loader.install()
+
+        app.add_middleware(
+            CORSMiddleware,
+            allow_origins=list(settings.cors_origins),
+            allow_credentials=settings.cors_allow_credentials,
+            allow_methods=["*"],
+            allow_headers=["*"],
+            max_age=settings.cors_max_age_s,
+        )
+        app.add_middleware(MetricsMiddleware, profiler=profiler)
+        app.add_middleware(StartupTimingMiddleware, timer=timer)
+    return app
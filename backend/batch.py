@@ -0,0 +1,135 @@
+"""In-process fan-out of GET sub-requests.
+
+``SubrequestRunner`` dispatches several API paths through the ASGI app
+concurrently, without a network round-trip, so a page that needs five
+endpoints pays for one request and the slowest section instead of the sum.
+Every section gets its own timeout; a slow or failing section is reported
+in place while the others are still returned.  Sub-requests go through the
+same routing, caching and metrics as external calls.
+"""
+import asyncio
+import gzip
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+import orjson
+from fastapi import Request, Response
+
+import fast_json
+
+# Requests that never finish or would recurse into the runner
+BLOCKED_PREFIXES = ("/api/batch", "/api/home", "/api/outfits/stream", "/api/export")
+DROPPED_HEADERS = {b"accept-encoding", b"if-none-match", b"content-length", b"content-type", b"origin"}
+
+
+class SubrequestError(ValueError):
+    pass
+
+
+class SubrequestRunner:
+    def __init__(self, app=None, max_requests: int = 10, timeout_ms: float = 1500, gzip_min_size: int = 1024):
+        # Defaults to the app serving the parent request
+        self.app = app
+        self.max_requests = max_requests
+        self.timeout_ms = timeout_ms
+        self.gzip_min_size = gzip_min_size
+        self.timeouts = 0
+        self.failures = 0
+
+    def validate(self, requests: Sequence[Tuple[str, str]]):
+        if not requests:
+            raise SubrequestError("No requests given")
+        if len(requests) > self.max_requests:
+            raise SubrequestError(f"At most {self.max_requests} requests per batch")
+        if len({name for name, _ in requests}) != len(requests):
+            raise SubrequestError("Request ids must be unique")
+        for name, path in requests:
+            target = urlsplit(path).path
+            if not target.startswith("/api/") or target.startswith(BLOCKED_PREFIXES):
+                raise SubrequestError(f"Path not allowed in a batch: {path}")
+
+    async def fetch(self, parent: Request, path: str) -> Tuple[int, Dict[str, str], bytes]:
+        target = urlsplit(path)
+        scope = {
+            "type": "http",
+            "asgi": parent.scope.get("asgi", {"version": "3.0"}),
+            "http_version": parent.scope.get("http_version", "1.1"),
+            "method": "GET",
+            "scheme": parent.scope.get("scheme", "http"),
+            "path": target.path,
+            "raw_path": target.path.encode(),
+            "root_path": parent.scope.get("root_path", ""),
+            "query_string": target.query.encode(),
+            "headers": [(k, v) for k, v in parent.scope["headers"] if k not in DROPPED_HEADERS],
+            "client": parent.scope.get("client"),
+            "server": parent.scope.get("server"),
+        }
+        sent_request = False
+        status = 500
+        headers: Dict[str, str] = {}
+        body: List[bytes] = []
+
+        async def receive():
+            nonlocal sent_request
+            if not sent_request:
+                sent_request = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            # Nothing else is coming; park until the sub-request is cancelled
+            await asyncio.Event().wait()
+
+        async def send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers.update((k.decode("latin-1"), v.decode("latin-1")) for k, v in message.get("headers", ()))
+            elif message["type"] == "http.response.body":
+                body.append(message.get("body", b""))
+
+        await (self.app or parent.scope["app"])(scope, receive, send)
+        return status, headers, b"".join(body)
+
+    async def _section(self, parent: Request, path: str, timeout: float) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            status, headers, body = await asyncio.wait_for(self.fetch(parent, path), timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            return {"status": 504, "error": "Section timed out", "ms": round(timeout * 1000, 3)}
+        except Exception as e:
+            self.failures += 1
+            return {"status": 500, "error": str(e) or type(e).__name__}
+        section: Dict[str, Any] = {"status": status, "ms": round((time.perf_counter() - started) * 1000, 3)}
+        if headers.get("content-type", "").startswith("application/json"):
+            # Already-rendered JSON is embedded as is rather than parsed again
+            section["data"] = orjson.Fragment(body) if body else None
+        else:
+            section["data"] = body.decode("utf-8", "replace")
+        if status >= 400:
+            self.failures += 1
+        return section
+
+    async def run(
+        self, parent: Request, requests: Sequence[Tuple[str, str]], timeout_ms: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """Run ``(name, path)`` pairs concurrently; returns ``{name: section}``."""
+        timeout = (timeout_ms or self.timeout_ms) / 1000
+        sections = await asyncio.gather(*(self._section(parent, path, timeout) for _, path in requests))
+        return {name: section for (name, _), section in zip(requests, sections)}
+
+    def respond(self, request: Request, payload: Any) -> Response:
+        """JSON response, gzipped when the client accepts it and it is worth it."""
+        body = fast_json.dumps(payload)
+        headers = {"Vary": "Accept-Encoding"}
+        if len(body) >= self.gzip_min_size and "gzip" in request.headers.get("accept-encoding", ""):
+            body = gzip.compress(body, compresslevel=6)
+            headers["Content-Encoding"] = "gzip"
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_requests": self.max_requests,
+            "timeout_ms": self.timeout_ms,
+            "timeouts": self.timeouts,
+            "failures": self.failures,
+        }
@@ -0,0 +1,610 @@
+#!/usr/bin/env python3
+"""
+Synthetic production-size dataset generator and bulk loader.
+
+Generates outfits, fans, votes, questions and wallpapers with realistic
+skew using numpy:
+
+* votes per outfit follow a Zipf law, and each outfit's voters are distinct
+  fans drawn from a second Zipf law over fan activity, so the (outfitId,
+  fanId) unique index holds and a few fans vote on nearly everything;
+* vote timestamps mix a steady baseline with bursts that decay
+  exponentially (a live show, a viral post);
+* reactions follow a configurable mix, and ``outfits.votes``, fan
+  ``points`` and ``isTopFan`` are derived from the generated votes.
+
+Documents are streamed in batches into MongoDB by ``--concurrency`` Motor
+tasks doing unordered ``insert_many``, and can also be written to an NDJSON
+snapshot (Extended JSON, one file per collection) that ``load`` streams back
+without generating again:
+
+    python bulk_load.py generate --votes 10000000 --drop --index --snapshot data/snapshots/10m
+    python bulk_load.py load data/snapshots/10m --drop --index
+
+Every document, votes included, carries its ``_id`` from generation, so
+loading the same snapshot twice skips what is already there instead of
+duplicating it.  Without ``--drop`` the unique indexes are built before
+loading rather than after, so they are in place to reject a rerun.
+
+Fan points are a plain per-reaction sum; run ``POST /api/fans/scores/rebuild``
+to apply the daily cap and decay.  Vote rollups are not updated by a load: the
+server backfills them when it starts and finds its running vote total behind
+the ``votes`` collection, and ``POST /api/votes/rollups/backfill`` brings a
+running server up to date.
+"""
+import asyncio
+import gzip
+import json
+import os
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import orjson
+import typer
+from bson import ObjectId
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import BulkWriteError
+
+from fan_scoring import TOP_FAN_POINTS, ScoringRules
+from vote_analytics import REACTIONS
+
+cli = typer.Typer(add_completion=False)
+
+SNAPSHOT_VERSION = 1
+DUPLICATE_KEY = 11000
+
+# Load order; votes reference outfits and fans
+COLLECTIONS = ["outfits", "fans", "wallpapers", "questions", "votes"]
+
+# Extended JSON field types per collection; everything else is plain JSON
+FIELD_TYPES: Dict[str, Dict[str, str]] = {
+    "outfits": {"_id": "oid", "createdAt": "date", "updatedAt": "date"},
+    "fans": {"_id": "oid", "createdAt": "date", "updatedAt": "date"},
+    "wallpapers": {"_id": "oid", "createdAt": "date", "updatedAt": "date"},
+    "questions": {"_id": "oid", "fanId": "oid", "createdAt": "date"},
+    "votes": {"_id": "oid", "outfitId": "oid", "fanId": "oid", "createdAt": "date"},
+}
+
+QUESTION_TEMPLATES = [
+    "¿Cuál es tu {thing} favorito de {place}?",
+    "¿Qué {thing} vas a usar en {place}?",
+    "¿Cuándo sale tu nueva {release}?",
+    "¿Vas a volver a {place} este año?",
+    "¿Quién diseñó el {thing} que usaste en {place}?",
+    "¿Cómo preparas tu {thing} antes de un concierto?",
+    "¿Cuál fue la {release} más difícil de grabar?",
+]
+QUESTION_WORDS = {
+    "thing": ["outfit", "vestido", "look", "accesorio", "peinado", "maquillaje", "color"],
+    "place": ["Madrid", "México", "Buenos Aires", "Bogotá", "Lima", "Santiago", "la gira"],
+    "release": ["canción", "colaboración", "gira", "sesión de fotos", "colección"],
+}
+ANSWER_TEMPLATES = [
+    "¡Gracias por preguntar! Pronto lo vas a ver en redes.",
+    "Me encanta esa pregunta, te respondo en el próximo directo.",
+    "Fue una sorpresa hasta para mí, ¡muy pronto más noticias!",
+    "https://youtu.be/respuesta-{n}",
+]
+
+
+@dataclass
+class Params:
+    outfits: int = 500
+    fans: int = 500_000
+    votes: int = 10_000_000
+    questions: int = 100_000
+    wallpapers: int = 1000
+    days: int = 30
+    outfit_skew: float = 1.1
+    fan_skew: float = 0.9
+    reaction_mix: str = "0.55,0.30,0.15"
+    burst_share: float = 0.4
+    bursts_per_day: float = 2.0
+    burst_decay_min: float = 45.0
+    answered_share: float = 0.7
+    seed: int = 42
+
+
+def zipf_weights(n: int, exponent: float, rng):
+    import numpy as np
+
+    # Rank 1 gets the most weight; ranks are shuffled so ids carry no order
+    weights = 1.0 / np.arange(1, n + 1, dtype=np.float64) ** exponent
+    rng.shuffle(weights)
+    return weights / weights.sum()
+
+
+def capped_multinomial(total: int, p, cap: int, rng):
+    """Split ``total`` by ``p`` with no bucket above ``cap``; overflow goes to the others."""
+    import numpy as np
+
+    if total > cap * len(p):
+        raise typer.BadParameter(f"{total} votes need more than {len(p)} outfits x {cap} fans")
+    counts = rng.multinomial(total, p)
+    while True:
+        overflow = int(np.clip(counts - cap, 0, None).sum())
+        if not overflow:
+            return counts
+        np.minimum(counts, cap, out=counts)
+        room = p * (counts < cap)
+        counts += rng.multinomial(overflow, room / room.sum())
+
+
+def distinct_fans(count: int, log_weights, rng):
+    """``count`` distinct fan indexes sampled by weight (Gumbel top-k)."""
+    import numpy as np
+
+    if count >= len(log_weights):
+        return np.arange(len(log_weights), dtype=np.int32)
+    keys = log_weights + rng.gumbel(size=len(log_weights))
+    return np.argpartition(-keys, count - 1)[:count].astype(np.int32)
+
+
+def vote_offsets(total: int, span_s: float, params: Params, rng):
+    """Seconds from the window start: a uniform baseline plus decaying bursts."""
+    import numpy as np
+
+    bursty = int(total * params.burst_share)
+    offsets = np.empty(total, dtype=np.float64)
+    offsets[bursty:] = rng.uniform(0, span_s, total - bursty)
+    if bursty:
+        n_bursts = max(1, int(params.bursts_per_day * span_s / 86400))
+        starts = rng.uniform(0, span_s, n_bursts)
+        sizes = rng.pareto(1.5, n_bursts) + 1
+        which = rng.choice(n_bursts, size=bursty, p=sizes / sizes.sum())
+        offsets[:bursty] = starts[which] + rng.exponential(params.burst_decay_min * 60, bursty)
+    return np.clip(offsets, 0, span_s - 1e-3)
+
+
+class Dataset:
+    """Generated columns, turned into documents one batch at a time."""
+
+    def __init__(self, params: Params, now: Optional[datetime] = None):
+        import numpy as np
+
+        self.params = params
+        rng = np.random.default_rng(params.seed)
+        self.end = (now or datetime.utcnow()).replace(microsecond=0)
+        self.start = self.end - timedelta(days=params.days)
+        span_s = params.days * 86400
+
+        mix = np.array([float(x) for x in params.reaction_mix.split(",")], dtype=np.float64)
+        if len(mix) != len(REACTIONS) or (mix < 0).any() or not mix.sum():
+            raise typer.BadParameter(f"--reaction-mix needs {len(REACTIONS)} non-negative weights")
+        self.reactions = list(REACTIONS)
+
+        self.outfit_ids = [ObjectId() for _ in range(params.outfits)]
+        self.fan_ids = [ObjectId() for _ in range(params.fans)]
+        self.wallpaper_ids = [ObjectId() for _ in range(params.wallpapers)]
+
+        started = time.perf_counter()
+        per_outfit = capped_multinomial(params.votes, zipf_weights(params.outfits, params.outfit_skew, rng), params.fans, rng)
+        fan_log_weights = np.log(zipf_weights(params.fans, params.fan_skew, rng))
+        vote_outfit = np.repeat(np.arange(params.outfits, dtype=np.int32), per_outfit)
+        vote_fan = np.concatenate(
+            [distinct_fans(int(n), fan_log_weights, rng) for n in per_outfit if n]
+            or [np.empty(0, dtype=np.int32)]
+        )
+        vote_reaction = rng.choice(len(mix), size=params.votes, p=mix / mix.sum()).astype(np.int8)
+        vote_offset = vote_offsets(params.votes, span_s, params, rng)
+        # Stored in time order, as the live API would have written them
+        order = np.argsort(vote_offset, kind="stable")
+        self.vote_outfit = vote_outfit[order]
+        self.vote_fan = vote_fan[order]
+        self.vote_reaction = vote_reaction[order]
+        self.vote_ms = (vote_offset[order] * 1000).astype(np.int64)
+
+        rules = ScoringRules.from_env()
+        reaction_points = np.array([rules.points(r) for r in self.reactions], dtype=np.int64)
+        self.outfit_votes = np.bincount(self.vote_outfit, minlength=params.outfits)
+        self.fan_points = np.bincount(
+            self.vote_fan, weights=reaction_points[self.vote_reaction], minlength=params.fans
+        ).astype(np.int64)
+        last_vote = np.full(params.fans, -1, dtype=np.int64)
+        np.maximum.at(last_vote, self.vote_fan, self.vote_ms)
+        self.fan_last_vote_ms = last_vote
+        # Accounts predate the window by up to a year
+        self.fan_created_ms = -rng.uniform(0, 365 * 86400_000, params.fans).astype(np.int64)
+        self.fan_has_email = rng.random(params.fans) < 0.6
+        self.outfit_created_ms = -rng.uniform(0, 90 * 86400_000, params.outfits).astype(np.int64)
+
+        self.wallpaper_downloads = rng.multinomial(
+            params.wallpapers * 250, zipf_weights(params.wallpapers, 1.0, rng)
+        ) if params.wallpapers else np.empty(0, dtype=np.int64)
+        self.wallpaper_created_ms = -rng.uniform(0, 180 * 86400_000, params.wallpapers).astype(np.int64)
+
+        # The busiest fans ask the most questions too
+        self.question_fan = rng.choice(params.fans, size=params.questions, p=np.exp(fan_log_weights)) \
+            if params.fans else np.empty(0, dtype=np.int64)
+        self.question_ms = np.sort(rng.uniform(0, span_s * 1000, params.questions)).astype(np.int64)
+        self.question_template = rng.integers(0, len(QUESTION_TEMPLATES), params.questions)
+        self.question_words = rng.integers(0, 1 << 30, (params.questions, len(QUESTION_WORDS)))
+        self.question_answer = np.where(
+            rng.random(params.questions) < params.answered_share,
+            rng.integers(0, len(ANSWER_TEMPLATES), params.questions),
+            -1,
+        )
+        self.generate_s = time.perf_counter() - started
+
+    def _at(self, ms) -> datetime:
+        return self.start + timedelta(milliseconds=int(ms))
+
+    def counts(self) -> Dict[str, int]:
+        p = self.params
+        return {"outfits": p.outfits, "fans": p.fans, "wallpapers": p.wallpapers, "questions": p.questions, "votes": p.votes}
+
+    def batches(self, collection: str, size: int) -> Iterator[List[Dict[str, Any]]]:
+        build = getattr(self, f"_{collection}")
+        total = self.counts()[collection]
+        for lo in range(0, total, size):
+            yield build(lo, min(lo + size, total))
+
+    def _outfits(self, lo: int, hi: int) -> List[Dict[str, Any]]:
+        return [
+            {
+                "_id": self.outfit_ids[i],
+                "title": f"Outfit #{i + 1}",
+                "imageUrl": f"https://picsum.photos/seed/outfit-{i}/800/1200",
+                "votes": int(self.outfit_votes[i]),
+                "createdAt": self._at(self.outfit_created_ms[i]),
+                "updatedAt": self.end,
+            }
+            for i in range(lo, hi)
+        ]
+
+    def _fans(self, lo: int, hi: int) -> List[Dict[str, Any]]:
+        docs = []
+        for i in range(lo, hi):
+            points = int(self.fan_points[i])
+            created = self._at(self.fan_created_ms[i])
+            doc = {
+                "_id": self.fan_ids[i],
+                "username": f"fan{i:07d}",
+                "points": points,
+                "isTopFan": points >= TOP_FAN_POINTS,
+                "createdAt": created,
+                "updatedAt": self._at(self.fan_last_vote_ms[i]) if self.fan_last_vote_ms[i] >= 0 else created,
+            }
+            if self.fan_has_email[i]:
+                doc["email"] = f"fan{i:07d}@example.com"
+            docs.append(doc)
+        return docs
+
+    def _wallpapers(self, lo: int, hi: int) -> List[Dict[str, Any]]:
+        return [
+            {
+                "_id": self.wallpaper_ids[i],
+                "title": f"Wallpaper #{i + 1}",
+                "imageUrl": f"https://picsum.photos/seed/wallpaper-{i}/1080/1920",
+                "downloads": int(self.wallpaper_downloads[i]),
+                "createdAt": self._at(self.wallpaper_created_ms[i]),
+                "updatedAt": self.end,
+            }
+            for i in range(lo, hi)
+        ]
+
+    def _questions(self, lo: int, hi: int) -> List[Dict[str, Any]]:
+        docs = []
+        for i in range(lo, hi):
+            words = {
+                key: options[self.question_words[i, j] % len(options)]
+                for j, (key, options) in enumerate(QUESTION_WORDS.items())
+            }
+            fan = int(self.question_fan[i])
+            # No status: the moderation queue adopts them like Node API writes
+            doc = {
+                "_id": ObjectId(),
+                "fanName": f"fan{fan:07d}",
+                "fanId": self.fan_ids[fan],
+                "text": QUESTION_TEMPLATES[self.question_template[i]].format(**words),
+                "createdAt": self._at(self.question_ms[i]),
+            }
+            if self.question_answer[i] >= 0:
+                doc["answer"] = ANSWER_TEMPLATES[self.question_answer[i]].format(n=i)
+            docs.append(doc)
+        return docs
+
+    def _votes(self, lo: int, hi: int) -> List[Dict[str, Any]]:
+        outfit_ids, fan_ids, reactions, at = self.outfit_ids, self.fan_ids, self.reactions, self._at
+        return [
+            {"_id": ObjectId(), "outfitId": outfit_ids[o], "fanId": fan_ids[f], "reaction": reactions[r], "createdAt": at(ms)}
+            for o, f, r, ms in zip(
+                self.vote_outfit[lo:hi].tolist(),
+                self.vote_fan[lo:hi].tolist(),
+                self.vote_reaction[lo:hi].tolist(),
+                self.vote_ms[lo:hi].tolist(),
+            )
+        ]
+
+
+def _encode(doc: Dict[str, Any], types: Dict[str, str]) -> bytes:
+    out = dict(doc)
+    for field, kind in types.items():
+        value = out.get(field)
+        if value is None:
+            continue
+        if kind == "oid":
+            out[field] = {"$oid": str(value)}
+        else:
+            out[field] = {"$date": value.isoformat(timespec="milliseconds") + "Z"}
+    return orjson.dumps(out)
+
+
+def _decode(line: bytes, types: Dict[str, str]) -> Dict[str, Any]:
+    doc = orjson.loads(line)
+    for field, kind in types.items():
+        value = doc.get(field)
+        if value is None:
+            continue
+        if kind == "oid":
+            doc[field] = ObjectId(value["$oid"])
+        else:
+            doc[field] = datetime.fromisoformat(value["$date"].rstrip("Z"))
+    return doc
+
+
+def _open(path: Path, mode: str):
+    return gzip.open(path, mode, compresslevel=1) if path.suffix == ".gz" else open(path, mode)
+
+
+class SnapshotWriter:
+    def __init__(self, directory: Path, compress: bool):
+        self.directory = directory
+        self.suffix = ".ndjson.gz" if compress else ".ndjson"
+        self.files: Dict[str, str] = {}
+        self.counts: Dict[str, int] = {}
+        directory.mkdir(parents=True, exist_ok=True)
+        self._handle = None
+
+    def open(self, collection: str):
+        self.close_file()
+        name = collection + self.suffix
+        self.files[collection] = name
+        self.counts[collection] = 0
+        self._handle = _open(self.directory / name, "wb")
+
+    def write(self, collection: str, docs: List[Dict[str, Any]]):
+        types = FIELD_TYPES[collection]
+        self._handle.write(b"".join(_encode(doc, types) + b"\n" for doc in docs))
+        self.counts[collection] += len(docs)
+
+    def close_file(self):
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+    def finish(self, params: Optional[Params]):
+        self.close_file()
+        manifest = {
+            "version": SNAPSHOT_VERSION,
+            "created_at": datetime.utcnow().isoformat(),
+            "params": asdict(params) if params else None,
+            "collections": [
+                {"name": name, "file": self.files[name], "count": self.counts[name]} for name in self.files
+            ],
+        }
+        (self.directory / "manifest.json").write_text(json.dumps(manifest, indent=2))
+
+
+def read_snapshot(directory: Path, collection: str, file: str, size: int) -> Iterator[List[Dict[str, Any]]]:
+    types = FIELD_TYPES[collection]
+    batch: List[Dict[str, Any]] = []
+    with _open(directory / file, "rb") as f:
+        for line in f:
+            batch.append(_decode(line, types))
+            if len(batch) >= size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+class Progress:
+    def __init__(self, collection: str, total: int):
+        self.collection = collection
+        self.total = total
+        self.done = 0
+        self.duplicates = 0
+        self.started = time.perf_counter()
+        self._last_report = self.started
+
+    def add(self, inserted: int, duplicates: int = 0):
+        self.done += inserted
+        self.duplicates += duplicates
+        now = time.perf_counter()
+        if now - self._last_report >= 2:
+            self._last_report = now
+            self.report(final=False)
+
+    def report(self, final: bool = True):
+        elapsed = time.perf_counter() - self.started
+        rate = self.done / elapsed if elapsed else 0.0
+        line = f"{self.collection}: {self.done:,}/{self.total:,} in {elapsed:.1f}s ({rate:,.0f} docs/s)"
+        if self.duplicates:
+            line += f", {self.duplicates:,} duplicates skipped"
+        typer.echo(line if final else line + " ...")
+
+
+async def insert_batches(collection, batches: Iterable[List[Dict[str, Any]]], progress: Progress, concurrency: int):
+    """Unordered ``insert_many`` of every batch across ``concurrency`` tasks."""
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    failures: List[BaseException] = []
+
+    async def worker():
+        while True:
+            batch = await queue.get()
+            if batch is None:
+                return
+            if failures:
+                # Keep draining so the producer never blocks on a full queue
+                continue
+            try:
+                result = await collection.insert_many(batch, ordered=False)
+                progress.add(len(result.inserted_ids))
+            except BulkWriteError as e:
+                # Reloading into a populated collection: skip what is already there
+                errors = e.details.get("writeErrors", [])
+                if any(error.get("code") != DUPLICATE_KEY for error in errors):
+                    failures.append(e)
+                    continue
+                progress.add(e.details.get("nInserted", 0), len(errors))
+            except Exception as e:
+                failures.append(e)
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+        for batch in batches:
+            if failures:
+                break
+            # The next batch is built while the workers wait on Mongo
+            await queue.put(batch)
+    finally:
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    if failures:
+        raise failures[0]
+    progress.report()
+
+
+async def drop_collections(db):
+    for name in [*COLLECTIONS, "vote_rollups", "vote_totals"]:
+        await db.drop_collection(name)
+    # The saved search index would still list the dropped questions
+    snapshot = Path(os.environ.get("SEARCH_SNAPSHOT_PATH", str(Path(__file__).parent / "data" / "search_index.json.gz")))
+    snapshot.unlink(missing_ok=True)
+
+
+async def create_indexes(db):
+    """The indexes Mongoose declares on the bulk-loaded collections."""
+    started = time.perf_counter()
+    await db.votes.create_indexes([
+        IndexModel([("outfitId", ASCENDING), ("fanId", ASCENDING)], unique=True, name="outfitId_1_fanId_1"),
+    ])
+    await db.fans.create_indexes([
+        IndexModel([("username", ASCENDING)], unique=True, name="username_1"),
+        IndexModel([("email", ASCENDING)], unique=True, sparse=True, name="email_1"),
+    ])
+    typer.echo(f"indexes built in {time.perf_counter() - started:.1f}s")
+
+
+def load_env():
+    from dotenv import load_dotenv
+
+    load_dotenv(Path(__file__).parent / ".env")
+
+
+def run_load(
+    sources: Dict[str, Iterable[List[Dict[str, Any]]]],
+    totals: Dict[str, int],
+    concurrency: int,
+    drop: bool,
+    index: bool,
+    tee=None,
+):
+    from database import Database
+
+    async def run():
+        database = Database.from_env()
+        try:
+            await database.connect()
+            db = database.db
+            if drop:
+                await drop_collections(db)
+            elif index:
+                # Existing data: the unique indexes must catch a rerun's duplicates
+                await create_indexes(db)
+            started = time.perf_counter()
+            for name, batches in sources.items():
+                if tee is not None:
+                    batches = tee(name, batches)
+                await insert_batches(db[name], batches, Progress(name, totals[name]), concurrency)
+            typer.echo(f"loaded in {time.perf_counter() - started:.1f}s")
+            if index and drop:
+                await create_indexes(db)
+        finally:
+            database.close()
+
+    asyncio.run(run())
+
+
+@cli.command()
+def generate(
+    outfits: int = typer.Option(500, min=1),
+    fans: int = typer.Option(500_000, min=1),
+    votes: int = typer.Option(10_000_000, min=0),
+    questions: int = typer.Option(100_000, min=0),
+    wallpapers: int = typer.Option(1000, min=0),
+    days: int = typer.Option(30, min=1, help="Votes and questions span the last N days"),
+    outfit_skew: float = typer.Option(1.1, help="Zipf exponent of votes per outfit"),
+    fan_skew: float = typer.Option(0.9, help="Zipf exponent of fan activity"),
+    reaction_mix: str = typer.Option("0.55,0.30,0.15", help="Weights of 💖,🔥,👏"),
+    burst_share: float = typer.Option(0.4, min=0, max=1, help="Share of votes that arrive in bursts"),
+    seed: int = typer.Option(42),
+    batch_size: int = typer.Option(10_000, min=1),
+    concurrency: int = typer.Option(8, min=1, help="Concurrent insert_many tasks"),
+    snapshot: Optional[Path] = typer.Option(None, file_okay=False, help="Also write an NDJSON snapshot here"),
+    compress: bool = typer.Option(False, help="gzip the snapshot files"),
+    load: bool = typer.Option(True, help="Insert into MongoDB (--no-load only writes the snapshot)"),
+    drop: bool = typer.Option(False, help="Drop the generated collections and vote rollups first"),
+    index: bool = typer.Option(False, help="Build the unique vote and fan indexes (before loading without --drop)"),
+):
+    """Generate a skewed synthetic dataset and stream it into MongoDB and/or a snapshot"""
+    if not load and snapshot is None:
+        raise typer.BadParameter("--no-load needs --snapshot")
+    # The scoring rules read .env while the dataset is generated
+    load_env()
+    params = Params(
+        outfits=outfits, fans=fans, votes=votes, questions=questions, wallpapers=wallpapers, days=days,
+        outfit_skew=outfit_skew, fan_skew=fan_skew, reaction_mix=reaction_mix, burst_share=burst_share, seed=seed,
+    )
+    dataset = Dataset(params)
+    typer.echo(f"generated {votes:,} votes for {outfits:,} outfits and {fans:,} fans in {dataset.generate_s:.1f}s")
+    totals = dataset.counts()
+    sources = {name: dataset.batches(name, batch_size) for name in COLLECTIONS}
+    writer = SnapshotWriter(snapshot, compress) if snapshot is not None else None
+
+    def tee(name, batches):
+        writer.open(name)
+        for batch in batches:
+            writer.write(name, batch)
+            yield batch
+
+    try:
+        if load:
+            run_load(sources, totals, concurrency, drop, index, tee if writer else None)
+        else:
+            for name, batches in sources.items():
+                progress = Progress(name, totals[name])
+                for batch in tee(name, batches):
+                    progress.add(len(batch))
+                progress.report()
+    finally:
+        if writer is not None:
+            writer.finish(params)
+            typer.echo(f"snapshot written to {snapshot}")
+
+
+@cli.command("load")
+def load_snapshot(
+    directory: Path = typer.Argument(..., exists=True, file_okay=False),
+    batch_size: int = typer.Option(10_000, min=1),
+    concurrency: int = typer.Option(8, min=1, help="Concurrent insert_many tasks"),
+    drop: bool = typer.Option(False, help="Drop the generated collections and vote rollups first"),
+    index: bool = typer.Option(False, help="Build the unique vote and fan indexes (before loading without --drop)"),
+):
+    """Stream a snapshot written by ``generate --snapshot`` into MongoDB"""
+    manifest = json.loads((directory / "manifest.json").read_text())
+    if manifest.get("version") != SNAPSHOT_VERSION:
+        raise typer.BadParameter(f"Unsupported snapshot version {manifest.get('version')}")
+    load_env()
+    entries = manifest["collections"]
+    sources = {e["name"]: read_snapshot(directory, e["name"], e["file"], batch_size) for e in entries}
+    run_load(sources, {e["name"]: e["count"] for e in entries}, concurrency, drop, index)
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,218 @@
+"""Response cache for read endpoints.
+
+``ResponseCache.cached`` wraps a FastAPI route so its JSON body is stored in
+a bounded LRU keyed by path and query string.  Concurrent misses for the same
+key share a single computation (single-flight), entries expire after a
+per-route TTL, and write routes drop entries by tag with ``invalidate``.
+Responses carry an ``ETag`` and ``Cache-Control`` header and conditional
+requests with a matching ``If-None-Match`` get a bodiless 304.  Only 200s
+are stored; any other status a route returns is passed through as is.
+"""
+import asyncio
+import functools
+import hashlib
+import inspect
+import time
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+from fastapi import Request, Response
+
+import fast_json
+
+
+@dataclass
+class CacheEntry:
+    body: bytes
+    etag: str
+    expires_at: float
+    tags: Tuple[str, ...]
+    max_age: int
+    headers: Dict[str, str]
+    status_code: int = 200
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 1024, enabled: bool = True):
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._tag_keys: Dict[str, Set[str]] = defaultdict(set)
+        self._tag_versions: Dict[str, int] = defaultdict(int)
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.not_modified = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def invalidate(self, *tags: str):
+        for tag in tags:
+            self._tag_versions[tag] += 1
+            for key in self._tag_keys.pop(tag, ()):
+                self._drop(key)
+            self.invalidations += 1
+
+    def clear(self):
+        for tag in list(self._tag_keys):
+            self.invalidate(tag)
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "coalesced": self.coalesced,
+            "not_modified": self.not_modified,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            for tag in entry.tags:
+                keys = self._tag_keys.get(tag)
+                if keys is not None:
+                    keys.discard(key)
+
+    def _get(self, key: str) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.monotonic():
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _store(self, key: str, entry: CacheEntry):
+        self._drop(key)
+        self._entries[key] = entry
+        for tag in entry.tags:
+            self._tag_keys[tag].add(key)
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.evictions += 1
+
+    async def _fill(self, key: str, ttl: int, tags: Tuple[str, ...], compute) -> CacheEntry:
+        versions = [self._tag_versions[tag] for tag in tags]
+        result, headers = await compute()
+        if isinstance(result, Response) and result.status_code != 200:
+            # Shared with requests already waiting on this fill, never stored
+            return CacheEntry(
+                body=result.body,
+                etag="",
+                expires_at=0.0,
+                tags=tags,
+                max_age=0,
+                headers={**headers, **{k: v for k, v in result.headers.items() if k != "content-length"}},
+                status_code=result.status_code,
+            )
+        if isinstance(result, Response):
+            # Routes on the fast path hand back an already rendered body
+            body = result.body
+            headers = {
+                **headers,
+                **{k: v for k, v in result.headers.items() if k not in ("content-length", "content-type")},
+            }
+        else:
+            body = fast_json.dumps(result)
+        entry = CacheEntry(
+            body=body,
+            etag='"%s"' % hashlib.blake2b(body, digest_size=12).hexdigest(),
+            expires_at=time.monotonic() + ttl,
+            tags=tags,
+            max_age=ttl,
+            headers=headers,
+        )
+        # Don't store a result that a write invalidated while it was computing
+        if versions == [self._tag_versions[tag] for tag in tags]:
+            self._store(key, entry)
+        return entry
+
+    async def lookup(self, key: str, ttl: int, tags: Tuple[str, ...], compute) -> CacheEntry:
+        entry = self._get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        # The fill runs detached, so a caller that is cancelled (a client
+        # disconnect, a sub-request timeout) does not fail the others waiting on it
+        task = asyncio.create_task(self._fill(key, ttl, tags, compute))
+        self._inflight[key] = task
+        task.add_done_callback(functools.partial(self._filled, key))
+        return await asyncio.shield(task)
+
+    def _filled(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Retrieved here so an error nobody is left waiting for is not logged as unhandled
+            task.exception()
+
+    def cached(self, ttl: int, tags: Iterable[str] = ()):
+        """Decorate a route on ``api_router`` to serve it from the cache."""
+        tags = tuple(tags)
+
+        def decorator(func):
+            signature = inspect.signature(func)
+            wants_request = "request" in signature.parameters
+            wants_response = "response" in signature.parameters
+
+            @functools.wraps(func)
+            async def wrapper(*args, request: Request, response: Response, **kwargs):
+                if wants_request:
+                    kwargs["request"] = request
+                if not self.enabled:
+                    if wants_response:
+                        kwargs["response"] = response
+                    return await func(*args, **kwargs)
+
+                async def compute():
+                    # Headers the route sets are cached alongside the body
+                    scratch = Response()
+                    if wants_response:
+                        kwargs["response"] = scratch
+                    result = await func(*args, **kwargs)
+                    if scratch.status_code != 200 and not isinstance(result, Response):
+                        result = Response(
+                            content=fast_json.dumps(result), status_code=scratch.status_code, media_type="application/json"
+                        )
+                    headers = {k: v for k, v in scratch.headers.items() if k != "content-length"}
+                    return result, headers
+
+                key = request.url.path
+                if request.url.query:
+                    key += "?" + "&".join(sorted(request.url.query.split("&")))
+                entry = await self.lookup(key, ttl, tags, compute)
+                if entry.status_code != 200:
+                    return Response(content=entry.body, status_code=entry.status_code, headers=entry.headers)
+
+                headers = {**entry.headers, "ETag": entry.etag, "Cache-Control": f"public, max-age={entry.max_age}"}
+                if_none_match = request.headers.get("if-none-match")
+                if if_none_match and entry.etag in {t.strip() for t in if_none_match.split(",")}:
+                    self.not_modified += 1
+                    return Response(status_code=304, headers=headers)
+                return Response(content=entry.body, media_type="application/json", headers=headers)
+
+            params = [p for p in signature.parameters.values() if p.name not in ("request", "response")]
+            params.append(inspect.Parameter("request", inspect.Parameter.KEYWORD_ONLY, annotation=Request))
+            params.append(inspect.Parameter("response", inspect.Parameter.KEYWORD_ONLY, annotation=Response))
+            wrapper.__signature__ = signature.replace(parameters=params)
+            return wrapper
+
+        return decorator
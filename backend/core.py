@@ -0,0 +1,151 @@
+"""Services shared by the API feature modules.
+
+The Mongo client, the shared-memory counter runtime, the response cache,
+admission control and the small helpers every route module uses live here.
+``app_factory`` imports this module (and the feature modules that import it)
+only once the app is serving, so importing the app neither reads the
+database settings nor opens a client.
+"""
+import asyncio
+import os
+from collections import OrderedDict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, List, Optional
+
+from bson import ObjectId
+from dotenv import load_dotenv
+from fastapi import APIRouter, HTTPException, Request
+
+from admission import AdmissionController, forwarded_client, parse_networks
+from cache import ResponseCache
+from database import Database, MongoCommandMetrics
+from fast_json import FastJSONResponse, serialization_mode
+from metrics import LoopLagMonitor, registry
+from pagination import InvalidCursor, ensure_indexes, paginate
+from shared_counters import SharedCounterFlusher, runtime as shared_runtime
+from vote_ingest import as_object_id
+
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# MongoDB connection; pool settings come from the MONGO_* env vars
+database = Database.from_env(listeners=[MongoCommandMetrics()])
+client = database.client
+db = database.db
+read_db = database.read_db
+
+# Set when running under launcher.py: hot counters live in shared memory and
+# only the designated worker writes them to Mongo
+worker = shared_runtime()
+shared_table = worker["table"]
+shared_flusher = (
+    SharedCounterFlusher(shared_table, db, interval_ms=int(os.environ.get('SHARED_FLUSH_INTERVAL_MS', '100')))
+    if shared_table is not None and worker["flusher"] else None
+)
+
+# validated | construct | raw, see fast_json
+SERIALIZATION_MODE = serialization_mode()
+
+# Read endpoints are cached in process and invalidated by tag from write paths
+response_cache = ResponseCache(
+    max_entries=int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', '1024')),
+    enabled=os.environ.get('RESPONSE_CACHE_ENABLED', 'true').lower() == 'true',
+)
+
+loop_lag_monitor = LoopLagMonitor()
+
+# Write backlogs admission control sheds load on; feature modules add theirs
+queue_depths: List[Callable[[], int]] = []
+
+# Writes are rate limited per IP/fan and shed first when the service is overloaded
+admission = AdmissionController.from_env(
+    queue_depth=lambda: sum(depth() for depth in queue_depths),
+    loop_lag=lambda: loop_lag_monitor.current,
+)
+admission.share(worker["workers"])
+# Only these peers may say who the client is, through X-Forwarded-For
+trusted_proxies = parse_networks(os.environ.get('TRUSTED_PROXIES', '127.0.0.1,::1'))
+
+# Fan ids already found in Mongo; fans are never deleted, so entries do not go stale
+known_fans: "OrderedDict[Any, None]" = OrderedDict()
+KNOWN_FANS_MAX = int(os.environ.get('KNOWN_FANS_MAX', '100000'))
+
+registry.add_collector(lambda: {
+    "response_cache_entries": len(response_cache._entries),
+    "mongo_pool_connections_open": database.pool_stats.open,
+    "mongo_pool_connections_in_use": database.pool_stats.in_use,
+    "mongo_pool_checkouts_waiting": database.pool_stats.waiting,
+})
+
+router = APIRouter(prefix="/api", default_response_class=FastJSONResponse)
+
+
+def client_ip(request: Request) -> str:
+    peer = request.client.host if request.client else ''
+    return forwarded_client(peer, request.headers.get('x-forwarded-for'), trusted_proxies)
+
+async def known_fan(fan_id: Optional[str]) -> Optional[Any]:
+    """The fan's id as stored, or None when no such fan exists."""
+    if not fan_id:
+        return None
+    oid = as_object_id(fan_id)
+    if oid in known_fans:
+        known_fans.move_to_end(oid)
+        return oid
+    # The primary: a fan who just signed up may not have reached a secondary
+    if await db.fans.find_one({"_id": oid}, {"_id": 1}) is None:
+        return None
+    known_fans[oid] = None
+    if len(known_fans) > KNOWN_FANS_MAX:
+        known_fans.popitem(last=False)
+    return oid
+
+def naive_utc(moment: Optional[datetime]) -> Optional[datetime]:
+    """Query datetimes are compared with the naive UTC values Mongo returns."""
+    if moment is None or moment.tzinfo is None:
+        return moment
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+def serialize_doc(doc):
+    """Render a raw Mongo document the way Mongoose's toJSON does."""
+    return {key: str(value) if isinstance(value, ObjectId) else value for key, value in doc.items()}
+
+async def page_or_400(collection, **kwargs):
+    try:
+        return await paginate(collection, **kwargs)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/admission/stats")
+async def get_admission_stats():
+    return admission.stats()
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    return response_cache.stats()
+
+background_tasks = []
+
+async def startup(timer):
+    with timer.phase("connect"):
+        await database.connect()
+    with timer.phase("indexes"):
+        await ensure_indexes(db)
+    if shared_flusher is not None:
+        background_tasks.append(asyncio.create_task(shared_flusher.run()))
+    background_tasks.append(asyncio.create_task(loop_lag_monitor.run()))
+
+async def shutdown():
+    for task in background_tasks:
+        task.cancel()
+    background_tasks.clear()
+    if shared_flusher is not None:
+        # Runs after every other feature has stopped, and the launcher stops
+        # the flushing worker last, so this covers every worker's increments
+        await shared_flusher.flush()
+    database.close()
+
+def health():
+    return {"database": database.stats()}
@@ -0,0 +1,213 @@
+"""Atomic and sharded hot counters.
+
+Counters start in direct mode: each increment is a single atomic ``$inc`` on
+the owning document, which already fixes the lost updates of the old
+read-modify-write.  When a counter's write rate crosses ``promote_rate``
+per second it is promoted to sharded mode and increments land on one of
+``shards`` documents in ``counter_shards`` instead, so no single document
+takes every write.  A background fold moves shard totals back into the
+owning document every ``fold_interval`` seconds, keeping sorts on that field
+close to current; reads add any unfolded shard totals and are cached for
+``read_ttl`` seconds.
+
+Under the multi-worker launcher a ``shared`` counter table replaces both
+modes: increments land in shared memory and one worker flushes them.  An
+increment the table cannot take goes through the modes above instead.
+"""
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Tuple
+
+from pymongo import ASCENDING, ReturnDocument
+
+from shared_counters import CounterUnavailable
+
+logger = logging.getLogger(__name__)
+
+CounterKey = Tuple[str, Any, str]
+
+
+@dataclass
+class CounterState:
+    window_start: float
+    window_count: int = 0
+    rate: float = 0.0
+    sharded: bool = False
+    cached_value: int = 0
+    cached_until: float = 0.0
+
+
+class CounterService:
+    def __init__(
+        self,
+        db,
+        shards: int = 16,
+        promote_rate: float = 50.0,
+        read_ttl: float = 1.0,
+        fold_interval: float = 5.0,
+        shared=None,
+    ):
+        self.db = db
+        self.shared = shared
+        self.shards = shards
+        self.promote_rate = promote_rate
+        self.read_ttl = read_ttl
+        self.fold_interval = fold_interval
+        self._counters: Dict[CounterKey, CounterState] = {}
+        self.promotions = 0
+        self.demotions = 0
+        self.folds = 0
+        self.shared_fallbacks = 0
+
+    @staticmethod
+    def _name(key: CounterKey) -> str:
+        collection, doc_id, field = key
+        return f"{collection}:{doc_id}:{field}"
+
+    def _state(self, key: CounterKey) -> CounterState:
+        state = self._counters.get(key)
+        if state is None:
+            state = self._counters[key] = CounterState(window_start=time.monotonic())
+        return state
+
+    def _observe(self, key: CounterKey, state: CounterState, amount: int):
+        now = time.monotonic()
+        elapsed = now - state.window_start
+        state.window_count += amount
+        if elapsed >= 1.0:
+            state.rate = state.window_count / elapsed
+            state.window_start = now
+            state.window_count = 0
+        elif state.window_count > state.rate:
+            # A burst inside the current second shows up before the window closes
+            state.rate = state.window_count
+        if not state.sharded and state.rate >= self.promote_rate:
+            state.sharded = True
+            self.promotions += 1
+            logger.info("Counter %s promoted to sharded mode (%.0f/s)", self._name(key), state.rate)
+
+    async def ensure_indexes(self):
+        await self.db.counter_shards.create_index([("counter", ASCENDING)])
+
+    async def incr(self, collection: str, doc_id: Any, field: str, amount: int = 1):
+        """Increment a counter.
+
+        Returns the new value, or ``None`` if the owning document does not
+        exist.  In sharded mode the value is read through the short cache.
+        """
+        key = (collection, doc_id, field)
+        if self.shared is not None:
+            try:
+                total, seeded = self.shared.incr(self._name(key), amount)
+            except CounterUnavailable as exc:
+                logger.warning("Counter %s bypasses the shared table: %s", self._name(key), exc)
+                self.shared_fallbacks += 1
+            else:
+                if seeded:
+                    return total
+                # Until its first flush the slot only holds this run's increments
+                return await self.read(collection, doc_id, field) + total
+
+        state = self._state(key)
+        self._observe(key, state, amount)
+
+        if not state.sharded:
+            doc = await self.db[collection].find_one_and_update(
+                {"_id": doc_id},
+                {"$inc": {field: amount}},
+                projection={field: 1},
+                return_document=ReturnDocument.AFTER,
+            )
+            if doc is None:
+                return None
+            state.cached_value = doc.get(field, 0)
+            state.cached_until = time.monotonic() + self.read_ttl
+            return state.cached_value
+
+        shard = random.randrange(self.shards)
+        name = self._name(key)
+        await self.db.counter_shards.update_one(
+            {"_id": f"{name}:{shard}"},
+            {
+                "$inc": {"n": amount},
+                "$setOnInsert": {"counter": name, "collection": collection, "doc_id": doc_id, "field": field},
+            },
+            upsert=True,
+        )
+        state.cached_value += amount
+        return await self.read(collection, doc_id, field)
+
+    async def read(self, collection: str, doc_id: Any, field: str) -> int:
+        key = (collection, doc_id, field)
+        state = self._state(key)
+        now = time.monotonic()
+        if state.cached_until > now:
+            return state.cached_value
+
+        doc = await self.db[collection].find_one({"_id": doc_id}, {field: 1})
+        value = doc.get(field, 0) if doc else 0
+        async for shard in self.db.counter_shards.find({"counter": self._name(key)}, {"n": 1}):
+            value += shard.get("n", 0)
+        state.cached_value = value
+        state.cached_until = now + self.read_ttl
+        return value
+
+    async def fold(self) -> int:
+        """Move shard totals into their owning documents; returns shards folded."""
+        folded = 0
+        async for shard in self.db.counter_shards.find({"n": {"$ne": 0}}):
+            # Zero the shard first: a crash between the two writes undercounts
+            # briefly instead of double counting.
+            previous = await self.db.counter_shards.find_one_and_update(
+                {"_id": shard["_id"]}, {"$set": {"n": 0}}, projection={"n": 1}
+            )
+            amount = previous.get("n", 0) if previous else 0
+            if amount:
+                await self.db[shard["collection"]].update_one(
+                    {"_id": shard["doc_id"]}, {"$inc": {shard["field"]: amount}}
+                )
+                folded += 1
+        self.folds += 1
+        return folded
+
+    def _demote_cold(self):
+        now = time.monotonic()
+        for key, state in list(self._counters.items()):
+            if now - state.window_start >= 1.0:
+                state.rate = state.window_count / (now - state.window_start)
+                state.window_start = now
+                state.window_count = 0
+            if state.sharded and state.rate < self.promote_rate / 2:
+                state.sharded = False
+                self.demotions += 1
+            elif not state.sharded and state.rate == 0 and state.cached_until <= now:
+                del self._counters[key]
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.fold_interval)
+            try:
+                await self.fold()
+                self._demote_cold()
+            except Exception:
+                logger.exception("Counter fold failed")
+
+    def stats(self) -> Dict[str, Any]:
+        hot = [
+            {"counter": self._name(key), "rate": round(state.rate, 1)}
+            for key, state in self._counters.items()
+            if state.sharded
+        ]
+        return {
+            "tracked": len(self._counters),
+            "sharded": hot,
+            "shards": self.shards,
+            "promote_rate": self.promote_rate,
+            "promotions": self.promotions,
+            "demotions": self.demotions,
+            "folds": self.folds,
+            "shared_fallbacks": self.shared_fallbacks,
+        }
@@ -0,0 +1,238 @@
+"""Mongo client configuration and lifecycle.
+
+Pool sizing, timeouts and the read preference used by read-heavy routes all
+come from the environment.  ``Database.connect`` pre-warms the pool with
+concurrent pings so the first requests after a deploy do not pay for
+connection setup, and ``PoolStats`` tracks checkouts through pymongo's
+connection pool monitoring.
+
+``use_client`` hands ``Database.from_env`` a ready-made client instead (the
+in-process bench passes a mongomock one through ``create_app``); it must be
+called before ``core`` is imported.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReadPreference, monitoring
+from pymongo.errors import PyMongoError
+
+from metrics import mongo_commands, mongo_failures
+
+logger = logging.getLogger(__name__)
+
+READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+
+
+@dataclass
+class DatabaseSettings:
+    url: str
+    name: str
+    max_pool_size: int = 100
+    min_pool_size: int = 10
+    max_idle_time_ms: int = 300_000
+    wait_queue_timeout_ms: int = 2_000
+    server_selection_timeout_ms: int = 5_000
+    connect_timeout_ms: int = 5_000
+    read_preference: str = "primary"
+    prewarm_connections: int = 10
+    connect_retries: int = 5
+
+    @classmethod
+    def from_env(cls) -> "DatabaseSettings":
+        env = os.environ
+        return cls(
+            url=env["MONGO_URL"],
+            name=env["DB_NAME"],
+            max_pool_size=int(env.get("MONGO_MAX_POOL_SIZE", "100")),
+            min_pool_size=int(env.get("MONGO_MIN_POOL_SIZE", "10")),
+            max_idle_time_ms=int(env.get("MONGO_MAX_IDLE_TIME_MS", "300000")),
+            wait_queue_timeout_ms=int(env.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", "2000")),
+            server_selection_timeout_ms=int(env.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000")),
+            connect_timeout_ms=int(env.get("MONGO_CONNECT_TIMEOUT_MS", "5000")),
+            read_preference=env.get("MONGO_READ_PREFERENCE", "primary"),
+            prewarm_connections=int(env.get("MONGO_PREWARM_CONNECTIONS", "10")),
+            connect_retries=int(env.get("MONGO_CONNECT_RETRIES", "5")),
+        )
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Connection pool counters, fed from pymongo's driver threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.open = 0
+        self.in_use = 0
+        self.waiting = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.checkout_ms_total = 0.0
+        self.checkout_ms_max = 0.0
+
+    def connection_check_out_started(self, event):
+        # Start and finish of a checkout happen on the same driver thread
+        self._local.started = time.perf_counter()
+        with self._lock:
+            self.waiting += 1
+
+    def connection_checked_out(self, event):
+        elapsed = (time.perf_counter() - getattr(self._local, "started", time.perf_counter())) * 1000
+        with self._lock:
+            self.waiting -= 1
+            self.in_use += 1
+            self.checkouts += 1
+            self.checkout_ms_total += elapsed
+            self.checkout_ms_max = max(self.checkout_ms_max, elapsed)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.waiting -= 1
+            self.checkout_failures += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use -= 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open -= 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "open": self.open,
+                "in_use": self.in_use,
+                "waiting": self.waiting,
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "checkout_ms_avg": round(self.checkout_ms_total / self.checkouts, 3) if self.checkouts else 0.0,
+                "checkout_ms_max": round(self.checkout_ms_max, 3),
+            }
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Times every driver command into the ``metrics`` registry."""
+
+    def __init__(self):
+        self._collections: Dict[int, str] = {}
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        self._collections[event.request_id] = target if isinstance(target, str) else ""
+
+    def succeeded(self, event):
+        collection = self._collections.pop(event.request_id, "")
+        mongo_commands.observe(event.command_name, collection, value=event.duration_micros / 1e6)
+
+    def failed(self, event):
+        collection = self._collections.pop(event.request_id, "")
+        mongo_commands.observe(event.command_name, collection, value=event.duration_micros / 1e6)
+        mongo_failures.inc(event.command_name, collection)
+
+
+_client_override: Dict[str, Any] = {"client": None}
+
+
+def use_client(client: Any):
+    """Make ``Database.from_env`` use ``client`` rather than connect to ``MONGO_URL``."""
+    _client_override["client"] = client
+
+
+class Database:
+    def __init__(self, settings: DatabaseSettings, listeners=(), client: Any = None):
+        self.settings = settings
+        self.pool_stats = PoolStats()
+        # A client passed in is used as is; pool stats stay at zero
+        self.client = client or AsyncIOMotorClient(
+            settings.url,
+            maxPoolSize=settings.max_pool_size,
+            minPoolSize=settings.min_pool_size,
+            maxIdleTimeMS=settings.max_idle_time_ms,
+            waitQueueTimeoutMS=settings.wait_queue_timeout_ms,
+            serverSelectionTimeoutMS=settings.server_selection_timeout_ms,
+            connectTimeoutMS=settings.connect_timeout_ms,
+            event_listeners=[self.pool_stats, *listeners],
+        )
+        self.db = self.client[settings.name]
+        # Read-heavy routes can tolerate secondary reads
+        self.read_db = self.client.get_database(
+            settings.name, read_preference=READ_PREFERENCES[settings.read_preference]
+        )
+        self.ready = False
+        self.connect_ms = 0.0
+
+    @classmethod
+    def from_env(cls, listeners=()) -> "Database":
+        return cls(DatabaseSettings.from_env(), listeners, client=_client_override["client"])
+
+    async def connect(self):
+        """Wait for the server and open ``prewarm_connections`` pooled sockets."""
+        started = time.perf_counter()
+        delay = 0.5
+        for attempt in range(1, self.settings.connect_retries + 1):
+            try:
+                await self.db.command("ping")
+                break
+            except PyMongoError as e:
+                if attempt == self.settings.connect_retries:
+                    raise
+                logger.warning("MongoDB not reachable (attempt %d): %s; retrying in %.1fs", attempt, e, delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 10)
+
+        warm = min(self.settings.prewarm_connections, self.settings.max_pool_size)
+        if warm > 1:
+            await asyncio.gather(*(self.db.command("ping") for _ in range(warm)))
+        self.connect_ms = round((time.perf_counter() - started) * 1000, 3)
+        self.ready = True
+        logger.info("MongoDB ready in %.0f ms with %d pooled connections", self.connect_ms, self.pool_stats.open)
+
+    def close(self):
+        self.ready = False
+        self.client.close()
+
+    def stats(self) -> Dict[str, Any]:
+        s = self.settings
+        return {
+            "status": "connected" if self.ready else "disconnected",
+            "connect_ms": self.connect_ms,
+            "pool": self.pool_stats.snapshot(),
+            "config": {
+                "max_pool_size": s.max_pool_size,
+                "min_pool_size": s.min_pool_size,
+                "wait_queue_timeout_ms": s.wait_queue_timeout_ms,
+                "server_selection_timeout_ms": s.server_selection_timeout_ms,
+                "read_preference": s.read_preference,
+            },
+        }
@@ -0,0 +1,173 @@
+"""Streaming NDJSON/CSV exports.
+
+Each export walks a Motor cursor in index order with a tuned batch size and
+yields one encoded chunk per batch, so memory stays bounded by the batch
+regardless of collection size and a slow client simply pauses the cursor.
+Exports can be limited to a ``timestamp``/``createdAt`` range and resumed
+after the last row a previous (interrupted) export delivered.
+
+Most collections are walked in ``_id`` order and resumed from an ``_id``.
+Time-series collections have no ``_id`` index, so those are walked in
+``(timestamp, _id)`` order and resumed from ``"<timestamp>,<_id>"`` taken
+from the last row.
+"""
+import csv
+import io
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ASCENDING
+
+import fast_json
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+@dataclass(frozen=True)
+class ExportSpec:
+    collection: str
+    time_field: str
+    # Column order for CSV; NDJSON rows carry the same fields
+    fields: Tuple[str, ...]
+    # Walk (order_field, _id) instead of _id, for collections without an _id index
+    order_field: Optional[str] = None
+
+
+EXPORTS: Dict[str, ExportSpec] = {
+    # Heartbeats keep the id StatusCheck gives them alongside the driver's _id
+    "status": ExportSpec("heartbeats", "timestamp", ("_id", "id", "client_name", "timestamp"), order_field="timestamp"),
+    "votes": ExportSpec("votes", "createdAt", ("_id", "outfitId", "fanId", "reaction", "createdAt")),
+    # Fans are exported without their email, as on /api/fans
+    "fans": ExportSpec("fans", "createdAt", ("_id", "username", "points", "isTopFan", "createdAt", "updatedAt")),
+    "questions": ExportSpec("questions", "createdAt", ("_id", "fanName", "text", "answer", "createdAt")),
+}
+
+
+class InvalidResumeToken(ValueError):
+    pass
+
+
+def _parse_id(value: str) -> Any:
+    try:
+        return ObjectId(value)
+    except (InvalidId, TypeError):
+        return value
+
+
+def parse_after(spec: ExportSpec, after: Optional[str]) -> Any:
+    """Resume token: the ``_id`` of the last exported row, or ``(value, _id)`` for ordered specs."""
+    if not after:
+        return None
+    if spec.order_field is None:
+        return _parse_id(after)
+    value, sep, last_id = after.rpartition(",")
+    try:
+        return datetime.fromisoformat(value), _parse_id(last_id)
+    except ValueError as e:
+        raise InvalidResumeToken(f"Expected after=<{spec.order_field}>,<_id> from the last row") from e
+
+
+def build_query(spec: ExportSpec, since: Optional[datetime], until: Optional[datetime], after: Any) -> Dict[str, Any]:
+    query: Dict[str, Any] = {}
+    window = {}
+    if since is not None:
+        window["$gte"] = since
+    if until is not None:
+        window["$lt"] = until
+    if window:
+        query[spec.time_field] = window
+    if after is None:
+        return query
+    if spec.order_field is None:
+        query["_id"] = {"$gt": after}
+        return query
+    value, last_id = after
+    resume = {"$or": [
+        {spec.order_field: {"$gt": value}},
+        {spec.order_field: value, "_id": {"$gt": last_id}},
+    ]}
+    return {"$and": [query, resume]} if query else resume
+
+
+def _csv_value(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str, ensure_ascii=False)
+    return value
+
+
+class Exporter:
+    def __init__(self, db, batch_size: int = 1000):
+        self.db = db
+        self.batch_size = batch_size
+        self.active = 0
+        self.rows_exported = 0
+
+    async def stream(
+        self,
+        name: str,
+        fmt: str,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        after: Optional[str] = None,
+        limit: int = 0,
+    ) -> AsyncIterator[bytes]:
+        spec = EXPORTS[name]
+        projection = {field: 1 for field in spec.fields}
+        order = [(spec.order_field, ASCENDING), ("_id", ASCENDING)] if spec.order_field else [("_id", ASCENDING)]
+        cursor = self.db[spec.collection].find(
+            build_query(spec, since, until, parse_after(spec, after)), projection
+        ).sort(order).batch_size(self.batch_size)
+        if limit:
+            cursor = cursor.limit(limit)
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer) if fmt == "csv" else None
+        if writer is not None:
+            writer.writerow(spec.fields)
+
+        self.active += 1
+        try:
+            batch: List[bytes] = []
+            rows = 0
+            async for doc in cursor:
+                if writer is not None:
+                    writer.writerow([_csv_value(doc.get(field)) for field in spec.fields])
+                else:
+                    batch.append(fast_json.dumps({field: doc.get(field) for field in spec.fields}))
+                rows += 1
+                self.rows_exported += 1
+                # One chunk per cursor batch: the next getMore only runs once
+                # the client has taken this one
+                if rows % self.batch_size == 0:
+                    yield self._drain(buffer, batch)
+                    batch = []
+            tail = self._drain(buffer, batch)
+            if tail:
+                yield tail
+        finally:
+            self.active -= 1
+
+    @staticmethod
+    def _drain(buffer: io.StringIO, batch: List[bytes]) -> bytes:
+        if batch:
+            return b"\n".join(batch) + b"\n"
+        chunk = buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+        return chunk
+
+    def stats(self) -> Dict[str, Any]:
+        return {"active": self.active, "rows_exported": self.rows_exported, "batch_size": self.batch_size}
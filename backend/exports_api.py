@@ -0,0 +1,44 @@
+"""Admin exports: ``/api/export``."""
+import os
+from datetime import datetime
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from starlette.responses import StreamingResponse
+
+from admission import require_admin
+from core import read_db
+from exports import EXPORT_FORMATS, EXPORTS, Exporter, InvalidResumeToken, parse_after
+from fast_json import FastJSONResponse
+
+# Admin exports stream straight from the cursor instead of to_list()
+exporter = Exporter(read_db, batch_size=int(os.environ.get('EXPORT_BATCH_SIZE', '1000')))
+
+router = APIRouter(prefix="/api", default_response_class=FastJSONResponse, dependencies=[Depends(require_admin)])
+
+@router.get("/export/{name}")
+async def export_collection(
+    name: Literal[tuple(EXPORTS)],
+    format: Literal[tuple(EXPORT_FORMATS)] = 'ndjson',
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    after: Optional[str] = Query(None, description="Resume after this _id (status: <timestamp>,<_id>)"),
+    limit: int = Query(0, ge=0),
+):
+    if since and until and since >= until:
+        raise HTTPException(status_code=400, detail="since must be earlier than until")
+    try:
+        # Checked before the response starts; the stream parses it again
+        parse_after(EXPORTS[name], after)
+    except InvalidResumeToken as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    filename = f"{name}-{datetime.utcnow():%Y%m%dT%H%M%S}.{format}"
+    return StreamingResponse(
+        exporter.stream(name, format, since=since, until=until, after=after, limit=limit),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "Cache-Control": "no-store"},
+    )
+
+@router.get("/export")
+async def get_export_stats():
+    return {"exports": sorted(EXPORTS), "formats": sorted(EXPORT_FORMATS), **exporter.stats()}
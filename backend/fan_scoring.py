@@ -0,0 +1,415 @@
+"""Fan points and the top-fan leaderboard.
+
+``FanScoring`` takes every batch of written votes from the vote ingestor,
+turns it into points with the configured ``ScoringRules`` (points per
+reaction, an optional daily cap per fan, optional decay) and applies them
+as one batched ``$inc`` per batch, inside the flush so a vote is only
+acknowledged once its points are written.  Increments from a failed write
+are kept and retried with the next batch.  The highest-ranked fans are kept in a
+bounded top-K set, so ``GET /api/fans/top`` never sorts the collection.
+
+Decay uses forward decay: a vote on day ``d`` is stored as
+``points * 2 ** ((d - epoch) / half_life)`` in ``score``.  Every fan's score
+shrinks by the same factor as time passes, so ranking by the stored value
+equals ranking by the decayed one and nothing needs rescanning; the current
+decayed value is ``score * 2 ** (-(now - epoch) / half_life)``.  Without
+decay fans are ranked by their lifetime ``points``.
+
+The weights grow without bound, so ``ScoringRules`` refuses a half-life
+that would overflow a float within ``SCORE_HORIZON_DAYS``.  Short half-lives
+need the epoch (``FAN_SCORE_EPOCH``) moved forward now and then, followed by
+a ``rebuild``, which recomputes every score against the new epoch.
+
+``rebuild`` recomputes every fan's points and score from the raw ``votes``
+collection in chunks, vectorised with pandas, keeping points scored while
+it runs.
+"""
+import asyncio
+import contextlib
+import heapq
+import logging
+import os
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import DESCENDING, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from vote_analytics import REACTIONS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EPOCH = datetime(2024, 1, 1)
+# A configured half-life must keep weights finite this long; 2 ** 1024 overflows
+SCORE_HORIZON_DAYS = 5 * 365
+MAX_DOUBLINGS = 1000
+TOP_FAN_POINTS = 100
+
+
+@dataclass(frozen=True)
+class ScoringRules:
+    # Keyed by reaction emoji; reactions not listed earn ``default_points``
+    reaction_points: Dict[str, int] = field(default_factory=dict)
+    default_points: int = 10
+    # Most points one fan can earn per UTC day; 0 means no cap
+    daily_cap: int = 0
+    # Half-life of a vote's weight in the ranking; 0 disables decay
+    half_life_days: float = 0.0
+    # Day weights are measured from; see the module docstring
+    epoch: datetime = DEFAULT_EPOCH
+
+    def __post_init__(self):
+        if self.half_life_days < 0:
+            raise ValueError("FAN_SCORE_HALF_LIFE_DAYS must not be negative")
+        if not self.half_life_days:
+            return
+        days = (datetime.utcnow() - self.epoch).total_seconds() / 86400 + SCORE_HORIZON_DAYS
+        if days / self.half_life_days > MAX_DOUBLINGS:
+            raise ValueError(
+                f"FAN_SCORE_HALF_LIFE_DAYS={self.half_life_days:g} overflows score weights within "
+                f"{SCORE_HORIZON_DAYS} days of an epoch of {self.epoch:%Y-%m-%d}; use a half-life of at "
+                f"least {days / MAX_DOUBLINGS:.1f} days or move FAN_SCORE_EPOCH forward and rebuild"
+            )
+
+    @classmethod
+    def from_env(cls) -> "ScoringRules":
+        env = os.environ
+        return cls(
+            reaction_points={
+                emoji: int(env[f"FAN_POINTS_{name.upper()}"])
+                for emoji, name in REACTIONS.items()
+                if f"FAN_POINTS_{name.upper()}" in env
+            },
+            default_points=int(env.get("FAN_POINTS_PER_VOTE", "10")),
+            daily_cap=int(env.get("FAN_DAILY_POINTS_CAP", "0")),
+            half_life_days=float(env.get("FAN_SCORE_HALF_LIFE_DAYS", "0")),
+            epoch=datetime.fromisoformat(env.get("FAN_SCORE_EPOCH", DEFAULT_EPOCH.date().isoformat())),
+        )
+
+    def points(self, reaction: str) -> int:
+        return self.reaction_points.get(reaction, self.default_points)
+
+    def weight(self, day: datetime) -> float:
+        if not self.half_life_days:
+            return 1.0
+        return 2.0 ** ((day - self.epoch).total_seconds() / 86400 / self.half_life_days)
+
+    @property
+    def rank_field(self) -> str:
+        return "score" if self.half_life_days else "points"
+
+
+def _day(moment: datetime) -> datetime:
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class FanScoring:
+    def __init__(self, db, rules: Optional[ScoringRules] = None, top_k: int = 100, refresh_interval: float = 60):
+        self.db = db
+        self.rules = rules or ScoringRules()
+        self.top_k = top_k
+        self.refresh_interval = refresh_interval
+        # Points already awarded today, per fan, for the daily cap
+        self._today: Optional[datetime] = None
+        self._awarded: Dict[Any, int] = defaultdict(int)
+        # Top-K fans by rank value; the heap holds (value, key) with stale entries skipped lazily
+        self._top: Dict[str, Dict[str, Any]] = {}
+        self._heap: List[Tuple[float, str]] = []
+        # Increments whose write failed, retried with the next batch or by the refresh loop
+        self._unwritten: Dict[Any, Tuple[int, float]] = {}
+        # Increments written while a rebuild runs; its ``$set``s add them back
+        self._live: Optional[Dict[Any, Tuple[int, float]]] = None
+        self._listeners = []
+        self.batches = 0
+        self.points_awarded = 0
+        self.points_capped = 0
+        self.rebuild_running = False
+        self.last_rebuild: Optional[Dict[str, Any]] = None
+
+    def add_listener(self, callback):
+        """Call ``callback()`` after every batch of score updates is written."""
+        self._listeners.append(callback)
+
+    async def ensure_indexes(self):
+        if self.rules.rank_field == "score":
+            await self.db.fans.create_index([("score", DESCENDING)])
+
+    async def load(self):
+        """Reload the top-K set and today's awarded points for the daily cap."""
+        rank = self.rules.rank_field
+        docs = await self.db.fans.find({}, {"email": 0}).sort(rank, DESCENDING).limit(self.top_k).to_list(self.top_k)
+        self._top = {}
+        self._heap = []
+        for doc in docs:
+            self._offer(doc)
+        if self.rules.daily_cap:
+            await self._load_awarded()
+
+    async def _load_awarded(self):
+        today = _day(datetime.utcnow())
+        awarded: Dict[Any, int] = defaultdict(int)
+        cursor = self.db.votes.find(
+            {"createdAt": {"$gte": today}, "fanId": {"$ne": None}}, {"fanId": 1, "reaction": 1, "_id": 0}
+        )
+        async for vote in cursor:
+            fan_id = vote["fanId"]
+            awarded[fan_id] = min(self.rules.daily_cap, awarded[fan_id] + self.rules.points(vote.get("reaction")))
+        self._today = today
+        self._awarded = awarded
+
+    def _rank_value(self, doc: Dict[str, Any]) -> float:
+        return doc.get(self.rules.rank_field) or 0
+
+    def _offer(self, doc: Dict[str, Any]):
+        key = str(doc["_id"])
+        value = self._rank_value(doc)
+        current = self._top.get(key)
+        if current is not None:
+            # Scores only grow; an older read landing late must not win
+            if value >= self._rank_value(current):
+                self._top[key] = doc
+                heapq.heappush(self._heap, (value, key))
+            return
+        if len(self._top) >= self.top_k:
+            self._drop_stale()
+            if not self._heap or value <= self._heap[0][0]:
+                return
+            _, evicted = heapq.heappop(self._heap)
+            del self._top[evicted]
+        self._top[key] = doc
+        heapq.heappush(self._heap, (value, key))
+        if len(self._heap) > 4 * self.top_k:
+            self._heap = [(self._rank_value(d), k) for k, d in self._top.items()]
+            heapq.heapify(self._heap)
+
+    def _drop_stale(self):
+        heap = self._heap
+        while heap:
+            value, key = heap[0]
+            doc = self._top.get(key)
+            if doc is not None and self._rank_value(doc) == value:
+                return
+            heapq.heappop(heap)
+
+    def score_votes(self, votes: Iterable[Any]) -> Dict[Any, Tuple[int, float]]:
+        """Points and score increments per fan for a batch, applying the daily cap."""
+        today = _day(datetime.utcnow())
+        if today != self._today:
+            self._today = today
+            self._awarded = defaultdict(int)
+        increments: Dict[Any, List[float]] = defaultdict(lambda: [0, 0.0])
+        for vote in votes:
+            if vote.fan_id is None:
+                continue
+            points = self.rules.points(vote.reaction)
+            day = _day(vote.created_at)
+            if self.rules.daily_cap and day == today:
+                allowed = max(0, self.rules.daily_cap - self._awarded[vote.fan_id])
+                self.points_capped += points - min(points, allowed)
+                points = min(points, allowed)
+                self._awarded[vote.fan_id] += points
+            if points:
+                increments[vote.fan_id][0] += points
+                increments[vote.fan_id][1] += points * self.rules.weight(day)
+        return {fan_id: (int(p), s) for fan_id, (p, s) in increments.items()}
+
+    async def record(self, votes: Iterable[Any]):
+        """Vote-ingestor writer: apply a batch's points before its votes are acknowledged."""
+        await self._apply(self.score_votes(votes))
+
+    async def retry(self):
+        """Write increments a failed batch left behind."""
+        if self._unwritten:
+            await self._apply({})
+
+    async def _apply(self, increments: Dict[Any, Tuple[int, float]]):
+        # Carry earlier failures along with this batch
+        for fan_id, (points, score) in self._unwritten.items():
+            p, s = increments.get(fan_id, (0, 0.0))
+            increments[fan_id] = (p + points, s + score)
+        self._unwritten = {}
+        if not increments:
+            return
+        fans = list(increments)
+        ops = []
+        for fan_id in fans:
+            points, score = increments[fan_id]
+            inc = {"points": points}
+            if self.rules.half_life_days:
+                inc["score"] = score
+            ops.append(UpdateOne({"_id": fan_id}, {"$inc": inc}))
+        ops.append(UpdateMany(
+            {"_id": {"$in": fans}, "points": {"$gte": TOP_FAN_POINTS}, "isTopFan": {"$ne": True}},
+            {"$set": {"isTopFan": True}},
+        ))
+        try:
+            await self.db.fans.bulk_write(ops, ordered=True)
+        except BulkWriteError as e:
+            # Ordered: everything before the first error was applied
+            errors = e.details.get("writeErrors") or [{"index": 0}]
+            self._keep_live({fan_id: increments[fan_id] for fan_id in fans[:errors[0]["index"]]})
+            self._keep_unwritten({fan_id: increments[fan_id] for fan_id in fans[errors[0]["index"]:]})
+            raise
+        except Exception:
+            # Retryable writes already retried once; whether it applied is unknown, so points
+            # are kept rather than lost
+            self._keep_unwritten(increments)
+            raise
+        self._keep_live(increments)
+        async for doc in self.db.fans.find({"_id": {"$in": fans}}, {"email": 0}):
+            self._offer(doc)
+        self.batches += 1
+        self.points_awarded += sum(points for points, _ in increments.values())
+        for callback in self._listeners:
+            callback()
+
+    def _keep_unwritten(self, increments: Dict[Any, Tuple[int, float]]):
+        if increments:
+            logger.error("Fan score update failed; %d fans kept for retry", len(increments))
+        for fan_id, (points, score) in increments.items():
+            p, s = self._unwritten.get(fan_id, (0, 0.0))
+            self._unwritten[fan_id] = (p + points, s + score)
+
+    def _keep_live(self, increments: Dict[Any, Tuple[int, float]]):
+        if self._live is None:
+            return
+        for fan_id, (points, score) in increments.items():
+            p, s = self._live.get(fan_id, (0, 0.0))
+            self._live[fan_id] = (p + points, s + score)
+
+    def top(self, limit: int, top_fans_only: bool = True) -> List[Dict[str, Any]]:
+        fans = [doc for doc in self._top.values() if doc.get("isTopFan") or not top_fans_only]
+        fans.sort(key=lambda doc: (-self._rank_value(doc), str(doc["_id"])))
+        return fans[:limit]
+
+    def decayed(self, score: float, now: Optional[datetime] = None) -> float:
+        if not self.rules.half_life_days:
+            return score
+        return score / self.rules.weight(now or datetime.utcnow())
+
+    async def run_refresh_loop(self):
+        # Picks up fans changed outside this process (other workers, admin edits)
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.retry()
+                await self.load()
+            except Exception:
+                logger.exception("Top fan refresh failed")
+
+    async def rebuild(self, pause=None, chunk_size: int = 200_000) -> Dict[str, Any]:
+        """Recompute points, score and isTopFan for every fan that has votes.
+
+        ``pause`` (``VoteIngestor.paused``) holds vote flushes while a cutoff
+        ``_id`` is taken, and again around each batch of ``$set``s.  Votes up
+        to the cutoff are scanned; points ``record`` writes since are tracked
+        and added to the recomputed values, so they are not overwritten.
+        """
+        import numpy as np
+        import pandas as pd
+
+        if self.rebuild_running:
+            raise RuntimeError("Rebuild already running")
+        self.rebuild_running = True
+        started = datetime.utcnow()
+        try:
+            async with pause() if pause is not None else contextlib.nullcontext():
+                # Later votes get larger ids; anything still unwritten is covered by the scan
+                cutoff = ObjectId()
+                self._live = {}
+                self._unwritten = {}
+            frames = []
+            # ObjectIds are grouped by their string form; this maps them back
+            fan_ids: Dict[str, Any] = {}
+            chunk: List[Dict[str, Any]] = []
+            scanned = 0
+            cursor = self.db.votes.find(
+                {"_id": {"$lte": cutoff}, "fanId": {"$ne": None}}, {"fanId": 1, "reaction": 1, "createdAt": 1, "_id": 0}
+            ).batch_size(10_000)
+            async for vote in cursor:
+                chunk.append(vote)
+                if len(chunk) >= chunk_size:
+                    frames.append(self._points_per_day(pd, chunk, fan_ids))
+                    scanned += len(chunk)
+                    chunk = []
+            if chunk:
+                frames.append(self._points_per_day(pd, chunk, fan_ids))
+                scanned += len(chunk)
+
+            fans_written = 0
+            if frames:
+                daily = pd.concat(frames).groupby(level=[0, 1]).sum()
+                if self.rules.daily_cap:
+                    daily = daily.clip(upper=self.rules.daily_cap)
+                days = daily.index.get_level_values(1)
+                if self.rules.half_life_days:
+                    exponents = (days - pd.Timestamp(self.rules.epoch)).total_seconds() / 86400 / self.rules.half_life_days
+                    weights = np.exp2(exponents.to_numpy())
+                else:
+                    weights = np.ones(len(daily))
+                per_fan = pd.DataFrame({"points": daily.to_numpy(), "score": daily.to_numpy() * weights},
+                                       index=daily.index.get_level_values(0)).groupby(level=0).sum()
+                rows = [
+                    (fan_ids.get(fan_key, fan_key), int(row["points"]), float(row["score"]))
+                    for fan_key, row in per_fan.iterrows()
+                ]
+                for i in range(0, len(rows), 5000):
+                    async with pause() if pause is not None else contextlib.nullcontext():
+                        ops = []
+                        for fan_id, points, score in rows[i:i + 5000]:
+                            live_points, live_score = self._live.pop(fan_id, (0, 0.0))
+                            points += live_points
+                            fields = {"points": points, "isTopFan": points >= TOP_FAN_POINTS}
+                            if self.rules.half_life_days:
+                                fields["score"] = score + live_score
+                            ops.append(UpdateOne({"_id": fan_id}, {"$set": fields}))
+                        await self.db.fans.bulk_write(ops, ordered=False)
+                fans_written = len(rows)
+
+            await self.load()
+            self.last_rebuild = {
+                "votes_scanned": scanned,
+                "fans_written": fans_written,
+                "seconds": round((datetime.utcnow() - started).total_seconds(), 3),
+            }
+            logger.info("Fan score rebuild: %s", self.last_rebuild)
+            return self.last_rebuild
+        finally:
+            self._live = None
+            self.rebuild_running = False
+
+    def _points_per_day(self, pd, chunk: List[Dict[str, Any]], fan_ids: Dict[str, Any]):
+        frame = pd.DataFrame.from_records(chunk, columns=["fanId", "reaction", "createdAt"])
+        keys = frame["fanId"].astype(str)
+        for key, value in zip(keys.unique(), frame["fanId"].loc[~keys.duplicated()]):
+            fan_ids.setdefault(key, value)
+        points = frame["reaction"].map(self.rules.reaction_points).fillna(self.rules.default_points)
+        frame = pd.DataFrame({
+            "fanId": keys,
+            "day": pd.to_datetime(frame["createdAt"]).dt.floor("D"),
+            "points": points.astype("int64"),
+        })
+        return frame.groupby(["fanId", "day"])["points"].sum()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rules": {
+                "reaction_points": self.rules.reaction_points,
+                "default_points": self.rules.default_points,
+                "daily_cap": self.rules.daily_cap,
+                "half_life_days": self.rules.half_life_days,
+                "epoch": self.rules.epoch,
+                "rank_field": self.rules.rank_field,
+            },
+            "top_k": self.top_k,
+            "tracked": len(self._top),
+            "batches": self.batches,
+            "points_awarded": self.points_awarded,
+            "points_capped": self.points_capped,
+            "unwritten_fans": len(self._unwritten),
+            "rebuild_running": self.rebuild_running,
+            "last_rebuild": self.last_rebuild,
+        }
@@ -0,0 +1,380 @@
+"""Heartbeat (status check) ingestion and rollups.
+
+``POST /api/status`` heartbeats are buffered in process and written every
+``flush_interval_ms`` (or once ``max_batch`` are waiting) as one unordered
+``insert_many`` into ``heartbeats``, a MongoDB time-series collection with
+``client_name`` as its meta field and a TTL on the raw points.
+
+The same flush rolls the batch up in memory and ``$inc``s the per-client
+1 minute and 1 hour buckets (``heartbeats_1m``, ``heartbeats_1h``), so the
+rollups are maintained incrementally and never rescan raw data.  Each tier
+has its own TTL, so raw points can be dropped after days while hourly
+counts are kept for a year.  ``heartbeat_clients`` keeps one document per
+client with its first and last heartbeat, which answers "latest per client"
+without touching the raw data.
+
+The buffer is bounded: heartbeats are periodic, so when Mongo cannot keep up
+the oldest buffered points are dropped and counted rather than queued.
+Rollup and client updates that fail after the raw insert are kept and
+retried with the next flush, so the counts catch up with the raw points.
+"""
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from pymongo import ASCENDING, DESCENDING, IndexModel, UpdateOne
+from pymongo.errors import BulkWriteError, CollectionInvalid, OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+RAW = "heartbeats"
+CLIENTS = "heartbeat_clients"
+
+INDEX_OPTIONS_CONFLICT = 85
+
+
+@dataclass(frozen=True)
+class RollupTier:
+    name: str
+    collection: str
+    step: timedelta
+
+    def floor(self, moment: datetime) -> datetime:
+        if self.step >= timedelta(hours=1):
+            return moment.replace(minute=0, second=0, microsecond=0)
+        return moment.replace(second=0, microsecond=0)
+
+
+TIERS: Dict[str, RollupTier] = {
+    "1m": RollupTier("1m", "heartbeats_1m", timedelta(minutes=1)),
+    "1h": RollupTier("1h", "heartbeats_1h", timedelta(hours=1)),
+}
+
+
+@dataclass(frozen=True)
+class Retention:
+    raw_s: int = 2 * 86400
+    minute_s: int = 30 * 86400
+    hour_s: int = 400 * 86400
+
+    def for_tier(self, tier: str) -> int:
+        return self.minute_s if tier == "1m" else self.hour_s
+
+
+@dataclass(frozen=True)
+class _Bucket:
+    """Heartbeats waiting to be added to one rollup bucket or client document."""
+
+    count: int
+    first: datetime
+    last: datetime
+
+    def merge(self, other: "_Bucket") -> "_Bucket":
+        return _Bucket(self.count + other.count, min(self.first, other.first), max(self.last, other.last))
+
+
+def _rollup(batch: List[Dict[str, Any]]) -> Dict[str, Dict[Any, _Bucket]]:
+    """Fold heartbeats into per-bucket and per-client updates, keyed by collection."""
+    moments: Dict[str, Dict[Any, List[datetime]]] = defaultdict(lambda: defaultdict(list))
+    for heartbeat in batch:
+        client, moment = heartbeat["client_name"], heartbeat["timestamp"]
+        moments[CLIENTS][client].append(moment)
+        for tier in TIERS.values():
+            moments[tier.collection][(client, tier.floor(moment))].append(moment)
+    return {
+        collection: {key: _Bucket(len(times), min(times), max(times)) for key, times in keyed.items()}
+        for collection, keyed in moments.items()
+    }
+
+
+def _tier_update(key: Tuple[str, datetime], bucket: _Bucket) -> UpdateOne:
+    client, t = key
+    return UpdateOne(
+        {"_id": {"client": client, "t": t}},
+        {
+            "$setOnInsert": {"client_name": client, "t": t},
+            "$inc": {"count": bucket.count},
+            "$min": {"first": bucket.first},
+            "$max": {"last": bucket.last},
+        },
+        upsert=True,
+    )
+
+
+def _client_update(client: str, bucket: _Bucket) -> UpdateOne:
+    return UpdateOne(
+        {"_id": client},
+        {
+            "$inc": {"count": bucket.count},
+            "$min": {"firstSeen": bucket.first},
+            "$max": {"lastSeen": bucket.last},
+        },
+        upsert=True,
+    )
+
+
+class HeartbeatIngestor:
+    def __init__(
+        self,
+        db,
+        retention: Optional[Retention] = None,
+        flush_interval_ms: int = 1000,
+        max_batch: int = 1000,
+        max_buffer: int = 50_000,
+    ):
+        self.db = db
+        self.retention = retention or Retention()
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_batch = max_batch
+        self.max_buffer = max_buffer
+        self._buffer: List[Dict[str, Any]] = []
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+        self._listeners: List[Callable[[], None]] = []
+        self._unapplied: Dict[str, Dict[Any, _Bucket]] = defaultdict(dict)
+        self.received = 0
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.rollup_failures = 0
+        self.last_flush_ms = 0.0
+
+    def add_listener(self, callback: Callable[[], None]):
+        """Call ``callback()`` after every batch is written."""
+        self._listeners.append(callback)
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._buffer)
+
+    async def ensure_collections(self):
+        """Create the time-series collection and every index, applying the TTLs.
+
+        Where time-series collections are not supported, ``heartbeats`` is a
+        regular collection with a TTL index on ``timestamp`` instead.
+        """
+        existing = set(await self.db.list_collection_names())
+        if RAW not in existing:
+            try:
+                await self.db.create_collection(
+                    RAW,
+                    timeseries={"timeField": "timestamp", "metaField": "client_name", "granularity": "seconds"},
+                    expireAfterSeconds=self.retention.raw_s,
+                )
+            except CollectionInvalid:
+                # Another worker created it first
+                pass
+            except (OperationFailure, NotImplementedError) as e:
+                logger.warning("Time-series collections unavailable, storing %s as a regular collection: %s", RAW, e)
+                await self._ensure_ttl(RAW, "timestamp", self.retention.raw_s)
+        else:
+            try:
+                await self.db.command("collMod", RAW, expireAfterSeconds=self.retention.raw_s)
+            except OperationFailure:
+                # Not a time-series collection: the TTL lives on an index
+                await self._ensure_ttl(RAW, "timestamp", self.retention.raw_s)
+            except PyMongoError as e:
+                logger.warning("Could not update the %s TTL: %s", RAW, e)
+        await self.db[RAW].create_index([("client_name", ASCENDING), ("timestamp", DESCENDING)])
+        # GET /api/status pages and the status export walk (timestamp, _id)
+        try:
+            await self.db[RAW].create_index([("timestamp", DESCENDING), ("_id", DESCENDING)], name="timestamp_id")
+        except OperationFailure as e:
+            # Servers before 6.0 only index the time and meta fields of a time-series collection
+            logger.warning("Falling back to a timestamp-only index on %s: %s", RAW, e)
+            await self.db[RAW].create_index([("timestamp", DESCENDING)], name="timestamp")
+        for name, tier in TIERS.items():
+            await self.db[tier.collection].create_index([("client_name", ASCENDING), ("t", ASCENDING)])
+            await self._ensure_ttl(tier.collection, "t", self.retention.for_tier(name))
+        await self.db[CLIENTS].create_indexes([IndexModel([("lastSeen", DESCENDING)], name="lastSeen")])
+
+    async def _ensure_ttl(self, collection: str, field: str, ttl: int):
+        name = f"{field}_ttl"
+        try:
+            await self.db[collection].create_index([(field, ASCENDING)], name=name, expireAfterSeconds=ttl)
+        except OperationFailure as e:
+            if e.code != INDEX_OPTIONS_CONFLICT:
+                raise
+            await self.db.command("collMod", collection, index={"name": name, "expireAfterSeconds": ttl})
+
+    def start(self):
+        if self._task is None:
+            self._closed = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._closed = True
+        if self._task is not None:
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+        if self._unapplied:
+            logger.error("Heartbeat rollups left short by %d updates on shutdown", self.unapplied_rollups)
+
+    def record(self, heartbeat: Dict[str, Any]):
+        """Buffer one heartbeat (``client_name``, ``timestamp`` and any extra fields)."""
+        if self._closed:
+            raise RuntimeError("Heartbeat ingestor is shut down")
+        self.received += 1
+        self._buffer.append(heartbeat)
+        overflow = len(self._buffer) - self.max_buffer
+        if overflow > 0:
+            del self._buffer[:overflow]
+            self.dropped += overflow
+        if len(self._buffer) >= self.max_batch:
+            self._wakeup.set()
+
+    async def _run(self):
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Heartbeat flush loop error")
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._buffer and self._unapplied:
+                # Batches carry earlier failed rollup updates along; quiet flushes retry them alone
+                await self._apply_rollups({})
+            while self._buffer:
+                batch = self._buffer[: self.max_batch]
+                del self._buffer[: self.max_batch]
+                started = time.perf_counter()
+                try:
+                    inserted = await self._insert(batch)
+                except Exception:
+                    logger.exception("Failed to flush %d heartbeats", len(batch))
+                    self.failed_flushes += 1
+                    self.dropped += len(batch)
+                    return
+                await self._apply_rollups(_rollup(inserted))
+                self.flushes += 1
+                self.written += len(inserted)
+                self.dropped += len(batch) - len(inserted)
+                self.last_flush_ms = round((time.perf_counter() - started) * 1000, 3)
+                for callback in self._listeners:
+                    callback()
+
+    async def _insert(self, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Insert the raw points and return the ones that were written."""
+        try:
+            await self.db[RAW].insert_many(batch, ordered=False)
+        except BulkWriteError as exc:
+            # Unordered: only the listed documents failed
+            failed = {error["index"] for error in exc.details.get("writeErrors", [])}
+            logger.error("%d of %d heartbeats failed to insert", len(failed), len(batch))
+            return [heartbeat for index, heartbeat in enumerate(batch) if index not in failed]
+        return batch
+
+    async def _apply_rollups(self, updates: Dict[str, Dict[Any, "_Bucket"]]):
+        """Apply rollup and client updates, keeping whatever fails for the next flush.
+
+        Each collection is written on its own, so one failing does not hold back the others.
+        """
+        for collection, buckets in self._unapplied.items():
+            pending = updates.setdefault(collection, {})
+            for key, bucket in buckets.items():
+                pending[key] = pending[key].merge(bucket) if key in pending else bucket
+        self._unapplied.clear()
+        for collection, buckets in updates.items():
+            if not buckets:
+                continue
+            to_update = _client_update if collection == CLIENTS else _tier_update
+            try:
+                await self.db[collection].bulk_write(
+                    [to_update(key, bucket) for key, bucket in buckets.items()],
+                    ordered=False,
+                )
+            except BulkWriteError as exc:
+                failed = {error["index"] for error in exc.details.get("writeErrors", [])}
+                for index, (key, bucket) in enumerate(buckets.items()):
+                    if index in failed:
+                        self._unapplied[collection][key] = bucket
+                self.rollup_failures += 1
+                logger.error("%d %s updates failed; retrying next flush", len(failed), collection)
+            except Exception:
+                self._unapplied[collection].update(buckets)
+                self.rollup_failures += 1
+                logger.exception("%s update failed; retrying next flush", collection)
+
+    @property
+    def unapplied_rollups(self) -> int:
+        return sum(len(buckets) for buckets in self._unapplied.values())
+
+    async def latest(self, limit: int = 500, stale_after_s: float = 300) -> List[Dict[str, Any]]:
+        """Every client's most recent heartbeat, newest first."""
+        cutoff = datetime.utcnow() - timedelta(seconds=stale_after_s)
+        clients = await self.db[CLIENTS].find().sort("lastSeen", DESCENDING).limit(limit).to_list(limit)
+        return [
+            {
+                "client_name": doc["_id"],
+                "lastSeen": doc.get("lastSeen"),
+                "firstSeen": doc.get("firstSeen"),
+                "count": doc.get("count", 0),
+                "stale": doc.get("lastSeen") is None or doc["lastSeen"] < cutoff,
+            }
+            for doc in clients
+        ]
+
+    @staticmethod
+    def pick_tier(since: datetime, until: datetime, max_points: int) -> str:
+        """The finest rollup that keeps ``[since, until)`` within ``max_points`` buckets."""
+        for name, tier in TIERS.items():
+            if (until - since) / tier.step <= max_points:
+                return name
+        return "1h"
+
+    async def series(
+        self,
+        since: datetime,
+        until: datetime,
+        tier: str,
+        client_name: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Heartbeat counts per bucket, for one client or summed over all of them."""
+        collection = self.db[TIERS[tier].collection]
+        query: Dict[str, Any] = {"t": {"$gte": TIERS[tier].floor(since), "$lt": until}}
+        if client_name is not None:
+            query["client_name"] = client_name
+            docs = await collection.find(query, {"_id": 0, "t": 1, "count": 1}).sort("t", ASCENDING).to_list(None)
+            return [{"t": doc["t"], "count": doc["count"]} for doc in docs]
+        pipeline = [
+            {"$match": query},
+            {"$group": {"_id": "$t", "count": {"$sum": "$count"}, "clients": {"$sum": 1}}},
+            {"$sort": {"_id": 1}},
+        ]
+        return [
+            {"t": doc["_id"], "count": doc["count"], "clients": doc["clients"]}
+            async for doc in collection.aggregate(pipeline)
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": len(self._buffer),
+            "received": self.received,
+            "written": self.written,
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "rollup_failures": self.rollup_failures,
+            "unapplied_rollups": self.unapplied_rollups,
+            "last_flush_ms": self.last_flush_ms,
+            "retention_s": {
+                "raw": self.retention.raw_s,
+                "1m": self.retention.minute_s,
+                "1h": self.retention.hour_s,
+            },
+        }
@@ -0,0 +1,57 @@
+"""The home feed and ``/api/batch``, both answered with in-process sub-requests."""
+import os
+from typing import List, Optional
+
+from fastapi import APIRouter, HTTPException, Request
+from pydantic import BaseModel, Field
+
+from batch import SubrequestError, SubrequestRunner
+from fast_json import FastJSONResponse
+
+# Sub-requests go through the app serving the parent request, so sections
+# whose feature is not loaded yet load it like any other request would
+subrequests = SubrequestRunner(
+    max_requests=int(os.environ.get('BATCH_MAX_REQUESTS', '10')),
+    timeout_ms=float(os.environ.get('BATCH_SECTION_TIMEOUT_MS', '1500')),
+)
+
+# Sections the frontend loads on first paint, with the params it uses
+HOME_SECTIONS = {
+    "outfits": "/api/outfits",
+    "questions": "/api/questions",
+    "wallpapers": "/api/wallpapers",
+    "topFans": "/api/fans/top?limit=10",
+    "voteStats": "/api/votes/stats",
+}
+
+router = APIRouter(prefix="/api", default_response_class=FastJSONResponse)
+
+
+class BatchItem(BaseModel):
+    id: str
+    path: str
+
+class BatchCreate(BaseModel):
+    requests: List[BatchItem]
+    timeoutMs: Optional[float] = Field(None, gt=0, le=10000)
+
+@router.get("/home")
+async def get_home(request: Request):
+    sections = await subrequests.run(request, list(HOME_SECTIONS.items()))
+    partial = any(section["status"] >= 400 for section in sections.values())
+    return subrequests.respond(request, {"success": True, "partial": partial, "data": sections})
+
+@router.post("/batch")
+async def run_batch(input: BatchCreate, request: Request):
+    pairs = [(item.id, item.path) for item in input.requests]
+    try:
+        subrequests.validate(pairs)
+    except SubrequestError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    sections = await subrequests.run(request, pairs, input.timeoutMs)
+    partial = any(section["status"] >= 400 for section in sections.values())
+    return subrequests.respond(request, {"success": True, "partial": partial, "data": sections})
+
+@router.get("/batch/stats")
+async def get_batch_stats():
+    return subrequests.stats()
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""Responsive image derivatives in a local content-addressed store.
+
+A source image is stored under the SHA-256 of its bytes:
+``<IMAGE_STORE_PATH>/<digest[:2]>/<digest>/`` holds the original and one
+file per (width, format) derivative, named like ``640w.webp``.  A name is
+never reused for different bytes, so files are served with a year-long
+``immutable`` Cache-Control and an ETag built from the digest, and
+uploading the same image twice is a no-op.
+
+Decoding, resizing and encoding (AVIF especially) are CPU-bound, so they run
+in a ``ProcessPoolExecutor`` rather than on the event loop.  Each image's
+manifest (source size and variants) is saved in the ``images`` collection
+and cached in memory.  List endpoints call ``decorate`` to add ``srcset``
+strings per format and a mid-size ``image`` fallback to every item that has
+an ``imageId``.
+
+Local files can be ingested from the command line:
+
+    python images.py ingest photo.jpg --collection wallpapers --id <wallpaper id>
+"""
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+import re
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import typer
+
+logger = logging.getLogger(__name__)
+
+DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+NAME_RE = re.compile(r"^(original|\d{1,5}w)\.(avif|webp|jpg|png|gif)$")
+
+EXTENSIONS = {"avif": "avif", "webp": "webp", "jpeg": "jpg"}
+MEDIA_TYPES = {"avif": "image/avif", "webp": "image/webp", "jpg": "image/jpeg", "png": "image/png", "gif": "image/gif"}
+SOURCE_EXTENSIONS = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp", "GIF": "gif", "AVIF": "avif"}
+DEFAULT_QUALITY = {"avif": 55, "webp": 75, "jpeg": 80}
+# Most-preferred first: this is the order of <source> elements in a <picture>
+FORMAT_ORDER = ("avif", "webp", "jpeg")
+
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+DEFAULT_MAX_PIXELS = 40_000_000
+
+
+class ImageError(ValueError):
+    pass
+
+
+def _save_options(fmt: str, quality: int) -> Dict[str, Any]:
+    if fmt == "avif":
+        return {"quality": quality, "speed": 6}
+    if fmt == "webp":
+        return {"quality": quality, "method": 4}
+    return {"quality": quality, "optimize": True, "progressive": True}
+
+
+def render(
+    source: str,
+    out_dir: str,
+    widths: Sequence[int],
+    formats: Sequence[str],
+    quality: Dict[str, int],
+    max_pixels: int = DEFAULT_MAX_PIXELS,
+):
+    """Write every derivative of ``source`` into ``out_dir``; runs in a pool worker."""
+    from PIL import Image, ImageOps
+
+    # Pillow refuses to open anything past twice this; the check below covers the rest
+    Image.MAX_IMAGE_PIXELS = max_pixels
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+        opened = Image.open(source)
+    with opened:
+        # Only the header is read so far: reject decompression bombs before decoding
+        if opened.size[0] * opened.size[1] > max_pixels:
+            raise ImageError(f"Image is {opened.size[0]}x{opened.size[1]}; the limit is {max_pixels} pixels")
+        source_format = opened.format
+        image = ImageOps.exif_transpose(opened)
+        width, height = image.size
+        has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+        image = image.convert("RGBA" if has_alpha else "RGB")
+
+    # Never upscale: widths past the source collapse into the source width
+    targets = sorted({w for w in widths if w < width} | {min(width, max(widths))})
+    variants = []
+    for target in targets:
+        target_height = max(1, round(height * target / width))
+        resized = image if target == width else image.resize(
+            (target, target_height), Image.Resampling.LANCZOS, reducing_gap=3.0
+        )
+        for fmt in formats:
+            frame = resized.convert("RGB") if fmt == "jpeg" and has_alpha else resized
+            path = os.path.join(out_dir, f"{target}w.{EXTENSIONS[fmt]}")
+            tmp = f"{path}.{os.getpid()}.tmp"
+            frame.save(tmp, format=fmt.upper(), **_save_options(fmt, quality[fmt]))
+            os.replace(tmp, path)
+            variants.append({
+                "width": target,
+                "height": target_height,
+                "format": fmt,
+                "name": os.path.basename(path),
+                "bytes": os.path.getsize(path),
+            })
+    return {"format": source_format, "width": width, "height": height, "variants": variants}
+
+
+def supported_formats(requested: Iterable[str]) -> List[str]:
+    from PIL import features
+
+    formats = []
+    for fmt in requested:
+        if fmt not in EXTENSIONS:
+            raise ValueError(f"Unknown image format: {fmt}")
+        if fmt == "jpeg" or features.check(fmt):
+            formats.append(fmt)
+        else:
+            logger.warning("Pillow was built without %s support; skipping those derivatives", fmt)
+    return formats
+
+
+class ImagePipeline:
+    def __init__(
+        self,
+        db,
+        root: Path,
+        widths: Sequence[int] = (320, 640, 1280, 1920),
+        formats: Sequence[str] = FORMAT_ORDER,
+        quality: Optional[Dict[str, int]] = None,
+        max_workers: int = 2,
+        max_bytes: int = 20 * 1024 * 1024,
+        max_pixels: int = DEFAULT_MAX_PIXELS,
+        public_url: str = "",
+    ):
+        self.db = db
+        self.root = root
+        self.widths = sorted(widths)
+        self.requested_formats = [fmt for fmt in FORMAT_ORDER if fmt in formats]
+        self._formats: Optional[List[str]] = None
+        self.quality = {**DEFAULT_QUALITY, **(quality or {})}
+        self.max_workers = max_workers
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.base_url = f"{public_url.rstrip('/')}/api/images"
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._manifests: Dict[str, Dict[str, Any]] = {}
+        self._rendering: Dict[str, asyncio.Future] = {}
+        self.ingested = 0
+        self.deduplicated = 0
+        self.render_ms = 0.0
+
+    @classmethod
+    def from_env(cls, db, root: Path) -> "ImagePipeline":
+        env = os.environ
+        return cls(
+            db,
+            Path(env.get("IMAGE_STORE_PATH", str(root))),
+            widths=[int(w) for w in env.get("IMAGE_WIDTHS", "320,640,1280,1920").split(",")],
+            formats=env.get("IMAGE_FORMATS", "avif,webp,jpeg").split(","),
+            quality={
+                fmt: int(env[f"IMAGE_QUALITY_{fmt.upper()}"])
+                for fmt in FORMAT_ORDER
+                if f"IMAGE_QUALITY_{fmt.upper()}" in env
+            },
+            max_workers=int(env.get("IMAGE_WORKERS", "2")),
+            max_bytes=int(float(env.get("IMAGE_MAX_UPLOAD_MB", "20")) * 1024 * 1024),
+            max_pixels=int(env.get("IMAGE_MAX_PIXELS", str(DEFAULT_MAX_PIXELS))),
+            public_url=env.get("IMAGE_PUBLIC_URL", ""),
+        )
+
+    @property
+    def formats(self) -> List[str]:
+        if self._formats is None:
+            self._formats = supported_formats(self.requested_formats)
+        return self._formats
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Spawned, not forked: the parent holds Mongo client threads and sockets
+            self._executor = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def directory(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest
+
+    def path_for(self, digest: str, name: str) -> Optional[Path]:
+        """On-disk path of a stored file, or ``None`` for names outside the store."""
+        if not DIGEST_RE.match(digest) or not NAME_RE.match(name):
+            return None
+        return self.directory(digest) / name
+
+    def url(self, digest: str, name: str) -> str:
+        return f"{self.base_url}/{digest}/{name}"
+
+    async def load(self):
+        self._manifests = {doc["_id"]: doc async for doc in self.db.images.find({})}
+        logger.info("Image manifests loaded: %d images", len(self._manifests))
+
+    async def manifests(self, digests: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        digests = set(digests)
+        missing = [digest for digest in digests if digest not in self._manifests]
+        if missing:
+            # Images ingested by another worker since this one loaded
+            async for doc in self.db.images.find({"_id": {"$in": missing}}):
+                self._manifests[doc["_id"]] = doc
+        return {digest: self._manifests[digest] for digest in digests if digest in self._manifests}
+
+    async def ingest(self, data: bytes) -> Dict[str, Any]:
+        """Store ``data`` and its derivatives; returns the image manifest."""
+        if len(data) > self.max_bytes:
+            raise ImageError(f"Image is larger than {self.max_bytes // (1024 * 1024)} MB")
+        digest = hashlib.sha256(data).hexdigest()
+        existing = (await self.manifests([digest])).get(digest)
+        if existing is not None:
+            self.deduplicated += 1
+            return existing
+        # Concurrent uploads of the same bytes share one render
+        pending = self._rendering.get(digest)
+        if pending is not None:
+            self.deduplicated += 1
+            return await asyncio.shield(pending)
+        future = self._rendering[digest] = asyncio.get_running_loop().create_future()
+        try:
+            manifest = await self._render(digest, data)
+            future.set_result(manifest)
+            return manifest
+        except Exception as e:
+            future.set_exception(e)
+            # Nobody else may be waiting; don't log "exception never retrieved"
+            future.exception()
+            raise
+        finally:
+            if not future.done():
+                future.cancel()
+            del self._rendering[digest]
+
+    async def _render(self, digest: str, data: bytes) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        directory = self.directory(digest)
+        source = directory / "source.tmp"
+
+        def write_source():
+            directory.mkdir(parents=True, exist_ok=True)
+            source.write_bytes(data)
+
+        await loop.run_in_executor(None, write_source)
+        started = time.perf_counter()
+        try:
+            result = await loop.run_in_executor(
+                self._pool(), render, str(source), str(directory), self.widths, self.formats, self.quality,
+                self.max_pixels,
+            )
+        except Exception as e:
+            await loop.run_in_executor(None, lambda: source.unlink(missing_ok=True))
+            if isinstance(e, ImageError):
+                raise
+            raise ImageError(f"Could not process image: {e}") from e
+        self.render_ms += (time.perf_counter() - started) * 1000
+
+        original = f"original.{SOURCE_EXTENSIONS.get(result['format'], 'jpg')}"
+        await loop.run_in_executor(None, os.replace, source, directory / original)
+        manifest = {
+            "_id": digest,
+            "width": result["width"],
+            "height": result["height"],
+            "original": original,
+            "bytes": len(data),
+            "variants": result["variants"],
+            "createdAt": datetime.utcnow(),
+        }
+        await self.db.images.replace_one({"_id": digest}, manifest, upsert=True)
+        self._manifests[digest] = manifest
+        self.ingested += 1
+        return manifest
+
+    def describe(self, manifest: Dict[str, Any], fallback_width: int = 640) -> Dict[str, Any]:
+        """``srcset`` per format plus a fallback ``src`` for one image."""
+        digest = manifest["_id"]
+        srcset: Dict[str, str] = {}
+        for fmt in FORMAT_ORDER:
+            entries = [v for v in manifest["variants"] if v["format"] == fmt]
+            if entries:
+                srcset[fmt] = ", ".join(f"{self.url(digest, v['name'])} {v['width']}w" for v in entries)
+        fallbacks = [v for v in manifest["variants"] if v["format"] == "jpeg"] or manifest["variants"]
+        fallback = min(fallbacks, key=lambda v: (abs(v["width"] - fallback_width), v["width"]), default=None)
+        return {
+            "src": self.url(digest, fallback["name"]) if fallback else self.original_url(manifest),
+            "srcset": srcset,
+            "width": manifest["width"],
+            "height": manifest["height"],
+        }
+
+    def original_url(self, manifest: Dict[str, Any]) -> str:
+        return self.url(manifest["_id"], manifest["original"])
+
+    async def decorate(self, items: List[Dict[str, Any]], key: str = "imageId") -> List[Dict[str, Any]]:
+        """Add ``srcset`` to every item with an ingested image, in place."""
+        await self.manifests(item[key] for item in items if item.get(key))
+        return self.decorate_cached(items, key)
+
+    def decorate_cached(self, items: List[Dict[str, Any]], key: str = "imageId") -> List[Dict[str, Any]]:
+        """``decorate`` from the in-memory manifests only, for synchronous callers."""
+        for item in items:
+            manifest = self._manifests.get(item.get(key)) if item.get(key) else None
+            if manifest is not None:
+                described = self.describe(manifest)
+                item["image"] = described["src"]
+                item["srcset"] = described["srcset"]
+                item["imageSize"] = {"width": described["width"], "height": described["height"]}
+        return items
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "images": len(self._manifests),
+            "ingested": self.ingested,
+            "deduplicated": self.deduplicated,
+            "render_ms": round(self.render_ms, 1),
+            "rendering": len(self._rendering),
+            "widths": self.widths,
+            "formats": self.formats,
+            "workers": self.max_workers,
+            "store": str(self.root),
+        }
+
+
+cli = typer.Typer(add_completion=False)
+
+
+@cli.command()
+def ingest(
+    paths: List[Path] = typer.Argument(..., exists=True, dir_okay=False),
+    collection: Optional[str] = typer.Option(None, help="outfits or wallpapers"),
+    id: Optional[str] = typer.Option(None, help="Document to attach the image to (one path only)"),
+):
+    """Ingest local images into the store and optionally attach one to a document"""
+    from dotenv import load_dotenv
+
+    from database import Database
+    from vote_ingest import as_object_id
+
+    backend = Path(__file__).parent
+    load_dotenv(backend / ".env")
+    if (collection is None) != (id is None) or (id is not None and len(paths) != 1):
+        raise typer.BadParameter("--collection and --id go together, with a single path")
+    if collection not in (None, "outfits", "wallpapers"):
+        raise typer.BadParameter("--collection must be outfits or wallpapers")
+
+    async def run():
+        database = Database.from_env()
+        pipeline = ImagePipeline.from_env(database.db, backend / "data" / "images")
+        try:
+            for path in paths:
+                manifest = await pipeline.ingest(path.read_bytes())
+                typer.echo(f"{path}: {manifest['_id']} ({len(manifest['variants'])} variants)")
+                if collection is not None:
+                    result = await database.db[collection].update_one(
+                        {"_id": as_object_id(id)}, {"$set": {"imageId": manifest["_id"]}}
+                    )
+                    if not result.matched_count:
+                        raise typer.BadParameter(f"No {collection} document with id {id}")
+        finally:
+            pipeline.close()
+            database.close()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    cli()
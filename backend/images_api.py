@@ -0,0 +1,80 @@
+"""Uploaded images and their responsive derivatives: ``/api/images``."""
+import os
+from typing import Callable, List, Literal, Optional
+
+from fastapi import APIRouter, File, Form, HTTPException, Request, Response, UploadFile
+from starlette.responses import FileResponse
+
+from core import ROOT_DIR, db, response_cache
+from fast_json import FastJSONResponse
+from images import CACHE_CONTROL, MEDIA_TYPES, ImageError, ImagePipeline
+from vote_ingest import as_object_id
+
+# Uploaded images are resized into responsive WebP/AVIF derivatives off the event loop
+image_pipeline = ImagePipeline.from_env(db, ROOT_DIR / 'data' / 'images')
+
+# Called with (collection, id, image id) after an upload is attached to a document
+attach_listeners: List[Callable[[str, str, str], None]] = []
+
+router = APIRouter(prefix="/api", default_response_class=FastJSONResponse)
+
+@router.post("/images", status_code=201)
+async def upload_image(
+    file: UploadFile = File(...),
+    collection: Optional[Literal['outfits', 'wallpapers']] = Form(None),
+    id: Optional[str] = Form(None),
+):
+    if (collection is None) != (id is None):
+        raise HTTPException(status_code=400, detail="collection and id must be given together")
+    data = await file.read(image_pipeline.max_bytes + 1)
+    if len(data) > image_pipeline.max_bytes:
+        raise HTTPException(status_code=413, detail="Image is too large")
+    try:
+        manifest = await image_pipeline.ingest(data)
+    except ImageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if collection is not None:
+        result = await db[collection].update_one({"_id": as_object_id(id)}, {"$set": {"imageId": manifest["_id"]}})
+        if not result.matched_count:
+            raise HTTPException(status_code=404, detail=f"{collection[:-1].capitalize()} not found")
+        if collection == "wallpapers":
+            response_cache.invalidate('wallpapers')
+        for callback in attach_listeners:
+            callback(collection, id, manifest["_id"])
+    return {
+        "success": True,
+        "data": {
+            "id": manifest["_id"],
+            "original": image_pipeline.original_url(manifest),
+            **image_pipeline.describe(manifest),
+        },
+    }
+
+@router.get("/images/stats")
+async def get_image_stats():
+    return image_pipeline.stats()
+
+@router.get("/images/{digest}/{name}")
+async def get_image(digest: str, name: str, request: Request):
+    path = image_pipeline.path_for(digest, name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    # Stored files never change, so the name is a strong validator
+    headers = {"Cache-Control": CACHE_CONTROL, "ETag": f'"{digest[:32]}-{name}"'}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    try:
+        stat_result = os.stat(path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Image not found")
+    # Sent with http.response.pathsend where the server supports it
+    return FileResponse(
+        path, headers=headers, media_type=MEDIA_TYPES[name.rsplit(".", 1)[1]], stat_result=stat_result
+    )
+
+async def startup(timer):
+    with timer.phase("manifests"):
+        await image_pipeline.load()
+
+async def shutdown():
+    image_pipeline.close()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Pre-forking launcher that runs the API on every core.
+
+    python launcher.py --workers 4 --port 8001
+
+The launcher creates the shared counter table and the listening socket, then
+forks the uvicorn workers, which inherit both.  Worker 0 is the one that
+flushes the shared counters to Mongo.  Workers that die are replaced, and
+any counter stripe locks they held are released first.  On
+SIGTERM/SIGINT the other workers are stopped first and worker 0 last, so its
+final flush includes every worker's increments.
+"""
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from typing import Dict
+
+import typer
+
+from shared_counters import SharedCounterTable, install
+
+logger = logging.getLogger("launcher")
+
+cli = typer.Typer(add_completion=False)
+
+
+def serve(app: str, index: int, workers: int, table: SharedCounterTable, sock: socket.socket, log_level: str):
+    # Terminal Ctrl-C goes to the launcher only; it decides the shutdown order
+    os.setpgrp()
+    install(table, flusher=index == 0, workers=workers, index=index)
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, log_level=log_level, lifespan="on"))
+    server.run(sockets=[sock])
+
+
+def stop_workers(processes, timeout: float):
+    for process in processes:
+        if process.is_alive():
+            os.kill(process.pid, signal.SIGTERM)
+    deadline = time.monotonic() + timeout
+    for process in processes:
+        process.join(max(0.0, deadline - time.monotonic()))
+        if process.is_alive():
+            logger.warning("%s did not stop within %.0fs; killing it", process.name, timeout)
+            process.kill()
+            process.join()
+
+
+@cli.command()
+def main(
+    app: str = typer.Option("server:app", help="ASGI app import path"),
+    host: str = typer.Option("0.0.0.0"),
+    port: int = typer.Option(8001),
+    workers: int = typer.Option(os.cpu_count() or 1, help="Worker processes"),
+    capacity: int = typer.Option(65_536, help="Shared counter slots"),
+    stripes: int = typer.Option(64, help="Lock stripes over the counter table"),
+    lock_timeout: float = typer.Option(1.0, help="Seconds an update waits for a stripe lock before going to Mongo"),
+    shutdown_timeout: float = typer.Option(30.0, help="Seconds to wait for each worker on shutdown"),
+    log_level: str = typer.Option("info"),
+):
+    """Serve the app from pre-forked workers sharing one counter table"""
+    logging.basicConfig(level=log_level.upper(), format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    ctx = multiprocessing.get_context("fork")
+    table = SharedCounterTable.create(ctx, capacity=capacity, stripes=stripes, lock_timeout=lock_timeout)
+
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    processes: Dict[int, multiprocessing.Process] = {}
+
+    def spawn(index: int):
+        process = ctx.Process(
+            target=serve, args=(app, index, workers, table, sock, log_level), name=f"worker-{index}"
+        )
+        process.start()
+        processes[index] = process
+
+    stopping = False
+
+    def request_stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    logger.info("Starting %d workers on %s:%d (worker 0 flushes shared counters)", workers, host, port)
+    for index in range(workers):
+        spawn(index)
+    try:
+        while not stopping:
+            time.sleep(0.5)
+            for index, process in list(processes.items()):
+                if not process.is_alive() and not stopping:
+                    logger.warning("%s exited with %s; restarting", process.name, process.exitcode)
+                    released = table.release_locks_of(process.pid)
+                    if released:
+                        logger.warning(
+                            "Released %d counter stripe locks held by %s; their slots may be off by one update",
+                            released, process.name,
+                        )
+                    spawn(index)
+    finally:
+        stop_workers([p for index, p in processes.items() if index != 0], shutdown_timeout)
+        if 0 in processes:
+            stop_workers([processes[0]], shutdown_timeout)
+        pending = table.stats()["pending"]
+        if pending:
+            logger.warning("%d shared counter increments were not flushed", pending)
+        sock.close()
+        table.close(unlink=True)
+
+
+if __name__ == "__main__":
+    cli()
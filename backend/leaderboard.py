@@ -0,0 +1,197 @@
+"""In-memory outfit leaderboard.
+
+Keeps every outfit in a sorted list ordered the same way the Express route
+sorts them (votes desc, newest first on ties) plus a running global vote
+total, so ranked pages, single ranks and percentages are served without a
+Mongo round-trip.  Vote updates are O(log n).
+"""
+import asyncio
+import contextlib
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from bson import ObjectId
+from sortedcontainers import SortedKeyList
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class OutfitEntry:
+    id: str
+    title: str
+    image: str
+    votes: int = 0
+    created_at: Optional[datetime] = None
+    # Content-addressed image with responsive derivatives, see images.py
+    image_id: Optional[str] = None
+
+    @property
+    def sort_key(self):
+        created = self.created_at.timestamp() if self.created_at else 0.0
+        return (-self.votes, -created, self.id)
+
+
+def percentage(votes: int, total: int) -> int:
+    # Math.round semantics, to match the numbers the Node API returns
+    return int(votes * 100 / total + 0.5) if total > 0 else 0
+
+
+class Leaderboard:
+    def __init__(self):
+        self._entries: Dict[str, OutfitEntry] = {}
+        self._ordered = SortedKeyList(key=lambda entry: entry.sort_key)
+        self.total_votes = 0
+        self.rebuilt_at: Optional[datetime] = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, outfit_id) -> bool:
+        return str(outfit_id) in self._entries
+
+    def upsert_outfit(
+        self,
+        outfit_id,
+        title: str,
+        image: str,
+        votes: int = 0,
+        created_at: Optional[datetime] = None,
+        image_id: Optional[str] = None,
+    ):
+        outfit_id = str(outfit_id)
+        current = self._entries.get(outfit_id)
+        if current is not None:
+            self._ordered.remove(current)
+            self.total_votes -= current.votes
+        entry = OutfitEntry(outfit_id, title, image, votes, created_at, image_id)
+        self._entries[outfit_id] = entry
+        self._ordered.add(entry)
+        self.total_votes += votes
+
+    def remove_outfit(self, outfit_id):
+        entry = self._entries.pop(str(outfit_id), None)
+        if entry is not None:
+            self._ordered.remove(entry)
+            self.total_votes -= entry.votes
+
+    def record_vote(self, outfit_id, count: int = 1) -> Optional[OutfitEntry]:
+        entry = self._entries.get(str(outfit_id))
+        if entry is None:
+            return None
+        self._ordered.remove(entry)
+        entry.votes += count
+        self._ordered.add(entry)
+        self.total_votes += count
+        return entry
+
+    def get(self, outfit_id) -> Optional[OutfitEntry]:
+        return self._entries.get(str(outfit_id))
+
+    def rank(self, outfit_id) -> Optional[int]:
+        entry = self._entries.get(str(outfit_id))
+        if entry is None:
+            return None
+        return self._ordered.index(entry) + 1
+
+    def serialize(self, entry: OutfitEntry, ranking: int) -> Dict[str, Any]:
+        return {
+            "id": entry.id,
+            "title": entry.title,
+            "image": entry.image,
+            "imageId": entry.image_id,
+            "votes": entry.votes,
+            "percentage": percentage(entry.votes, self.total_votes),
+            "ranking": ranking,
+            "comments": [],
+        }
+
+    def page(self, offset: int = 0, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        stop = None if limit is None else offset + limit
+        return [
+            self.serialize(entry, offset + i + 1)
+            for i, entry in enumerate(self._ordered.islice(offset, stop))
+        ]
+
+    async def rebuild(self, db):
+        """Reload outfits and recount their votes from the ``votes`` collection."""
+        counts = await _vote_counts(db)
+        entries = {}
+        async for doc in db.outfits.find({}, {"title": 1, "imageUrl": 1, "imageId": 1, "createdAt": 1}):
+            outfit_id = str(doc["_id"])
+            entries[outfit_id] = OutfitEntry(
+                outfit_id,
+                doc.get("title", ""),
+                doc.get("imageUrl", ""),
+                counts.get(outfit_id, 0),
+                doc.get("createdAt"),
+                doc.get("imageId"),
+            )
+        self._entries = entries
+        self._ordered = SortedKeyList(entries.values(), key=lambda entry: entry.sort_key)
+        self.total_votes = sum(entry.votes for entry in entries.values())
+        self.rebuilt_at = datetime.utcnow()
+        logger.info("Leaderboard rebuilt: %d outfits, %d votes", len(entries), self.total_votes)
+
+    async def reconcile(self, db, pause=None) -> Dict[str, Any]:
+        """Compare in-memory counts against Mongo and fix any drift.
+
+        ``pause`` (``VoteIngestor.paused``) briefly holds vote flushes while
+        the in-memory counts are snapshotted and a cutoff ``_id`` is taken, so
+        every vote stored up to the cutoff is in the snapshot.  Only votes up
+        to the cutoff are counted and the difference is applied as a delta,
+        leaving votes recorded since in place.  Entries whose outfit was
+        deleted are dropped.  Returns a summary of the corrections made.
+        """
+        async with pause() if pause is not None else contextlib.nullcontext():
+            snapshot = {outfit_id: entry.votes for outfit_id, entry in self._entries.items()}
+            # Later votes get larger ids: ObjectIds grow with time and per-process counter
+            cutoff = ObjectId()
+        counts = await _vote_counts(db, cutoff)
+        corrected = {}
+        added = 0
+        seen = set()
+        async for doc in db.outfits.find({}, {"title": 1, "imageUrl": 1, "imageId": 1, "createdAt": 1}):
+            outfit_id = str(doc["_id"])
+            seen.add(outfit_id)
+            actual = counts.get(outfit_id, 0)
+            entry = self._entries.get(outfit_id)
+            if entry is None:
+                self.upsert_outfit(
+                    outfit_id, doc.get("title", ""), doc.get("imageUrl", ""), actual, doc.get("createdAt"), doc.get("imageId")
+                )
+                added += 1
+                continue
+            # Images attached through another worker
+            entry.image_id = doc.get("imageId")
+            # Outfits added since the snapshot were loaded with a fresh count
+            drift = actual - snapshot.get(outfit_id, actual)
+            if drift:
+                corrected[outfit_id] = drift
+                self.record_vote(outfit_id, drift)
+        removed = [outfit_id for outfit_id in snapshot if outfit_id not in seen]
+        for outfit_id in removed:
+            self.remove_outfit(outfit_id)
+        if corrected or added or removed:
+            logger.warning(
+                "Leaderboard drift fixed: %d outfits corrected, %d added, %d removed",
+                len(corrected), added, len(removed),
+            )
+        return {"corrected": corrected, "added": added, "removed": len(removed), "total_votes": self.total_votes}
+
+    async def run_reconcile_loop(self, db, interval: float, pause=None):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reconcile(db, pause)
+            except Exception:
+                logger.exception("Leaderboard reconcile failed")
+
+
+async def _vote_counts(db, until: Optional[ObjectId] = None) -> Dict[str, int]:
+    pipeline = [{"$group": {"_id": "$outfitId", "votes": {"$sum": 1}}}]
+    if until is not None:
+        pipeline.insert(0, {"$match": {"_id": {"$lte": until}}})
+    return {str(doc["_id"]): doc["votes"] async for doc in db.votes.aggregate(pipeline)}
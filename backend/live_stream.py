@@ -0,0 +1,169 @@
+"""Server-push ranking updates.
+
+Vote flushes only mark the leaderboard dirty.  A single ticker compares the
+current ranking against the last published one every ``tick_ms`` and, if
+anything changed, encodes one delta event that is handed to every
+subscriber as the same pre-encoded bytes.  Cost per tick is therefore one
+ranking pass plus an O(1) enqueue per connection.
+
+Each subscriber has a bounded buffer.  When a slow consumer fills it, its
+backlog is dropped and replaced by a single full snapshot so the client can
+resynchronise instead of replaying stale deltas.
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+def _encode(event: str, seq: int, payload: Dict[str, Any]) -> bytes:
+    data = json.dumps(payload, separators=(",", ":"), default=str, ensure_ascii=False)
+    return f"id: {seq}\nevent: {event}\ndata: {data}\n\n".encode()
+
+
+class Subscriber:
+    def __init__(self, buffer_size: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=buffer_size)
+        self.delivered_seq = 0
+        self.resyncs = 0
+
+    def offer(self, message: bytes, snapshot_factory) -> bool:
+        """Queue ``message``; on overflow replace the backlog with a snapshot."""
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(snapshot_factory())
+            self.resyncs += 1
+            return False
+
+
+class LiveStream:
+    def __init__(
+        self,
+        leaderboard,
+        tick_ms: int = 250,
+        buffer_size: int = 16,
+        heartbeat_s: float = 15.0,
+        decorate: Optional[Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]]] = None,
+    ):
+        self.leaderboard = leaderboard
+        # Applied to snapshot rows, e.g. to add image srcsets
+        self.decorate = decorate
+        self.tick_interval = tick_ms / 1000
+        self.buffer_size = buffer_size
+        self.heartbeat_interval = heartbeat_s
+        self.seq = 0
+        self.ticks_published = 0
+        self.slow_consumer_resyncs = 0
+        self.peak_connections = 0
+        self.last_tick_ms = 0.0
+        self._subscribers: Set[Subscriber] = set()
+        self._published: Dict[str, tuple] = {}
+        self._published_total = 0
+        self._dirty = False
+        self._snapshot_cache: Optional[tuple] = None
+
+    @property
+    def connections(self) -> int:
+        return len(self._subscribers)
+
+    def mark_dirty(self, *_):
+        self._dirty = True
+
+    def subscribe(self) -> Subscriber:
+        subscriber = Subscriber(self.buffer_size)
+        subscriber.queue.put_nowait(self.snapshot())
+        subscriber.delivered_seq = self.seq
+        self._subscribers.add(subscriber)
+        self.peak_connections = max(self.peak_connections, len(self._subscribers))
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self._subscribers.discard(subscriber)
+
+    def snapshot(self) -> bytes:
+        # Shared by every resync within the same tick
+        if self._snapshot_cache is None or self._snapshot_cache[0] != self.seq:
+            rows = self.leaderboard.page()
+            if self.decorate is not None:
+                rows = self.decorate(rows)
+            payload = {"total_votes": self.leaderboard.total_votes, "outfits": rows}
+            self._snapshot_cache = (self.seq, _encode("snapshot", self.seq, payload))
+        return self._snapshot_cache[1]
+
+    def _compute_delta(self) -> Optional[Dict[str, Any]]:
+        current = {
+            row["id"]: (row["votes"], row["percentage"], row["ranking"])
+            for row in self.leaderboard.page()
+        }
+        changed = [
+            {"id": outfit_id, "votes": votes, "percentage": pct, "ranking": ranking}
+            for outfit_id, (votes, pct, ranking) in current.items()
+            if self._published.get(outfit_id) != (votes, pct, ranking)
+        ]
+        removed = [outfit_id for outfit_id in self._published if outfit_id not in current]
+        total = self.leaderboard.total_votes
+        self._published = current
+        if not changed and not removed and total == self._published_total:
+            return None
+        self._published_total = total
+        return {"total_votes": total, "changed": changed, "removed": removed}
+
+    def tick(self):
+        if not self._dirty:
+            return
+        self._dirty = False
+        started = time.perf_counter()
+        delta = self._compute_delta()
+        if delta is not None:
+            self.seq += 1
+            message = _encode("delta", self.seq, delta)
+            for subscriber in self._subscribers:
+                if not subscriber.offer(message, self.snapshot):
+                    self.slow_consumer_resyncs += 1
+            self.ticks_published += 1
+        self.last_tick_ms = round((time.perf_counter() - started) * 1000, 3)
+
+    async def run(self):
+        self._compute_delta()
+        while True:
+            await asyncio.sleep(self.tick_interval)
+            try:
+                self.tick()
+            except Exception:
+                logger.exception("Live stream tick failed")
+
+    async def events(self, subscriber: Subscriber):
+        """Yield SSE frames for ``subscriber`` until the client goes away."""
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscriber.queue.get(), timeout=self.heartbeat_interval)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+                    continue
+                subscriber.delivered_seq = self.seq - subscriber.queue.qsize()
+                yield message
+        finally:
+            self.unsubscribe(subscriber)
+
+    def stats(self) -> Dict[str, Any]:
+        lags = [self.seq - s.delivered_seq for s in self._subscribers]
+        return {
+            "connections": len(self._subscribers),
+            "peak_connections": self.peak_connections,
+            "seq": self.seq,
+            "ticks_published": self.ticks_published,
+            "tick_ms": self.tick_interval * 1000,
+            "last_tick_compute_ms": self.last_tick_ms,
+            "max_lag_ticks": max(lags, default=0),
+            "avg_lag_ticks": round(sum(lags) / len(lags), 3) if lags else 0.0,
+            "lag_ms_estimate": max(lags, default=0) * self.tick_interval * 1000,
+            "slow_consumer_resyncs": self.slow_consumer_resyncs,
+        }
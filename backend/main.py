@@ -1,25 +1,5 @@
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
+from app_factory import create_app
 
-app = FastAPI()
-
-ALLOWED_ORIGINS = [
-    "https://stephanieg-fans.netlify.app",  # tu dominio en Netlify
-    # "https://TU-DOMINIO-PROPIO.com",       # (opcional) agrégalo cuando lo tengas
-]
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=ALLOWED_ORIGINS,
-    allow_credentials=True,            # si usas cookies/sesiones
-    allow_methods=["GET","POST","PUT","PATCH","DELETE","OPTIONS"],
-    allow_headers=["*"],
-)
-
-@app.get("/")
-def root():
-    return {"status": "ok"}
-
-@app.get("/health")
-def health():
-    return {"ok": True}
+# Same app as server.py; allowed origins come from CORS_ORIGINS
+# (https://stephanieg-fans.netlify.app in production)
+app = create_app()
@@ -0,0 +1,276 @@
+"""Request, Mongo and event-loop instrumentation in Prometheus text format.
+
+``MetricsMiddleware`` records per-route/status latency histograms and an
+in-flight gauge, ``database.MongoCommandMetrics`` feeds the Mongo command
+histograms, and ``LoopLagMonitor`` measures how late the event loop wakes
+up.  ``SamplingProfiler`` is an opt-in stack sampler of the event-loop
+thread that keeps folded, flamegraph-ready stacks for requests slower than
+a threshold.  The driver is not imported here, so the app factory can load
+this module without pymongo.
+"""
+import asyncio
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, deque
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = ['%s="%s"' % (n, str(v).replace("\\", "\\\\").replace('"', '\\"')) for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{%s}" % ",".join(parts) if parts else ""
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class CounterMetric(Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [
+            f"{self.name}{_labels(self.label_names, labels)} {value}" for labels, value in items
+        ]
+
+
+class GaugeMetric(CounterMetric):
+    kind = "gauge"
+
+    def set(self, *labels: str, value: float):
+        with self._lock:
+            self._values[labels] = value
+
+    def dec(self, *labels: str, amount: float = 1.0):
+        self.inc(*labels, amount=-amount)
+
+
+class HistogramMetric(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, *labels: str, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(labels, list(series)) for labels, series in self._series.items()]
+        lines = self.header()
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = 'le="%s"' % ("+Inf" if bound == float("inf") else repr(bound))
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {series[-1]}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[Metric] = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs) -> CounterMetric:
+        return self.register(CounterMetric(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs) -> GaugeMetric:
+        return self.register(GaugeMetric(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs) -> HistogramMetric:
+        return self.register(HistogramMetric(*args, **kwargs))
+
+    def add_collector(self, collect):
+        """``collect()`` returns ``{name: value}`` gauges refreshed at scrape time."""
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            for name, value in collect().items():
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status")
+)
+http_in_flight = registry.gauge("http_requests_in_flight", "HTTP requests currently being served")
+mongo_commands = registry.histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency", ("command", "collection")
+)
+mongo_failures = registry.counter("mongo_command_failures_total", "Failed MongoDB commands", ("command", "collection"))
+loop_lag = registry.histogram(
+    "event_loop_lag_seconds", "How late the event loop woke up from a timed sleep",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+loop_lag_current = registry.gauge("event_loop_lag_current_seconds", "Most recent event-loop lag sample")
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.current = 0.0
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.current = max(0.0, loop.time() - expected)
+            loop_lag.observe(value=self.current)
+            loop_lag_current.set(value=self.current)
+
+
+class SamplingProfiler:
+    """Samples the event-loop thread's stack while enabled.
+
+    Samples land in a ring buffer; when a request finishes slower than
+    ``threshold_ms`` the samples taken during it are folded into
+    ``frame;frame;frame count`` lines and kept with the request.  Because
+    every request shares the loop thread, a profile shows what the loop was
+    busy with while that request was in flight.
+    """
+
+    def __init__(self, interval_ms: float = 5.0, threshold_ms: float = 500.0, max_profiles: int = 50):
+        self.interval_ms = interval_ms
+        self.threshold_ms = threshold_ms
+        self.profiles: deque = deque(maxlen=max_profiles)
+        self._samples: deque = deque(maxlen=20_000)
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._target_thread: Optional[int] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._thread is not None
+
+    def start(self, interval_ms: Optional[float] = None, threshold_ms: Optional[float] = None):
+        if interval_ms is not None:
+            self.interval_ms = interval_ms
+        if threshold_ms is not None:
+            self.threshold_ms = threshold_ms
+        if self._thread is not None:
+            return
+        self._target_thread = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample_loop, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self._samples.clear()
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.interval_ms / 1000):
+            frame = sys._current_frames().get(self._target_thread)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                frame = frame.f_back
+            self._samples.append((time.perf_counter(), ";".join(reversed(stack))))
+
+    def request_finished(self, method: str, route: str, started: float, finished: float):
+        elapsed_ms = (finished - started) * 1000
+        if self._thread is None or elapsed_ms < self.threshold_ms:
+            return
+        folded = Counter(stack for ts, stack in list(self._samples) if started <= ts <= finished)
+        self.profiles.append({
+            "method": method,
+            "route": route,
+            "duration_ms": round(elapsed_ms, 3),
+            "at": time.time(),
+            "samples": sum(folded.values()),
+            "folded": [f"{stack} {count}" for stack, count in folded.most_common()],
+        })
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "interval_ms": self.interval_ms,
+            "threshold_ms": self.threshold_ms,
+            "profiles": len(self.profiles),
+        }
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so streaming responses are timed to completion."""
+
+    def __init__(self, app, profiler: Optional[SamplingProfiler] = None):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            finished = time.perf_counter()
+            http_in_flight.dec()
+            route = scope.get("route")
+            # Unmatched paths share one label so scanners can't blow up cardinality
+            route_path = getattr(route, "path", "unmatched")
+            http_requests.observe(scope["method"], route_path, str(status), value=finished - started)
+            if self.profiler is not None:
+                self.profiler.request_finished(scope["method"], route_path, started, finished)
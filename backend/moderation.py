@@ -0,0 +1,412 @@
+"""Moderation queue for fan questions.
+
+Every question carries an explicit ``status``: ``pending`` (waiting in the
+queue), ``duplicate`` (a near-copy of a pending question, its ``clusterId``),
+``answered`` or ``rejected``.  The queue lists only ``pending`` questions,
+paged by ``queueRank`` over a partial index that holds nothing else, so it
+stays small however many questions have been answered.
+
+``queueRank`` is a virtual enqueue time in epoch seconds, and lower ranks are
+served first.  It starts at ``createdAt`` and is moved earlier by the asking
+fan's tier and by the number of duplicates in the question's cluster, so the
+oldest and most asked questions reach the front.  ``rankBase`` keeps the
+rank before the cluster boost, so the rank can be recomputed as a cluster
+grows.
+
+Incoming questions are matched against pending ones with MinHash LSH over
+their search tokens (see ``search.tokenize``).  A near-duplicate joins the
+earliest matching cluster instead of queueing again, and answering a
+cluster answers all of its members in one ``bulk_write``.  Cluster state is
+kept per process and refreshed from Mongo periodically: heads answered
+through the Node API are resolved with their duplicates, and heads resolved
+elsewhere are dropped.  In multi-worker mode two workers can each open a
+cluster for the same question; both still reach the queue.
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import os
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Sequence, Set, Tuple
+
+from bson import ObjectId
+from pymongo import ASCENDING, IndexModel, UpdateMany, UpdateOne
+
+from search import tokenize
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+DUPLICATE = "duplicate"
+ANSWERED = "answered"
+REJECTED = "rejected"
+
+OPEN_STATUSES = [PENDING, DUPLICATE]
+
+UNIX_EPOCH = datetime(1970, 1, 1)
+
+# 2**61 - 1, a Mersenne prime for the MinHash permutations
+PRIME = (1 << 61) - 1
+
+INDEXES = [
+    IndexModel([("clusterId", ASCENDING)], name="clusterId", sparse=True),
+    # The search index syncs on this; every write here sets it
+    IndexModel([("updatedAt", ASCENDING)], name="updatedAt", sparse=True),
+]
+
+
+@dataclass(frozen=True)
+class QueueRules:
+    # Seconds a question is moved forward in the queue, per fan tier
+    tier_boosts: Dict[str, float] = field(default_factory=lambda: {"top": 3600.0, "member": 300.0, "anonymous": 0.0})
+    # Seconds a cluster is moved forward each time its size doubles
+    cluster_boost: float = 900.0
+    # Token-set Jaccard similarity from which two questions are duplicates
+    threshold: float = 0.6
+
+    @classmethod
+    def from_env(cls) -> "QueueRules":
+        env = os.environ
+        return cls(
+            tier_boosts={
+                "top": float(env.get("MODERATION_TOP_FAN_BOOST_S", "3600")),
+                "member": float(env.get("MODERATION_MEMBER_BOOST_S", "300")),
+                "anonymous": 0.0,
+            },
+            cluster_boost=float(env.get("MODERATION_CLUSTER_BOOST_S", "900")),
+            threshold=float(env.get("MODERATION_DUPLICATE_THRESHOLD", "0.6")),
+        )
+
+    def rank(self, rank_base: float, cluster_size: int) -> float:
+        return rank_base - self.cluster_boost * math.log2(max(cluster_size, 1))
+
+
+def _token_hash(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "little")
+
+
+class DuplicateClusters:
+    """MinHash LSH over the token sets of pending questions.
+
+    With ``bands * rows`` hash functions, two questions share a bucket in at
+    least one band with high probability once their Jaccard similarity
+    passes roughly ``(1 / bands) ** (1 / rows)``.  Candidates from the
+    buckets are then checked against the exact similarity.
+    """
+
+    def __init__(self, threshold: float = 0.6, bands: int = 8, rows: int = 4):
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = rows
+        # (a, b) of each permutation h -> (a * h + b) mod PRIME, fixed so every process agrees
+        self._perms = [
+            (_token_hash(f"a{i}") % PRIME | 1, _token_hash(f"b{i}") % PRIME) for i in range(bands * rows)
+        ]
+        self._terms: Dict[Any, FrozenSet[str]] = {}
+        self._keys: Dict[Any, List[Tuple[int, Tuple[int, ...]]]] = {}
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], Set[Any]] = defaultdict(set)
+
+    def __len__(self):
+        return len(self._terms)
+
+    def _band_keys(self, terms: FrozenSet[str]) -> List[Tuple[int, Tuple[int, ...]]]:
+        hashes = [_token_hash(term) for term in terms]
+        signature = [min((a * h + b) % PRIME for h in hashes) for a, b in self._perms]
+        return [(band, tuple(signature[band * self.rows:(band + 1) * self.rows])) for band in range(self.bands)]
+
+    def find(self, terms: FrozenSet[str]) -> Optional[Any]:
+        """The pending question most similar to ``terms``, if any is similar enough."""
+        if not terms:
+            return None
+        candidates = set()
+        for key in self._band_keys(terms):
+            candidates.update(self._buckets.get(key, ()))
+        best, best_similarity = None, self.threshold
+        for candidate in candidates:
+            other = self._terms[candidate]
+            similarity = len(terms & other) / len(terms | other)
+            # Ties go to the earliest question
+            if similarity > best_similarity or (similarity == best_similarity and (best is None or candidate < best)):
+                best, best_similarity = candidate, similarity
+        return best
+
+    def add(self, question_id: Any, terms: FrozenSet[str]):
+        if not terms:
+            return
+        keys = self._band_keys(terms)
+        self._terms[question_id] = terms
+        self._keys[question_id] = keys
+        for key in keys:
+            self._buckets[key].add(question_id)
+
+    def remove(self, question_id: Any):
+        self._terms.pop(question_id, None)
+        for key in self._keys.pop(question_id, ()):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(question_id)
+                if not bucket:
+                    del self._buckets[key]
+
+
+def question_terms(text: Optional[str]) -> FrozenSet[str]:
+    return frozenset(tokenize(text))
+
+
+class ModerationQueue:
+    def __init__(self, db, rules: Optional[QueueRules] = None):
+        self.db = db
+        self.rules = rules or QueueRules()
+        self.clusters = DuplicateClusters(self.rules.threshold)
+        # rankBase and clusterSize of the pending cluster heads
+        self._heads: Dict[Any, Tuple[float, int]] = {}
+        # Heads opened by ``submit`` and not inserted yet
+        self._opening: Set[Any] = set()
+        self.watermark: Optional[ObjectId] = None
+        self.submitted = 0
+        self.duplicates = 0
+        self.answered = 0
+        self.rejected = 0
+
+    async def ensure_indexes(self):
+        await self.db.questions.create_indexes(INDEXES)
+
+    async def _tiers(self, fan_ids: Iterable[Any]) -> Dict[Any, str]:
+        fan_ids = [fan_id for fan_id in set(fan_ids) if fan_id is not None]
+        if not fan_ids:
+            return {}
+        return {
+            fan["_id"]: "top" if fan.get("isTopFan") else "member"
+            async for fan in self.db.fans.find({"_id": {"$in": fan_ids}}, {"isTopFan": 1})
+        }
+
+    def _classify(self, doc: Dict[str, Any], tier: str) -> Dict[str, Any]:
+        """Queue fields for a new open question; updates the in-memory clusters."""
+        terms = question_terms(doc.get("text"))
+        head = self.clusters.find(terms)
+        if head is not None:
+            rank_base, size = self._heads[head]
+            self._heads[head] = (rank_base, size + 1)
+            return {"status": DUPLICATE, "clusterId": head, "tier": tier}
+        rank_base = (doc["createdAt"] - UNIX_EPOCH).total_seconds() - self.rules.tier_boosts.get(tier, 0.0)
+        self._heads[doc["_id"]] = (rank_base, 1)
+        self.clusters.add(doc["_id"], terms)
+        return {
+            "status": PENDING,
+            "clusterId": doc["_id"],
+            "clusterSize": 1,
+            "tier": tier,
+            "rankBase": rank_base,
+            "queueRank": rank_base,
+        }
+
+    def _head_update(self, head: Any) -> UpdateOne:
+        rank_base, size = self._heads[head]
+        return UpdateOne(
+            {"_id": head, "status": PENDING},
+            {"$set": {"clusterSize": size, "queueRank": self.rules.rank(rank_base, size)}},
+        )
+
+    def _close(self, head: Any):
+        self._heads.pop(head, None)
+        self.clusters.remove(head)
+
+    async def load(self):
+        """Rebuild the clusters from the pending questions."""
+        self.clusters = DuplicateClusters(self.rules.threshold)
+        self._heads = {}
+        projection = {"text": 1, "rankBase": 1, "clusterSize": 1}
+        async for doc in self.db.questions.find({"status": PENDING}, projection).batch_size(5000):
+            self._heads[doc["_id"]] = (doc.get("rankBase", 0.0), doc.get("clusterSize", 1))
+            self.clusters.add(doc["_id"], question_terms(doc.get("text")))
+        logger.info("Moderation queue loaded: %d pending clusters", len(self._heads))
+
+    async def submit(self, question: Dict[str, Any], fan_id: Any = None) -> Dict[str, Any]:
+        """Insert a new question into the queue, clustering it with near-duplicates."""
+        question.setdefault("_id", ObjectId())
+        question.setdefault("createdAt", datetime.utcnow())
+        question["updatedAt"] = datetime.utcnow()
+        if fan_id is not None:
+            question["fanId"] = fan_id
+        tier = (await self._tiers([fan_id])).get(fan_id, "anonymous") if fan_id is not None else "anonymous"
+        while True:
+            fields = self._classify(question, tier)
+            if fields["status"] == PENDING:
+                self._opening.add(question["_id"])
+                break
+            head = fields["clusterId"]
+            result = await self.db.questions.bulk_write([self._head_update(head)])
+            if result.matched_count:
+                self.duplicates += 1
+                break
+            # Answered or rejected elsewhere since it was clustered here
+            self._close(head)
+        question.update(fields)
+        try:
+            await self.db.questions.insert_one(question)
+        finally:
+            self._opening.discard(question["_id"])
+        self.submitted += 1
+        return question
+
+    async def adopt(self, batch_size: int = 1000) -> int:
+        """Queue questions written without a status (by the Node API or before this existed)."""
+        adopted = 0
+        while True:
+            query: Dict[str, Any] = {"status": {"$exists": False}}
+            if self.watermark is not None:
+                query["_id"] = {"$gt": self.watermark}
+            docs = await self.db.questions.find(query, {"text": 1, "answer": 1, "createdAt": 1, "fanId": 1}) \
+                .sort("_id", ASCENDING).limit(batch_size).to_list(batch_size)
+            if not docs:
+                return adopted
+            tiers = await self._tiers(doc.get("fanId") for doc in docs)
+            ops, heads = [], set()
+            # Heads known to be pending: checked in Mongo, or opened in this batch
+            verified: Set[Any] = set()
+            now = datetime.utcnow()
+            for doc in docs:
+                if doc.get("answer"):
+                    ops.append(UpdateOne(
+                        {"_id": doc["_id"]}, {"$set": {"status": ANSWERED, "clusterId": doc["_id"], "updatedAt": now}}
+                    ))
+                    continue
+                doc.setdefault("createdAt", doc["_id"].generation_time.replace(tzinfo=None))
+                while True:
+                    fields = self._classify(doc, tiers.get(doc.get("fanId"), "anonymous"))
+                    head = fields["clusterId"]
+                    if fields["status"] == PENDING:
+                        verified.add(head)
+                        break
+                    if head in verified or await self.db.questions.count_documents(
+                        {"_id": head, "status": PENDING}, limit=1
+                    ):
+                        verified.add(head)
+                        heads.add(head)
+                        break
+                    # Answered or rejected elsewhere since it was clustered here
+                    self._close(head)
+                ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {**fields, "updatedAt": now}}))
+            # Ordered: a cluster head opened in this batch is written before its size
+            ops.extend(self._head_update(head) for head in heads)
+            await self.db.questions.bulk_write(ops, ordered=True)
+            self.watermark = docs[-1]["_id"]
+            adopted += len(docs)
+            if len(docs) < batch_size:
+                return adopted
+
+    async def refresh(self, resolve_answered: bool = True, batch_size: int = 5000) -> Dict[str, int]:
+        """Bring the clusters up to date with questions resolved outside this process.
+
+        With ``resolve_answered`` (one worker does this), pending heads that
+        were given an answer through the Node API are answered together with
+        their duplicates.  Heads no longer pending in Mongo are then dropped.
+        """
+        resolved = 0
+        if resolve_answered:
+            answers = [
+                (doc["_id"], doc["answer"])
+                async for doc in self.db.questions.find(
+                    {"status": PENDING, "answer": {"$nin": [None, ""]}}, {"answer": 1}
+                )
+            ]
+            if answers:
+                resolved = (await self.resolve(answers=answers))["answered"]
+        heads = [head for head in self._heads if head not in self._opening]
+        closed = 0
+        for i in range(0, len(heads), batch_size):
+            chunk = heads[i:i + batch_size]
+            pending = {
+                doc["_id"]
+                async for doc in self.db.questions.find({"_id": {"$in": chunk}, "status": PENDING}, {"_id": 1})
+            }
+            for head in chunk:
+                if head not in pending:
+                    self._close(head)
+                    closed += 1
+        if resolved or closed:
+            logger.info("Moderation refresh: %d answered elsewhere, %d clusters closed", resolved, closed)
+        return {"answered": resolved, "closed": closed}
+
+    async def run_sync_loop(self, interval: float, adopt: bool = True):
+        """Refresh the clusters every ``interval`` seconds; with ``adopt``, also resolve and adopt Node questions."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.refresh(resolve_answered=adopt)
+                if adopt:
+                    await self.adopt()
+            except Exception:
+                logger.exception("Moderation sync failed")
+
+    async def resolve(
+        self,
+        answers: Sequence[Tuple[Any, str]] = (),
+        rejections: Sequence[Any] = (),
+    ) -> Dict[str, Any]:
+        """Answer and reject questions, each together with its duplicates, in one ``bulk_write``.
+
+        Returns the counts and the updated documents, including duplicates,
+        so callers can refresh anything derived from them.
+        """
+        now = datetime.utcnow()
+        ops = []
+        heads = [question_id for question_id, _ in answers] + list(rejections)
+        for question_id, answer in answers:
+            ops.append(UpdateMany(
+                # Members already rejected, or answered on their own, keep their state
+                {"$or": [{"_id": question_id}, {"clusterId": question_id, "status": {"$in": OPEN_STATUSES}}]},
+                {"$set": {"answer": answer, "status": ANSWERED, "answeredAt": now, "updatedAt": now}},
+            ))
+        for question_id in rejections:
+            ops.append(UpdateMany(
+                {"$or": [{"_id": question_id}, {"clusterId": question_id, "status": {"$in": OPEN_STATUSES}}]},
+                {"$set": {"status": REJECTED, "rejectedAt": now, "updatedAt": now}},
+            ))
+        if not ops:
+            return {"answered": 0, "rejected": 0, "modified": 0, "missing": [], "documents": []}
+        result = await self.db.questions.bulk_write(ops, ordered=False)
+        for head in heads:
+            self._close(head)
+
+        documents = await self.db.questions.find(
+            {"$or": [{"_id": {"$in": heads}}, {"clusterId": {"$in": heads}}]}
+        ).to_list(None)
+        found = {doc["_id"] for doc in documents}
+        missing = [question_id for question_id in heads if question_id not in found]
+        answered_heads = {question_id for question_id, _ in answers}
+        rejected_heads = set(rejections)
+        answered = rejected = 0
+        for doc in documents:
+            head = doc["_id"] if doc["_id"] in answered_heads or doc["_id"] in rejected_heads else doc.get("clusterId")
+            if doc.get("status") == ANSWERED and head in answered_heads:
+                answered += 1
+            elif doc.get("status") == REJECTED and head in rejected_heads:
+                rejected += 1
+        self.answered += answered
+        self.rejected += rejected
+        return {
+            "answered": answered,
+            "rejected": rejected,
+            "modified": result.modified_count,
+            "missing": [str(question_id) for question_id in missing],
+            "documents": documents,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending_clusters": len(self._heads),
+            "indexed_clusters": len(self.clusters),
+            "submitted": self.submitted,
+            "duplicates": self.duplicates,
+            "answered": self.answered,
+            "rejected": self.rejected,
+            "rules": {
+                "tier_boosts": self.rules.tier_boosts,
+                "cluster_boost": self.rules.cluster_boost,
+                "threshold": self.rules.threshold,
+            },
+        }
@@ -0,0 +1,164 @@
+"""Keyset (cursor) pagination.
+
+Pages are addressed by an opaque cursor holding the sort key and ``_id`` of
+the last document returned, so fetching page N costs an index seek rather
+than skipping N * limit documents.  Totals come from a short-lived cache of
+collection estimates instead of an exact ``countDocuments`` per request.
+"""
+import base64
+import binascii
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import json_util
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class SortMode:
+    field: str
+    direction: int
+
+    @property
+    def spec(self) -> List[Tuple[str, int]]:
+        return [(self.field, self.direction), ("_id", self.direction)]
+
+
+SORT_MODES: Dict[str, SortMode] = {
+    "newest": SortMode("createdAt", DESCENDING),
+    "recent": SortMode("createdAt", DESCENDING),
+    "oldest": SortMode("createdAt", ASCENDING),
+    "popular": SortMode("downloads", DESCENDING),
+    "points": SortMode("points", DESCENDING),
+    "latest": SortMode("timestamp", DESCENDING),
+    # Moderation queue, see moderation.py
+    "priority": SortMode("queueRank", ASCENDING),
+}
+
+# Compound indexes backing every (collection, sort mode) pair served above
+INDEXES: Dict[str, List[IndexModel]] = {
+    "questions": [
+        IndexModel([("createdAt", DESCENDING), ("_id", DESCENDING)], name="createdAt_id"),
+        # Only pending questions are indexed, so the queue index stays small
+        IndexModel(
+            [("queueRank", ASCENDING), ("_id", ASCENDING)],
+            name="pending_queueRank_id",
+            partialFilterExpression={"status": "pending"},
+        ),
+    ],
+    "wallpapers": [
+        IndexModel([("createdAt", DESCENDING), ("_id", DESCENDING)], name="createdAt_id"),
+        IndexModel([("downloads", DESCENDING), ("_id", DESCENDING)], name="downloads_id"),
+    ],
+    "fans": [
+        IndexModel([("points", DESCENDING), ("_id", DESCENDING)], name="points_id"),
+        IndexModel([("createdAt", DESCENDING), ("_id", DESCENDING)], name="createdAt_id"),
+    ],
+    # "latest" on heartbeats is indexed by HeartbeatIngestor.ensure_collections:
+    # an index built here could create the collection before it is made time-series
+}
+
+
+async def ensure_indexes(db):
+    for collection, indexes in INDEXES.items():
+        await db[collection].create_indexes(indexes)
+
+
+def encode_cursor(mode: str, doc: Dict[str, Any]) -> str:
+    sort = SORT_MODES[mode]
+    raw = json_util.dumps([mode, doc.get(sort.field), doc["_id"]])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, mode: str) -> Tuple[Any, Any]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_mode, value, last_id = json_util.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError, binascii.Error) as e:
+        raise InvalidCursor("Malformed cursor") from e
+    if cursor_mode != mode:
+        raise InvalidCursor("Cursor was issued for a different sort order")
+    return value, last_id
+
+
+def _after(sort: SortMode, value: Any, last_id: Any) -> Dict[str, Any]:
+    """Documents after ``(value, last_id)`` in ``sort`` order.
+
+    Mongo sorts a missing or null sort field below every value, so those
+    documents come last when descending and first when ascending; ``$lt``
+    and ``$gt`` never match them and they get their own branch.
+    """
+    op = "$lt" if sort.direction == DESCENDING else "$gt"
+    # {field: None} matches both null and a missing field
+    branches = [{sort.field: value, "_id": {op: last_id}}]
+    if value is None:
+        if sort.direction == ASCENDING:
+            branches.append({sort.field: {"$ne": None}})
+    else:
+        branches.append({sort.field: {op: value}})
+        if sort.direction == DESCENDING:
+            branches.append({sort.field: None})
+    return {"$or": branches}
+
+
+class TotalEstimator:
+    """Caches approximate collection totals for a few seconds."""
+
+    def __init__(self, ttl: float = 30.0):
+        self.ttl = ttl
+        self._cache: Dict[str, Tuple[float, int]] = {}
+
+    async def total(self, collection, query: Dict[str, Any]) -> int:
+        key = f"{collection.name}:{json_util.dumps(query, sort_keys=True)}"
+        cached = self._cache.get(key)
+        now = time.monotonic()
+        if cached is not None and cached[0] > now:
+            return cached[1]
+        if query:
+            total = await collection.count_documents(query)
+        else:
+            total = await collection.estimated_document_count()
+        self._cache[key] = (now + self.ttl, total)
+        return total
+
+
+estimator = TotalEstimator()
+
+
+async def paginate(
+    collection,
+    query: Optional[Dict[str, Any]] = None,
+    mode: str = "newest",
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    projection: Optional[Dict[str, Any]] = None,
+    with_total: bool = True,
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Return one page of ``collection`` and its pagination metadata."""
+    if mode not in SORT_MODES:
+        raise InvalidCursor(f"Unknown sort mode: {mode}")
+    sort = SORT_MODES[mode]
+    query = dict(query or {})
+
+    page_query = query
+    if cursor:
+        value, last_id = decode_cursor(cursor, mode)
+        page_query = {"$and": [query, _after(sort, value, last_id)]} if query else _after(sort, value, last_id)
+
+    docs = await collection.find(page_query, projection).sort(sort.spec).limit(limit + 1).to_list(limit + 1)
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+
+    pagination = {
+        "limit": limit,
+        "hasMore": has_more,
+        "nextCursor": encode_cursor(mode, docs[-1]) if has_more else None,
+    }
+    if with_total:
+        pagination["total"] = await estimator.total(collection, query)
+    return docs, pagination
@@ -0,0 +1,193 @@
+"""Fan Q&A: ``/api/questions``, with search and the moderation queue."""
+import asyncio
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from pydantic import BaseModel, Field
+
+from core import ROOT_DIR, admission, client_ip, db, known_fan, page_or_400, read_db, serialize_doc, worker
+from fast_json import FastJSONResponse
+from moderation import ModerationQueue, QueueRules
+from search import SearchIndex
+from vote_ingest import as_object_id
+
+logger = logging.getLogger(__name__)
+
+# Q&A search is answered from an in-memory index, snapshotted across restarts
+search_index = SearchIndex()
+search_snapshot_path = Path(os.environ.get('SEARCH_SNAPSHOT_PATH', str(ROOT_DIR / 'data' / 'search_index.json.gz')))
+search_sync_interval = float(os.environ.get('SEARCH_SYNC_INTERVAL_S', '30'))
+
+# New questions are clustered with near-duplicates and queued by priority
+moderation = ModerationQueue(db, QueueRules.from_env())
+moderation_adopt_interval = float(os.environ.get('MODERATION_ADOPT_INTERVAL_S', '30'))
+
+router = APIRouter(prefix="/api", default_response_class=FastJSONResponse)
+
+
+class QuestionCreate(BaseModel):
+    question: str = ''
+    fanName: str = 'Fan Anónimo'
+    fanId: Optional[str] = None
+
+class QuestionAnswer(BaseModel):
+    answer: str
+
+class QuestionBulkAnswer(BaseModel):
+    id: str
+    answer: str
+
+class QuestionBulkModeration(BaseModel):
+    answers: List[QuestionBulkAnswer] = Field(default_factory=list, max_length=1000)
+    reject: List[str] = Field(default_factory=list, max_length=1000)
+
+def format_question(q):
+    is_video = "http" in (q.get("answer") or "")
+    return {
+        "id": str(q["_id"]),
+        "question": q.get("text"),
+        "answer": q.get("answer"),
+        "type": "video" if is_video else "text",
+        "videoThumbnail": q["answer"] if is_video else None,
+        "duration": "4:32" if is_video else None,
+        "likes": q.get("likes", 0),
+        "timestamp": q.get("createdAt"),
+    }
+
+@router.get("/questions")
+async def get_questions(limit: int = Query(20, ge=1, le=100), cursor: Optional[str] = None):
+    questions, pagination = await page_or_400(
+        read_db.questions,
+        query={"answer": {"$exists": True, "$ne": None}},
+        mode="newest",
+        limit=limit,
+        cursor=cursor,
+    )
+    return {"success": True, "data": [format_question(q) for q in questions], "pagination": pagination}
+
+@router.get("/questions/search")
+async def search_questions(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(10, ge=1, le=50),
+    prefix: bool = True,
+):
+    hits = search_index.search(q, limit=limit, prefix=prefix)
+    ids = [as_object_id(hit["id"]) for hit in hits]
+    docs = {doc["_id"]: doc async for doc in read_db.questions.find({"_id": {"$in": ids}})} if ids else {}
+    data, clusters = [], set()
+    for hit, oid in zip(hits, ids):
+        # Questions deleted since they were indexed are skipped, and a
+        # cluster of duplicates answered together is listed once
+        doc = docs.get(oid)
+        if doc is None or doc.get("clusterId", oid) in clusters:
+            continue
+        clusters.add(doc.get("clusterId", oid))
+        data.append({**format_question(doc), "score": hit["score"]})
+    return {"success": True, "data": data, "query": q}
+
+@router.get("/questions/search/stats")
+async def get_search_stats():
+    return search_index.stats()
+
+@router.get("/questions/pending")
+async def get_pending_questions(limit: int = Query(50, ge=1, le=200), cursor: Optional[str] = None):
+    questions, pagination = await page_or_400(
+        read_db.questions,
+        query={"status": "pending"},
+        mode="priority",
+        limit=limit,
+        cursor=cursor,
+        projection={"rankBase": 0},
+    )
+    return {"success": True, "data": [serialize_doc(q) for q in questions], "pagination": pagination}
+
+@router.get("/questions/moderation/stats")
+async def get_moderation_stats():
+    return moderation.stats()
+
+@router.post("/questions", status_code=201)
+async def submit_question(input: QuestionCreate, request: Request):
+    admission.admit("questions", client_ip(request))
+    fan_id = await known_fan(input.fanId)
+    if fan_id is not None:
+        admission.admit_fan("questions", fan_id)
+    text = input.question.strip()
+    if not text:
+        raise HTTPException(status_code=400, detail="Question is required")
+    question = await moderation.submit(
+        {"fanName": input.fanName, "text": text, "createdAt": datetime.utcnow()},
+        fan_id=as_object_id(input.fanId),
+    )
+    search_index.upsert(question)
+    return {
+        "success": True,
+        "data": serialize_doc(question),
+        "message": "Question submitted successfully! Stephanie will answer soon.",
+    }
+
+@router.put("/questions/{question_id}/answer")
+async def answer_question(question_id: str, input: QuestionAnswer):
+    question_oid = as_object_id(question_id)
+    result = await moderation.resolve(answers=[(question_oid, input.answer)])
+    if result["missing"]:
+        raise HTTPException(status_code=404, detail="Question not found")
+    for doc in result["documents"]:
+        search_index.upsert(doc)
+    question = next(doc for doc in result["documents"] if doc["_id"] == question_oid)
+    return {
+        "success": True,
+        "data": serialize_doc(question),
+        "duplicatesAnswered": result["answered"] - 1,
+        "message": "Question answered successfully",
+    }
+
+@router.post("/questions/bulk")
+async def moderate_questions(input: QuestionBulkModeration):
+    """Answer and reject many questions, with their duplicates, in one write."""
+    answers = [(as_object_id(item.id), item.answer) for item in input.answers]
+    rejections = [as_object_id(question_id) for question_id in input.reject]
+    if len({question_id for question_id, _ in answers} | set(rejections)) < len(answers) + len(rejections):
+        raise HTTPException(status_code=400, detail="Each question may appear only once")
+    result = await moderation.resolve(answers, rejections)
+    for doc in result.pop("documents"):
+        if doc.get("status") == "rejected":
+            search_index.remove(doc["_id"])
+        else:
+            search_index.upsert(doc)
+    return {"success": True, "data": result}
+
+background_tasks = []
+
+async def startup(timer):
+    with timer.phase("indexes"):
+        await moderation.ensure_indexes()
+    with timer.phase("search_index"):
+        if not (search_index.load(search_snapshot_path) and await search_index.validate(db)):
+            await search_index.rebuild(db)
+        await search_index.sync(db)
+    with timer.phase("moderation"):
+        await moderation.load()
+        if worker["index"] == 0:
+            # One worker resolves and queues questions written through the Node API
+            await moderation.refresh()
+            await moderation.adopt()
+    if moderation_adopt_interval > 0:
+        background_tasks.append(asyncio.create_task(
+            moderation.run_sync_loop(moderation_adopt_interval, adopt=worker["index"] == 0)
+        ))
+    if search_sync_interval > 0:
+        background_tasks.append(asyncio.create_task(search_index.run_sync_loop(db, search_sync_interval)))
+
+async def shutdown():
+    for task in background_tasks:
+        task.cancel()
+    background_tasks.clear()
+    if worker["index"] == 0:
+        try:
+            search_index.save(search_snapshot_path)
+        except OSError:
+            logger.exception("Could not save the search index snapshot")
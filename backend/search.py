@@ -0,0 +1,343 @@
+"""Full-text search over the Q&A archive.
+
+``SearchIndex`` is an in-memory inverted index over question and answer
+text.  Text is accent-folded and lower-cased, Spanish stopwords are dropped
+and plurals are reduced, so "canción", "canciones" and "CANCION" all meet.
+Queries are ranked with BM25, and the last query term also matches as a
+prefix for type-ahead.  Documents are added, updated and removed one at a
+time as questions are submitted and answered.
+
+``save``/``load`` keep a gzipped snapshot of the per-document term counts;
+loading rebuilds the postings from those counts without tokenizing the
+corpus again, and ``sync`` then catches up with questions added or answered
+since the snapshot.
+
+A snapshot records the database it was built from and the largest ``_id``
+it holds; ``validate`` rejects one from another database or dataset.
+
+``sync`` fetches questions past the largest indexed ``_id`` and those whose
+``updatedAt`` (set by every moderation write) is past the watermark, re-read
+with a short overlap so writes committed slightly out of order are not
+missed.  Answers saved by the Node API, which sets no ``updatedAt``, are
+found by re-fetching the unanswered questions.  Finally the number of
+searchable questions in Mongo is compared with the index; on a mismatch
+(deletions, restores with old ids) the two id sets are diffed and fixed.
+"""
+import asyncio
+import gzip
+import json
+import logging
+import math
+import os
+import re
+import time
+import unicodedata
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+from bson import ObjectId
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 3
+
+# Set by moderation.resolve; rejected questions are not searchable
+REJECTED = "rejected"
+SEARCHABLE = {"status": {"$ne": REJECTED}}
+SYNC_OVERLAP = timedelta(seconds=5)
+SYNC_PROJECTION = {"text": 1, "answer": 1, "status": 1, "updatedAt": 1}
+
+STOPWORDS = frozenset("""
+a al algo algun alguna algunas alguno algunos ante antes como con contra cual cuando de del desde donde
+durante e el ella ellas ellos en entre era eres es esa esas ese eso esos esta estas este esto estos fue
+fueron ha han has hay la las le les lo los mas me mi mis mucho muy nada ni no nos o os para pero poco por
+porque que se sea ser si sin sobre son su sus tambien te tengo ti tu tus un una uno unos y ya yo
+""".split())
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def fold(text: str) -> str:
+    """Lower-case and strip accents (á -> a, ñ -> n, ü -> u)."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def stem(token: str) -> str:
+    # Plural reduction only: canciones -> cancion, fotos -> foto
+    if len(token) > 5 and token.endswith("es"):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    if not text:
+        return []
+    return [stem(token) for token in TOKEN_RE.findall(fold(text)) if token not in STOPWORDS]
+
+
+def _key(doc_id: Any) -> str:
+    return str(doc_id)
+
+
+class SearchIndex:
+    def __init__(self, k1: float = 1.2, b: float = 0.75, max_prefix_terms: int = 50):
+        self.k1 = k1
+        self.b = b
+        self.max_prefix_terms = max_prefix_terms
+        self._postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self._doc_terms: Dict[str, Dict[str, int]] = {}
+        self._doc_lengths: Dict[str, int] = {}
+        self._answered: Set[str] = set()
+        self._total_length = 0
+        # Sorted vocabulary for prefix lookups, rebuilt lazily after changes
+        self._vocabulary: List[str] = []
+        self._vocabulary_dirty = False
+        self.watermark: Optional[datetime] = None
+        self.last_id: Optional[ObjectId] = None
+        self.database: Optional[str] = None
+        self.loaded_from_snapshot = False
+
+    def __len__(self):
+        return len(self._doc_terms)
+
+    def _set_terms(self, key: str, terms: Dict[str, int], answered: bool):
+        self.remove(key)
+        for term, tf in terms.items():
+            if term not in self._postings:
+                self._vocabulary_dirty = True
+            self._postings[term][key] = tf
+        length = sum(terms.values())
+        self._doc_terms[key] = terms
+        self._doc_lengths[key] = length
+        self._total_length += length
+        if answered:
+            self._answered.add(key)
+
+    def _advance(self, doc: Dict[str, Any]):
+        updated = doc.get("updatedAt")
+        if isinstance(updated, datetime) and (self.watermark is None or updated > self.watermark):
+            self.watermark = updated
+        if isinstance(doc["_id"], ObjectId) and (self.last_id is None or doc["_id"] > self.last_id):
+            self.last_id = doc["_id"]
+
+    def upsert(self, doc: Dict[str, Any]):
+        """Index a question document (``_id``, ``text``, ``answer``)."""
+        terms = Counter(tokenize(doc.get("text")))
+        terms.update(tokenize(doc.get("answer")))
+        self._set_terms(_key(doc["_id"]), dict(terms), bool(doc.get("answer")))
+
+    def remove(self, doc_id: Any):
+        key = _key(doc_id)
+        terms = self._doc_terms.pop(key, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(key, None)
+                if not postings:
+                    del self._postings[term]
+                    self._vocabulary_dirty = True
+        self._total_length -= self._doc_lengths.pop(key, 0)
+        self._answered.discard(key)
+
+    def pending_ids(self) -> List[Any]:
+        return [ObjectId(key) if ObjectId.is_valid(key) else key for key in self._doc_terms if key not in self._answered]
+
+    def _expand_prefix(self, prefix: str) -> List[str]:
+        if self._vocabulary_dirty:
+            self._vocabulary = sorted(self._postings)
+            self._vocabulary_dirty = False
+        vocabulary = self._vocabulary
+        start = bisect_left(vocabulary, prefix)
+        matches = []
+        for term in vocabulary[start:start + self.max_prefix_terms]:
+            if not term.startswith(prefix):
+                break
+            matches.append(term)
+        return matches
+
+    def search(self, query: str, limit: int = 20, prefix: bool = True, answered_only: bool = True) -> List[Dict[str, Any]]:
+        """BM25-ranked ``[{"id", "score"}]``; the last term also matches as a prefix."""
+        raw = TOKEN_RE.findall(fold(query))
+        if not raw or not self._doc_terms:
+            return []
+        complete = raw[:-1] if prefix else raw
+        groups: List[List[str]] = [[stem(token)] for token in complete if token not in STOPWORDS]
+        if prefix:
+            # The word being typed is matched unstemmed and may still be a stopword
+            last = raw[-1]
+            groups.append(self._expand_prefix(last) or [stem(last)])
+
+        n_docs = len(self._doc_terms)
+        avg_length = self._total_length / n_docs if n_docs else 0.0
+        scores: Dict[str, float] = defaultdict(float)
+        for group in groups:
+            # Prefix expansions count once per document, with their best score
+            best: Dict[str, float] = {}
+            for term in group:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for key, tf in postings.items():
+                    norm = tf + self.k1 * (1 - self.b + self.b * self._doc_lengths[key] / avg_length)
+                    score = idf * tf * (self.k1 + 1) / norm
+                    if score > best.get(key, 0.0):
+                        best[key] = score
+            for key, score in best.items():
+                scores[key] += score
+
+        if answered_only:
+            scores = {key: score for key, score in scores.items() if key in self._answered}
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+        return [{"id": key, "score": round(score, 4)} for key, score in ranked]
+
+    async def rebuild(self, db):
+        self.__init__(self.k1, self.b, self.max_prefix_terms)
+        self.database = db.name
+        async for doc in db.questions.find(SEARCHABLE, SYNC_PROJECTION).batch_size(5000):
+            self._advance(doc)
+            self.upsert(doc)
+        logger.info("Search index built: %d questions, %d terms", len(self), len(self._postings))
+
+    async def validate(self, db) -> bool:
+        """Whether a loaded snapshot was built from this database's questions."""
+        if self.database != db.name:
+            logger.warning("Search snapshot is from database %r, not %r", self.database, db.name)
+            return False
+        if self.last_id is not None and await db.questions.find_one({"_id": self.last_id}, {"_id": 1}) is None:
+            logger.warning("Search snapshot holds questions this database does not")
+            return False
+        return True
+
+    def _apply(self, doc: Dict[str, Any]) -> str:
+        """Index or drop a fetched question; returns what changed."""
+        self._advance(doc)
+        key = _key(doc["_id"])
+        if doc.get("status") == REJECTED:
+            if key in self._doc_terms:
+                self.remove(key)
+                return "removed"
+            return ""
+        change = "added" if key not in self._doc_terms else ""
+        if not change and doc.get("answer") and key not in self._answered:
+            change = "answered"
+        self.upsert(doc)
+        return change
+
+    async def sync(self, db) -> Dict[str, int]:
+        """Catch up with questions added, answered, rejected or deleted since the last sync."""
+        changes: Counter = Counter()
+        clauses: List[Dict[str, Any]] = []
+        if self.last_id is not None:
+            clauses.append({"_id": {"$gt": self.last_id}})
+        if self.watermark is not None:
+            clauses.append({"updatedAt": {"$gte": self.watermark - SYNC_OVERLAP}})
+        query = {"$or": clauses} if clauses else {}
+        async for doc in db.questions.find(query, SYNC_PROJECTION):
+            changes[self._apply(doc)] += 1
+
+        pending = self.pending_ids()
+        for i in range(0, len(pending), 1000):
+            chunk = pending[i:i + 1000]
+            async for doc in db.questions.find(
+                {"_id": {"$in": chunk}, "answer": {"$nin": [None, ""]}}, SYNC_PROJECTION
+            ):
+                changes[self._apply(doc)] += 1
+
+        if await db.questions.count_documents(SEARCHABLE) != len(self):
+            await self._resync(db, changes)
+        return {"added": changes["added"], "answered": changes["answered"], "removed": changes["removed"]}
+
+    async def _resync(self, db, changes: Counter):
+        """Diff the indexed ids against Mongo's searchable ones."""
+        live = {doc["_id"] async for doc in db.questions.find(SEARCHABLE, {"_id": 1}).batch_size(10000)}
+        live_keys = {_key(doc_id) for doc_id in live}
+        for key in [key for key in self._doc_terms if key not in live_keys]:
+            self.remove(key)
+            changes["removed"] += 1
+        missing = [doc_id for doc_id in live if _key(doc_id) not in self._doc_terms]
+        for i in range(0, len(missing), 1000):
+            async for doc in db.questions.find({"_id": {"$in": missing[i:i + 1000]}}, SYNC_PROJECTION):
+                changes[self._apply(doc)] += 1
+        logger.info("Search index resynced with Mongo: %d questions", len(self))
+
+    async def run_sync_loop(self, db, interval: float):
+        # Picks up questions written by the Node API or other workers
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.sync(db)
+            except Exception:
+                logger.exception("Search index sync failed")
+
+    def save(self, path: Path):
+        """Write a gzipped snapshot of the forward index (atomic rename)."""
+        keys = list(self._doc_terms)
+        vocabulary = sorted(self._postings)
+        term_ids = {term: i for i, term in enumerate(vocabulary)}
+        snapshot = {
+            "version": SNAPSHOT_VERSION,
+            "saved_at": datetime.utcnow().isoformat(),
+            "database": self.database,
+            "watermark": self.watermark.isoformat() if self.watermark else None,
+            "last_id": str(self.last_id) if self.last_id else None,
+            "vocabulary": vocabulary,
+            "docs": keys,
+            "answered": [i for i, key in enumerate(keys) if key in self._answered],
+            # Flat [term_id, tf, term_id, tf, ...] per document
+            "terms": [
+                [n for term, tf in self._doc_terms[key].items() for n in (term_ids[term], tf)] for key in keys
+            ],
+        }
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=6) as f:
+            json.dump(snapshot, f, separators=(",", ":"), ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def load(self, path: Path) -> bool:
+        if not path.exists():
+            return False
+        started = time.perf_counter()
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable search snapshot %s: %s", path, e)
+            return False
+        if snapshot.get("version") != SNAPSHOT_VERSION:
+            return False
+        self.__init__(self.k1, self.b, self.max_prefix_terms)
+        vocabulary = snapshot["vocabulary"]
+        answered = set(snapshot["answered"])
+        for i, (key, flat) in enumerate(zip(snapshot["docs"], snapshot["terms"])):
+            terms = {vocabulary[flat[j]]: flat[j + 1] for j in range(0, len(flat), 2)}
+            self._set_terms(key, terms, i in answered)
+        self.database = snapshot["database"]
+        self.watermark = datetime.fromisoformat(snapshot["watermark"]) if snapshot["watermark"] else None
+        self.last_id = ObjectId(snapshot["last_id"]) if snapshot["last_id"] else None
+        self.loaded_from_snapshot = True
+        logger.info(
+            "Search index loaded from snapshot in %.0f ms: %d questions",
+            (time.perf_counter() - started) * 1000, len(self),
+        )
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "documents": len(self._doc_terms),
+            "answered": len(self._answered),
+            "terms": len(self._postings),
+            "avg_length": round(self._total_length / len(self._doc_terms), 2) if self._doc_terms else 0.0,
+            "watermark": self.watermark.isoformat() if self.watermark else None,
+            "last_id": str(self.last_id) if self.last_id else None,
+            "loaded_from_snapshot": self.loaded_from_snapshot,
+        }
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for the GET /api/status serialization path.
+
+Compares the original path (build StatusCheck models, let FastAPI validate
+them against response_model=List[StatusCheck] and encode with the default
+JSON encoder) with the fast_json modes at several document counts.
+
+    python serialization_bench.py --sizes 1000,10000,100000 --repeat 5
+"""
+import asyncio
+import json
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import List
+
+import typer
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from pydantic import BaseModel, Field
+
+from fast_json import FastJSONResponse, build_models
+
+cli = typer.Typer(add_completion=False)
+
+
+# Mirrors status_api.StatusCheck without importing the app and its Mongo client
+class StatusCheck(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    client_name: str
+    timestamp: datetime = Field(default_factory=datetime.utcnow)
+
+
+RESPONSE_FIELD = create_response_field(name="Response_get_status_checks", type_=List[StatusCheck])
+
+
+def make_documents(count: int):
+    start = datetime(2024, 1, 1)
+    return [
+        {
+            "_id": ObjectId(),
+            "id": str(uuid.uuid4()),
+            "client_name": f"client-{i % 300}",
+            "timestamp": start + timedelta(seconds=i),
+        }
+        for i in range(count)
+    ]
+
+
+async def original_path(docs):
+    models = [StatusCheck(**doc) for doc in docs]
+    content = await serialize_response(field=RESPONSE_FIELD, response_content=models, is_coroutine=True)
+    return JSONResponse(content).body
+
+
+async def validated_fast(docs):
+    content = await serialize_response(
+        field=RESPONSE_FIELD, response_content=build_models(StatusCheck, docs, "validated"), is_coroutine=True
+    )
+    return FastJSONResponse(content).body
+
+
+async def construct_fast(docs):
+    return FastJSONResponse(build_models(StatusCheck, docs, "construct")).body
+
+
+async def raw_fast(docs):
+    return FastJSONResponse(build_models(StatusCheck, docs, "raw")).body
+
+
+PATHS = {
+    "original": original_path,
+    "validated+orjson": validated_fast,
+    "construct+orjson": construct_fast,
+    "raw+orjson": raw_fast,
+}
+
+
+async def measure(path, docs, repeat):
+    timings = []
+    body = b""
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = await path(docs)
+        timings.append((time.perf_counter() - started) * 1000)
+    return {"median_ms": round(statistics.median(timings), 3), "min_ms": round(min(timings), 3), "bytes": len(body)}
+
+
+@cli.command()
+def main(
+    sizes: str = typer.Option("1000,10000,100000", help="Comma-separated document counts"),
+    repeat: int = typer.Option(5, help="Runs per path and size"),
+):
+    """Print a JSON table of serialization timings per path and size"""
+    results = {}
+    for size in [int(s) for s in sizes.split(",")]:
+        docs = make_documents(size)
+        row = {}
+        for name, path in PATHS.items():
+            row[name] = asyncio.run(measure(path, docs, repeat))
+        baseline = row["original"]["median_ms"]
+        for name, stats in row.items():
+            stats["speedup"] = round(baseline / stats["median_ms"], 2) if stats["median_ms"] else None
+        results[size] = row
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    cli()
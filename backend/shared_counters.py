@@ -0,0 +1,326 @@
+"""Hot counters shared between pre-forked workers.
+
+In multi-worker mode (see ``launcher.py``) per-outfit vote counts and
+download counters live in a ``multiprocessing.shared_memory`` table instead
+of being ``$inc``'d by every worker.  Workers add to a slot under one of a
+fixed set of striped locks; one designated worker flushes the accumulated
+deltas to Mongo in batches and writes the resulting totals back, so every
+worker reads the same numbers without a network hop per vote.
+
+An update that cannot use the table -- its stripe is full, or its lock is
+not released within ``lock_timeout`` -- raises ``CounterUnavailable`` before
+changing anything, and the caller ``$inc``s Mongo directly instead.  Each
+stripe records the pid holding its lock, so when a worker dies mid-update
+the launcher releases the locks it held (``release_locks_of``).
+
+Each slot keeps ``total`` (the value readers see) and ``pending`` (the part
+not yet written to Mongo).  A flush takes ``pending``, ``$inc``s it, reads
+the new Mongo value and sets ``total`` to that value plus whatever arrived
+meanwhile; ``seeded`` marks slots whose total includes the Mongo base.
+``count`` only ever grows by the increments themselves, so a worker can
+apply other workers' increments to its own in-memory state as deltas.
+Keys are ``collection:doc_id:field`` strings, like ``CounterService`` names.
+"""
+import asyncio
+import contextlib
+import functools
+import hashlib
+import logging
+import os
+from collections import defaultdict
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from vote_ingest import as_object_id
+
+logger = logging.getLogger(__name__)
+
+KEY_BYTES = 48
+
+
+@functools.lru_cache(maxsize=None)
+def slot_dtype():
+    # numpy is only imported when a table exists, i.e. under launcher.py
+    import numpy as np
+
+    return np.dtype([
+        ("hash", "<u8"),
+        ("total", "<i8"),
+        ("pending", "<i8"),
+        ("count", "<i8"),
+        ("seeded", "<i8"),
+        ("key", f"S{KEY_BYTES}"),
+    ])
+
+
+class CounterUnavailable(RuntimeError):
+    """The table cannot take this update; apply it to Mongo directly."""
+
+
+class TableFull(CounterUnavailable):
+    pass
+
+
+class StripeLocked(CounterUnavailable):
+    pass
+
+
+def counter_key(collection: str, doc_id: Any, field: str) -> str:
+    return f"{collection}:{doc_id}:{field}"
+
+
+def _hash(key: bytes) -> int:
+    # Stable across processes, unlike hash(); 0 marks an empty slot
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little") or 1
+
+
+class SharedCounterTable:
+    """Fixed-capacity open-addressing table in shared memory.
+
+    The slots are split into ``stripes`` regions, each guarded by its own
+    lock; a key hashes to one stripe and probes linearly inside it, so an
+    update only ever takes that stripe's lock.  Create it in the launcher
+    before forking: the locks and the mapping are inherited by the workers.
+    """
+
+    def __init__(
+        self, shm: shared_memory.SharedMemory, capacity: int, locks: List[Any], owners, lock_timeout: float = 1.0,
+    ):
+        self.shm = shm
+        self.capacity = capacity
+        self.locks = locks
+        # Pid holding each stripe's lock, 0 when free
+        self.owners = owners
+        self.lock_timeout = lock_timeout
+        self.stripes = len(locks)
+        self.per_stripe = capacity // self.stripes
+        import numpy as np
+
+        self.slots = np.ndarray((capacity,), dtype=slot_dtype(), buffer=shm.buf)
+        # Per process: counts already applied, and this process's own increments
+        self._last_counts = np.zeros(capacity, dtype="<i8")
+        self._own: Dict[int, int] = defaultdict(int)
+
+    @classmethod
+    def create(
+        cls, ctx, capacity: int = 65_536, stripes: int = 64, lock_timeout: float = 1.0,
+    ) -> "SharedCounterTable":
+        capacity -= capacity % stripes
+        shm = shared_memory.SharedMemory(create=True, size=capacity * slot_dtype().itemsize)
+        owners = ctx.Array("q", stripes, lock=False)
+        table = cls(shm, capacity, [ctx.Lock() for _ in range(stripes)], owners, lock_timeout)
+        table.slots[:] = 0
+        return table
+
+    def close(self, unlink: bool = False):
+        del self.slots
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+    @contextlib.contextmanager
+    def _stripe(self, h: int):
+        stripe = h % self.stripes
+        if not self.locks[stripe].acquire(timeout=self.lock_timeout):
+            raise StripeLocked(f"Shared counter stripe {stripe} is held by pid {self.owners[stripe]}")
+        self.owners[stripe] = os.getpid()
+        try:
+            yield
+        finally:
+            self.owners[stripe] = 0
+            self.locks[stripe].release()
+
+    def release_locks_of(self, pid: int) -> int:
+        """Free the stripe locks a dead process held; returns how many."""
+        released = 0
+        for stripe in range(self.stripes):
+            if self.owners[stripe] == pid:
+                self.owners[stripe] = 0
+                self.locks[stripe].release()
+                released += 1
+        return released
+
+    def _find(self, key: bytes, h: int, insert: bool) -> Optional[int]:
+        """Slot index for ``key``; call with the key's stripe lock held."""
+        stripe = h % self.stripes
+        base = stripe * self.per_stripe
+        start = (h // self.stripes) % self.per_stripe
+        slots = self.slots
+        for probe in range(self.per_stripe):
+            index = base + (start + probe) % self.per_stripe
+            slot_hash = int(slots["hash"][index])
+            if slot_hash == 0:
+                if not insert:
+                    return None
+                slots["hash"][index] = h
+                slots["key"][index] = key
+                return index
+            if slot_hash == h and slots["key"][index] == key:
+                return index
+        if insert:
+            raise TableFull(f"Shared counter stripe {stripe} is full")
+        return None
+
+    def incr(self, key: str, amount: int = 1) -> Tuple[int, bool]:
+        """Add ``amount``; returns ``(total, seeded)``."""
+        raw = key.encode()
+        if len(raw) > KEY_BYTES:
+            raise ValueError(f"Counter key too long: {key}")
+        h = _hash(raw)
+        with self._stripe(h):
+            index = self._find(raw, h, insert=True)
+            slot = self.slots[index]
+            slot["total"] += amount
+            slot["pending"] += amount
+            slot["count"] += amount
+            self._own[index] += amount
+            return int(slot["total"]), bool(slot["seeded"])
+
+    def get(self, key: str) -> Optional[Tuple[int, bool]]:
+        raw = key.encode()
+        h = _hash(raw)
+        with self._stripe(h):
+            index = self._find(raw, h, insert=False)
+            if index is None:
+                return None
+            slot = self.slots[index]
+            return int(slot["total"]), bool(slot["seeded"])
+
+    def take_pending(self) -> Dict[str, int]:
+        """Zero and return every slot's unflushed delta."""
+        taken = {}
+        for index in self.slots["pending"].nonzero()[0]:
+            try:
+                with self._stripe(int(self.slots["hash"][index])):
+                    amount = int(self.slots["pending"][index])
+                    if amount:
+                        self.slots["pending"][index] = 0
+                        taken[self.slots["key"][index].decode()] = amount
+            except StripeLocked:
+                # Left pending for the next flush
+                continue
+        return taken
+
+    def settle(self, key: str, mongo_value: Optional[int], amount: int):
+        """Record a flush result: the new Mongo value, or a failure (``None``)."""
+        raw = key.encode()
+        h = _hash(raw)
+        with self._stripe(h):
+            index = self._find(raw, h, insert=False)
+            if index is None:
+                return
+            slot = self.slots[index]
+            if mongo_value is None:
+                slot["pending"] += amount
+            else:
+                slot["total"] = mongo_value + slot["pending"]
+                slot["seeded"] = 1
+
+    def foreign_deltas(self) -> Dict[str, int]:
+        """Increments made by other processes since this one last asked.
+
+        A lock-free vectorised scan: each count is a single aligned word, so
+        a reader sees either the old or the new value, and anything it misses
+        shows up on the next call.
+        """
+        counts = self.slots["count"].copy()
+        indexes = (counts != self._last_counts).nonzero()[0]
+        deltas = {}
+        for index in indexes:
+            delta = int(counts[index] - self._last_counts[index]) - self._own.pop(index, 0)
+            if delta:
+                deltas[self.slots["key"][index].decode()] = delta
+        self._last_counts[indexes] = counts[indexes]
+        return deltas
+
+    def stats(self) -> Dict[str, Any]:
+        used = int((self.slots["hash"] != 0).sum())
+        return {
+            "capacity": self.capacity,
+            "stripes": self.stripes,
+            "used": used,
+            "load": round(used / self.capacity, 4),
+            "pending": int(self.slots["pending"].sum()),
+        }
+
+
+class SharedCounterFlusher:
+    """Runs in the designated worker and writes table deltas to Mongo."""
+
+    def __init__(self, table: SharedCounterTable, db, interval_ms: int = 100):
+        self.table = table
+        self.db = db
+        self.interval = interval_ms / 1000
+        self.flushes = 0
+        self.failures = 0
+        self.last_keys = 0
+        # Failed deltas whose stripe was locked when they were handed back
+        self._carry: Dict[str, int] = defaultdict(int)
+
+    def _settle(self, key: str, mongo_value: Optional[int], amount: int):
+        try:
+            self.table.settle(key, mongo_value, amount)
+        except StripeLocked:
+            # A stored value only refreshes the total; a failed delta must not be lost
+            if mongo_value is None:
+                self._carry[key] += amount
+
+    async def flush(self) -> int:
+        taken = self.table.take_pending()
+        for key, amount in self._carry.items():
+            taken[key] = taken.get(key, 0) + amount
+        self._carry.clear()
+        if not taken:
+            return 0
+        groups: Dict[Tuple[str, str], Dict[Any, Tuple[str, int]]] = defaultdict(dict)
+        for key, amount in taken.items():
+            collection, doc_id, field = key.split(":", 2)
+            groups[(collection, field)][as_object_id(doc_id)] = (key, amount)
+
+        for (collection, field), docs in groups.items():
+            try:
+                await self.db[collection].bulk_write(
+                    [UpdateOne({"_id": doc_id}, {"$inc": {field: amount}}) for doc_id, (_, amount) in docs.items()],
+                    ordered=False,
+                )
+                values = {
+                    doc["_id"]: doc.get(field, 0)
+                    async for doc in self.db[collection].find({"_id": {"$in": list(docs)}}, {field: 1})
+                }
+            except Exception:
+                logger.exception("Shared counter flush failed for %s.%s", collection, field)
+                self.failures += 1
+                for key, amount in docs.values():
+                    self._settle(key, None, amount)
+                continue
+            for doc_id, (key, amount) in docs.items():
+                # Documents that no longer exist keep counting from zero
+                self._settle(key, values.get(doc_id, 0), amount)
+        self.flushes += 1
+        self.last_keys = len(taken)
+        return len(taken)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Shared counter flush loop error")
+
+    def stats(self) -> Dict[str, Any]:
+        return {"flushes": self.flushes, "failures": self.failures, "last_keys": self.last_keys}
+
+
+# Set by the launcher in each worker before the app is imported
+_runtime: Dict[str, Any] = {"table": None, "flusher": False, "workers": 1, "index": 0}
+
+
+def install(table: SharedCounterTable, flusher: bool, workers: int, index: int):
+    _runtime.update(table=table, flusher=flusher, workers=workers, index=index)
+
+
+def runtime() -> Dict[str, Any]:
+    return dict(_runtime)
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Cold start benchmark for the backend app.
+
+Times ``import server`` in a fresh interpreter and lists the heavy modules
+it loaded, then starts ``uvicorn server:app`` ``--repeat`` times and times
+each from spawn to the first 200 from ``/health``, to ``/api/health``
+reporting every preloaded feature ready, and to the first successful
+``--probe`` request (a real API route).  Exits 1 when the median time to the
+first response exceeds ``--budget-ms``, the median time to ready or to the
+probe exceeds ``--ready-budget-ms``, a run never gets ready, or importing
+the app loads a ``--forbid`` module, so a regression fails the build:
+
+    python startup_bench.py --repeat 5 --budget-ms 1500 --ready-budget-ms 4000
+"""
+import json
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import typer
+
+BACKEND_DIR = Path(__file__).parent
+
+cli = typer.Typer(add_completion=False)
+
+IMPORT_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = (time.perf_counter() - started) * 1000
+print(json.dumps({{"ms": elapsed, "modules": sorted({{name.split(".")[0] for name in sys.modules}})}}))
+"""
+
+
+def import_time(module: str) -> Dict[str, Any]:
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE.format(module=module)],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(
+    url: str, accept: Callable[[Any], bool], started: float, timeout_s: float, process: subprocess.Popen,
+) -> Tuple[Optional[float], Any]:
+    """Poll ``url`` until its JSON body is accepted; ms since ``started``, or None on timeout."""
+    body = None
+    while time.perf_counter() - started < timeout_s:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with status {process.returncode}")
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                body = json.load(response)
+            if accept(body):
+                return round((time.perf_counter() - started) * 1000, 1), body
+        except (OSError, ValueError):
+            # Not listening yet, or answering 503 while features load
+            pass
+        time.sleep(0.005)
+    return None, body
+
+
+def cold_start(app: str, timeout_s: float, ready_timeout_s: float, probe: str) -> Dict[str, Any]:
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryFile() as log:
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", app, "--port", str(port), "--log-level", "warning"],
+            cwd=BACKEND_DIR, stdout=log, stderr=log,
+        )
+        try:
+            first_response_ms, _ = wait_for(f"{base_url}/health", lambda body: True, started, timeout_s, process)
+            if first_response_ms is None:
+                raise RuntimeError(f"no response from /health within {timeout_s}s")
+            ready_ms, health, probe_ms = (None, None, None)
+            if ready_timeout_s > 0:
+                ready_ms, health = wait_for(
+                    f"{base_url}/api/health", lambda body: body["success"], started, ready_timeout_s, process,
+                )
+                if probe and ready_ms is not None:
+                    probe_ms, _ = wait_for(
+                        f"{base_url}{probe}", lambda body: body["success"], started, ready_timeout_s, process,
+                    )
+            if health is None:
+                _, health = wait_for(f"{base_url}/api/health", lambda body: True, started, timeout_s, process)
+        except RuntimeError:
+            log.seek(0)
+            sys.stderr.write(log.read().decode(errors="replace")[-4000:])
+            raise
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+    return {
+        "first_response_ms": first_response_ms,
+        "ready_ms": ready_ms,
+        "probe_ms": probe_ms,
+        "features": {name: feature["status"] for name, feature in health["data"]["features"].items()},
+        "startup": health["data"]["startup"],
+    }
+
+
+@cli.command()
+def main(
+    repeat: int = typer.Option(5, help="Cold starts to measure"),
+    budget_ms: float = typer.Option(1500.0, help="Fail when the median time to the first /health response exceeds this"),
+    ready_budget_ms: float = typer.Option(
+        4000.0, help="Fail when the median time to ready, or to the first --probe response, exceeds this",
+    ),
+    ready_timeout: float = typer.Option(10.0, help="Seconds to wait for every preloaded feature; 0 skips"),
+    probe: str = typer.Option("/api/outfits", help="API path timed after readiness; empty skips"),
+    forbid: str = typer.Option("numpy,pandas,PIL,motor,pymongo,typer", help="Comma-separated modules importing the app must not load"),
+    app: str = typer.Option("server:app", help="ASGI app import path"),
+    timeout: float = typer.Option(30.0, help="Seconds to wait for the first response"),
+):
+    """Print a JSON report of import and cold start timings; exit 1 past the budget"""
+    imported = import_time(app.split(":")[0])
+    eager = sorted(set(forbid.split(",")) & set(imported["modules"]))
+    runs = [cold_start(app, timeout, ready_timeout, probe) for _ in range(repeat)]
+    first_response = [run["first_response_ms"] for run in runs]
+    ready = [run["ready_ms"] for run in runs if run["ready_ms"] is not None]
+    probed = [run["probe_ms"] for run in runs if run["probe_ms"] is not None]
+    report = {
+        "import_ms": round(imported["ms"], 1),
+        "eager_imports": eager,
+        "first_response_ms": {
+            "median": round(statistics.median(first_response), 1),
+            "min": min(first_response),
+            "max": max(first_response),
+        },
+        "ready_ms": {"median": round(statistics.median(ready), 1), "runs": len(ready)} if ready else None,
+        "probe_ms": {"median": round(statistics.median(probed), 1), "runs": len(probed)} if probed else None,
+        "budget_ms": budget_ms,
+        "ready_budget_ms": ready_budget_ms,
+        # Phase breakdown of the last run, as reported by /api/health
+        "features": runs[-1]["features"],
+        "startup": runs[-1]["startup"],
+    }
+    print(json.dumps(report, indent=2))
+    failures = []
+    if report["first_response_ms"]["median"] > budget_ms:
+        failures.append(f"median first response {report['first_response_ms']['median']} ms exceeds {budget_ms} ms")
+    if ready_timeout > 0:
+        if len(ready) < repeat:
+            failures.append(f"{repeat - len(ready)} of {repeat} runs were not ready within {ready_timeout}s")
+        elif report["ready_ms"]["median"] > ready_budget_ms:
+            failures.append(f"median time to ready {report['ready_ms']['median']} ms exceeds {ready_budget_ms} ms")
+        if probe and len(probed) < repeat:
+            failures.append(f"{repeat - len(probed)} of {repeat} runs got no {probe} response within {ready_timeout}s")
+        elif probe and report["probe_ms"]["median"] > ready_budget_ms:
+            failures.append(f"median first {probe} response {report['probe_ms']['median']} ms exceeds {ready_budget_ms} ms")
+    if eager:
+        failures.append(f"importing {app} loads {', '.join(eager)}")
+    for failure in failures:
+        typer.echo(f"FAIL: {failure}", err=True)
+    if failures:
+        raise typer.Exit(code=1)
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,111 @@
+"""Status check heartbeats: ``/api/status``."""
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Literal, Optional
+
+from fastapi import APIRouter, HTTPException, Query, Response
+from pydantic import BaseModel, Field
+
+from core import SERIALIZATION_MODE, db, naive_utc, page_or_400, read_db, response_cache
+from fast_json import FastJSONResponse, build_models, projection_for
+from heartbeats import HeartbeatIngestor, Retention
+
+
+class StatusCheck(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    client_name: str
+    timestamp: datetime = Field(default_factory=datetime.utcnow)
+
+class StatusCheckCreate(BaseModel):
+    client_name: str
+
+STATUS_CHECK_PROJECTION = projection_for(StatusCheck)
+
+# Status check heartbeats are written in batches to a time-series collection
+# and rolled up into 1 minute / 1 hour buckets on the way in
+heartbeats = HeartbeatIngestor(
+    db,
+    Retention(
+        raw_s=int(os.environ.get('HEARTBEAT_RAW_TTL_S', str(2 * 86400))),
+        minute_s=int(os.environ.get('HEARTBEAT_1M_TTL_S', str(30 * 86400))),
+        hour_s=int(os.environ.get('HEARTBEAT_1H_TTL_S', str(400 * 86400))),
+    ),
+    flush_interval_ms=int(os.environ.get('HEARTBEAT_FLUSH_INTERVAL_MS', '1000')),
+    max_batch=int(os.environ.get('HEARTBEAT_FLUSH_MAX_BATCH', '1000')),
+    max_buffer=int(os.environ.get('HEARTBEAT_MAX_BUFFER', '50000')),
+)
+heartbeat_stale_after = float(os.environ.get('HEARTBEAT_STALE_AFTER_S', '300'))
+heartbeats.add_listener(lambda: response_cache.invalidate('status'))
+
+router = APIRouter(prefix="/api", default_response_class=FastJSONResponse)
+
+@router.post("/status", response_model=StatusCheck)
+async def create_status_check(input: StatusCheckCreate):
+    status_dict = input.dict()
+    status_obj = StatusCheck(**status_dict)
+    heartbeats.record(status_obj.dict())
+    return status_obj
+
+@router.get("/status", response_model=List[StatusCheck])
+@response_cache.cached(ttl=5, tags=['status'])
+async def get_status_checks(
+    response: Response,
+    limit: int = Query(1000, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    client_name: Optional[str] = None,
+):
+    status_checks, pagination = await page_or_400(
+        read_db.heartbeats,
+        query={"client_name": client_name} if client_name else None,
+        mode="latest",
+        limit=limit,
+        cursor=cursor,
+        projection=STATUS_CHECK_PROJECTION,
+        with_total=False,
+    )
+    headers = {"X-Next-Cursor": pagination["nextCursor"]} if pagination["nextCursor"] else {}
+    if SERIALIZATION_MODE == "validated":
+        response.headers.update(headers)
+        return [StatusCheck(**status_check) for status_check in status_checks]
+    # Documents we wrote ourselves skip response_model revalidation
+    return FastJSONResponse(build_models(StatusCheck, status_checks, SERIALIZATION_MODE), headers=headers)
+
+@router.get("/status/clients")
+@response_cache.cached(ttl=5, tags=['status'])
+async def get_status_clients(limit: int = Query(500, ge=1, le=5000)):
+    return {"success": True, "data": await heartbeats.latest(limit, heartbeat_stale_after)}
+
+@router.get("/status/series")
+@response_cache.cached(ttl=5, tags=['status'])
+async def get_status_series(
+    client_name: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    resolution: Literal['auto', '1m', '1h'] = 'auto',
+    max_points: int = Query(1440, ge=10, le=10000),
+):
+    until = naive_utc(until) or datetime.utcnow()
+    since = naive_utc(since) or until - timedelta(hours=24)
+    if since >= until:
+        raise HTTPException(status_code=400, detail="since must be earlier than until")
+    tier = heartbeats.pick_tier(since, until, max_points) if resolution == 'auto' else resolution
+    return {
+        "success": True,
+        "data": await heartbeats.series(since, until, tier, client_name),
+        "resolution": tier,
+        "since": since,
+        "until": until,
+    }
+
+@router.get("/status/ingest/stats")
+async def get_heartbeat_stats():
+    return heartbeats.stats()
+
+async def startup(timer):
+    with timer.phase("collections"):
+        await heartbeats.ensure_collections()
+    heartbeats.start()
+
+async def shutdown():
+    await heartbeats.stop()
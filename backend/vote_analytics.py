@@ -0,0 +1,280 @@
+"""Hourly vote rollups.
+
+One document per (outfit, hour) in ``vote_rollups`` holds the vote total and
+a count per reaction.  Every vote flush ``$inc``s the affected buckets and
+the running total in ``vote_totals`` before its votes are acknowledged, so
+stats are answered from O(buckets) documents instead of counting or loading
+raw votes.  Increments from a failed write are kept and retried with the
+next batch.  ``backfill`` rebuilds the rollups and the total from the raw
+``votes`` collection in chunks, grouping each chunk with pandas.
+"""
+import contextlib
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+# Stored under ASCII field names; the API keys reactions by emoji
+REACTIONS = {"💖": "heart", "🔥": "fire", "👏": "clap"}
+REACTION_EMOJI = {name: emoji for emoji, name in REACTIONS.items()}
+
+TOTAL_ID = "all"
+
+Bucket = Tuple[Any, datetime]
+
+
+def hour_bucket(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def _bucket_id(outfit_id: Any, hour: datetime) -> str:
+    return f"{outfit_id}:{hour:%Y%m%d%H}"
+
+
+def _inc_op(outfit_id: Any, hour: datetime, counts: Dict[str, int]) -> UpdateOne:
+    inc = {f"reactions.{name}": n for name, n in counts.items()}
+    inc["total"] = sum(counts.values())
+    return UpdateOne(
+        {"_id": _bucket_id(outfit_id, hour)},
+        {"$inc": inc, "$setOnInsert": {"outfitId": outfit_id, "hour": hour}},
+        upsert=True,
+    )
+
+
+def _merge(into: Dict[Bucket, Dict[str, int]], buckets: Dict[Bucket, Dict[str, int]]):
+    for key, counts in buckets.items():
+        target = into.setdefault(key, defaultdict(int))
+        for name, n in counts.items():
+            target[name] += n
+
+
+class VoteAnalytics:
+    def __init__(self, db, backfill_chunk: int = 200_000):
+        self.db = db
+        self.backfill_chunk = backfill_chunk
+        self.backfill_running = False
+        self.last_backfill: Optional[Dict[str, Any]] = None
+        # Increments whose write failed, retried with the next batch
+        self._unapplied: Dict[Bucket, Dict[str, int]] = {}
+        self._unapplied_total = 0
+        # Increments written while a backfill runs; its ``$set``s add them back
+        self._live: Optional[Dict[Bucket, Dict[str, int]]] = None
+        self._live_total = 0
+
+    async def ensure_indexes(self):
+        await self.db.vote_rollups.create_index([("hour", ASCENDING)])
+        await self.db.vote_rollups.create_index([("outfitId", ASCENDING), ("hour", ASCENDING)])
+
+    async def record(self, votes: Iterable[Any]):
+        """Vote-ingestor writer: ``$inc`` the hourly buckets and the running total for a batch."""
+        buckets: Dict[Bucket, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        for vote in votes:
+            buckets[(vote.outfit_id, hour_bucket(vote.created_at))][REACTIONS.get(vote.reaction, "other")] += 1
+        await self._apply(buckets)
+
+    async def retry(self):
+        """Write increments a failed batch left behind."""
+        if self._unapplied or self._unapplied_total:
+            await self._apply({})
+
+    async def _apply(self, buckets: Dict[Bucket, Dict[str, int]]):
+        # Carry earlier failures along with this batch
+        _merge(buckets, self._unapplied)
+        self._unapplied = {}
+        total, self._unapplied_total = self._unapplied_total, 0
+        keys = list(buckets)
+        failed = set()
+        try:
+            if keys:
+                try:
+                    await self.db.vote_rollups.bulk_write(
+                        [_inc_op(outfit_id, hour, buckets[(outfit_id, hour)]) for outfit_id, hour in keys],
+                        ordered=False,
+                    )
+                except BulkWriteError as e:
+                    # Unordered: only the listed updates failed
+                    failed = {error["index"] for error in e.details.get("writeErrors", [])}
+                    raise
+                except Exception:
+                    failed = set(range(len(keys)))
+                    raise
+        finally:
+            for index, key in enumerate(keys):
+                if index in failed:
+                    _merge(self._unapplied, {key: buckets[key]})
+                else:
+                    total += sum(buckets[key].values())
+                    if self._live is not None:
+                        _merge(self._live, {key: buckets[key]})
+            if failed:
+                logger.error("Vote rollup update failed; %d buckets kept for retry", len(failed))
+            await self._add_total(total)
+
+    async def _add_total(self, n: int):
+        if not n:
+            return
+        try:
+            await self.db.vote_totals.update_one({"_id": TOTAL_ID}, {"$inc": {"total": n}}, upsert=True)
+        except Exception:
+            self._unapplied_total += n
+            logger.exception("Vote total update failed; kept for retry")
+            return
+        if self._live is not None:
+            self._live_total += n
+
+    async def totals(self, since: Optional[datetime] = None) -> int:
+        if since is None:
+            doc = await self.db.vote_totals.find_one({"_id": TOTAL_ID})
+            return doc["total"] if doc else 0
+        pipeline = [
+            {"$match": {"hour": {"$gte": hour_bucket(since)}}},
+            {"$group": {"_id": None, "total": {"$sum": "$total"}}},
+        ]
+        result = await self.db.vote_rollups.aggregate(pipeline).to_list(1)
+        return result[0]["total"] if result else 0
+
+    async def outfit_reactions(self, outfit_id: Any) -> Dict[str, Any]:
+        group = {"_id": None, "total": {"$sum": "$total"}}
+        for name in REACTION_EMOJI:
+            group[name] = {"$sum": f"$reactions.{name}"}
+        result = await self.db.vote_rollups.aggregate(
+            [{"$match": {"outfitId": outfit_id}}, {"$group": group}]
+        ).to_list(1)
+        row = result[0] if result else {}
+        reactions = {
+            emoji: row.get(name, 0) for name, emoji in REACTION_EMOJI.items() if row.get(name)
+        }
+        return {"reactions": reactions, "total": row.get("total", 0)}
+
+    async def timeline(self, outfit_id: Any = None, hours: int = 24) -> List[Dict[str, Any]]:
+        since = hour_bucket(datetime.utcnow()) - timedelta(hours=hours - 1)
+        match: Dict[str, Any] = {"hour": {"$gte": since}}
+        if outfit_id is not None:
+            match["outfitId"] = outfit_id
+        group = {"_id": "$hour", "total": {"$sum": "$total"}}
+        for name in REACTION_EMOJI:
+            group[name] = {"$sum": f"$reactions.{name}"}
+        rows = await self.db.vote_rollups.aggregate(
+            [{"$match": match}, {"$group": group}, {"$sort": {"_id": 1}}]
+        ).to_list(hours)
+        return [
+            {
+                "hour": row["_id"],
+                "total": row["total"],
+                "reactions": {emoji: row.get(name, 0) for name, emoji in REACTION_EMOJI.items()},
+            }
+            for row in rows
+        ]
+
+    async def backfill(self, pause=None) -> Dict[str, Any]:
+        """Rebuild every bucket and the running total from raw votes.
+
+        ``pause`` (``VoteIngestor.paused``) holds vote flushes while a cutoff
+        ``_id`` is taken, and again around each batch of ``$set``s.  Votes up
+        to the cutoff are scanned; increments written since are tracked and
+        added to the buckets they land in, so live votes are neither lost to
+        a ``$set`` nor counted twice.
+        """
+        import pandas as pd
+
+        if self.backfill_running:
+            raise RuntimeError("Backfill already running")
+        self.backfill_running = True
+        started = datetime.utcnow()
+        try:
+            async with _paused(pause):
+                # Later votes get larger ids; anything still failing is covered by the scan
+                cutoff = ObjectId()
+                self._live, self._live_total = {}, 0
+                self._unapplied, self._unapplied_total = {}, 0
+            frames = []
+            # ObjectIds are grouped by their string form; this maps them back
+            outfit_ids: Dict[str, Any] = {}
+            chunk: List[Dict[str, Any]] = []
+            scanned = 0
+            cursor = self.db.votes.find(
+                {"_id": {"$lte": cutoff}}, {"outfitId": 1, "reaction": 1, "createdAt": 1, "_id": 0}
+            ).batch_size(10_000)
+            async for vote in cursor:
+                chunk.append(vote)
+                if len(chunk) >= self.backfill_chunk:
+                    frames.append(_group_chunk(pd, chunk, outfit_ids))
+                    scanned += len(chunk)
+                    chunk = []
+            if chunk:
+                frames.append(_group_chunk(pd, chunk, outfit_ids))
+                scanned += len(chunk)
+
+            buckets: Dict[Bucket, Dict[str, int]] = {}
+            if frames:
+                grouped = pd.concat(frames).fillna(0).groupby(level=[0, 1]).sum()
+                for (outfit_key, hour), row in grouped.iterrows():
+                    buckets[(outfit_ids.get(outfit_key, outfit_key), hour.to_pydatetime())] = {
+                        name: int(row[name]) for name in grouped.columns if name != "total" and row[name]
+                    }
+            keys = list(buckets)
+            for i in range(0, len(keys), 5000):
+                async with _paused(pause):
+                    ops = []
+                    for outfit_id, hour in keys[i:i + 5000]:
+                        reactions = dict(buckets[(outfit_id, hour)])
+                        for name, n in self._live.pop((outfit_id, hour), {}).items():
+                            reactions[name] = reactions.get(name, 0) + n
+                        ops.append(UpdateOne(
+                            {"_id": _bucket_id(outfit_id, hour)},
+                            {"$set": {"outfitId": outfit_id, "hour": hour,
+                                      "total": sum(reactions.values()), "reactions": reactions}},
+                            upsert=True,
+                        ))
+                    await self.db.vote_rollups.bulk_write(ops, ordered=False)
+            async with _paused(pause):
+                await self.db.vote_totals.update_one(
+                    {"_id": TOTAL_ID}, {"$set": {"total": scanned + self._live_total}}, upsert=True
+                )
+
+            self.last_backfill = {
+                "votes_scanned": scanned,
+                "buckets_written": len(keys),
+                "cutoff": str(cutoff),
+                "seconds": round((datetime.utcnow() - started).total_seconds(), 3),
+            }
+            logger.info("Vote rollup backfill: %s", self.last_backfill)
+            return self.last_backfill
+        finally:
+            self._live = None
+            self.backfill_running = False
+
+    async def backfill_if_stale(self, pause=None):
+        """Backfill when the running total disagrees with the ``votes`` collection.
+
+        Covers a first start, bulk loads and votes written by other services.
+        """
+        votes = await self.db.votes.estimated_document_count()
+        doc = await self.db.vote_totals.find_one({"_id": TOTAL_ID})
+        if votes and (doc or {}).get("total") != votes:
+            await self.backfill(pause)
+
+
+def _paused(pause):
+    return pause() if pause is not None else contextlib.nullcontext()
+
+
+def _group_chunk(pd, chunk: List[Dict[str, Any]], outfit_ids: Dict[str, Any]):
+    frame = pd.DataFrame.from_records(chunk, columns=["outfitId", "reaction", "createdAt"])
+    keys = frame["outfitId"].astype(str)
+    for key, value in zip(keys.unique(), frame["outfitId"].loc[~keys.duplicated()]):
+        outfit_ids.setdefault(key, value)
+    frame = frame.assign(
+        outfitId=keys,
+        hour=pd.to_datetime(frame["createdAt"]).dt.floor("h"),
+        reaction=frame["reaction"].map(REACTIONS).fillna("other"),
+    )
+    counts = frame.groupby(["outfitId", "hour", "reaction"]).size().unstack(fill_value=0)
+    counts["total"] = counts.sum(axis=1)
+    return counts
@@ -0,0 +1,162 @@
+"""Duplicate-vote screening in front of Mongo.
+
+Each outfit gets a scalable Bloom filter of the fans that have voted for it.
+A negative answer is definitive, so most new votes skip the
+``votes.findOne({outfitId, fanId})`` round-trip entirely; only a positive
+answer falls back to an exact lookup.  Anonymous votes are deduplicated on
+the outfit and the client address for a configurable window.  The address
+must be the trusted one from ``core.client_ip``.  Session headers and
+cookies are chosen by the client, so a fresh one must not buy a fresh vote;
+clients behind one NAT therefore share one anonymous vote per outfit per
+window, and a fan account is how each of them gets their own.
+"""
+import hashlib
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: bytes):
+        digest = hashlib.blake2b(item, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item: bytes):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item: bytes) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class ScalableBloomFilter:
+    """Adds a larger, tighter layer whenever the current one is full."""
+
+    def __init__(self, capacity: int = 1024, error_rate: float = 0.01):
+        self.error_rate = error_rate
+        self.layers: List[BloomFilter] = [BloomFilter(capacity, error_rate / 2)]
+
+    def add(self, item: bytes):
+        layer = self.layers[-1]
+        if layer.count >= layer.capacity:
+            layer = BloomFilter(layer.capacity * 2, self.error_rate / 2 ** (len(self.layers) + 1))
+            self.layers.append(layer)
+        layer.add(item)
+
+    def __contains__(self, item: bytes) -> bool:
+        return any(item in layer for layer in self.layers)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(len(layer.bits) for layer in self.layers)
+
+
+class VoteDeduplicator:
+    def __init__(
+        self,
+        db,
+        capacity: int = 1024,
+        error_rate: float = 0.01,
+        anonymous_window: float = 3600.0,
+        anonymous_max_keys: int = 500_000,
+    ):
+        self.db = db
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.anonymous_window = anonymous_window
+        self.anonymous_max_keys = anonymous_max_keys
+        self._filters: Dict[str, ScalableBloomFilter] = {}
+        self._anonymous: "OrderedDict[bytes, float]" = OrderedDict()
+        self.filter_negatives = 0
+        self.filter_positives = 0
+        self.false_positives = 0
+        self.duplicates = 0
+        self.anonymous_duplicates = 0
+
+    def _filter(self, outfit_id) -> ScalableBloomFilter:
+        key = str(outfit_id)
+        bloom = self._filters.get(key)
+        if bloom is None:
+            bloom = self._filters[key] = ScalableBloomFilter(self.capacity, self.error_rate)
+        return bloom
+
+    def add(self, outfit_id, fan_id):
+        if fan_id is not None:
+            self._filter(outfit_id).add(str(fan_id).encode())
+
+    async def load(self):
+        """Populate the filters from every fan vote already in Mongo."""
+        self._filters = {}
+        loaded = 0
+        cursor = self.db.votes.find({"fanId": {"$ne": None}}, {"outfitId": 1, "fanId": 1, "_id": 0})
+        async for vote in cursor.batch_size(10_000):
+            self.add(vote["outfitId"], vote["fanId"])
+            loaded += 1
+        logger.info("Vote dedup filters loaded: %d votes over %d outfits", loaded, len(self._filters))
+
+    async def has_voted(self, outfit_id: Any, fan_id: Any) -> bool:
+        bloom = self._filters.get(str(outfit_id))
+        if bloom is None or str(fan_id).encode() not in bloom:
+            self.filter_negatives += 1
+            return False
+        self.filter_positives += 1
+        existing = await self.db.votes.find_one({"outfitId": outfit_id, "fanId": fan_id}, {"_id": 1})
+        if existing is None:
+            self.false_positives += 1
+            return False
+        self.duplicates += 1
+        return True
+
+    @staticmethod
+    def fingerprint(outfit_id: Any, client_ip: str) -> bytes:
+        raw = f"{outfit_id}|{client_ip}".encode()
+        return hashlib.blake2b(raw, digest_size=16).digest()
+
+    def claim_anonymous(self, outfit_id: Any, client_ip: str) -> bool:
+        """Record an anonymous vote; False if the same client voted within the window."""
+        if self.anonymous_window <= 0:
+            return True
+        now = time.monotonic()
+        # Entries are kept in expiry order, so expired ones are always at the front
+        while self._anonymous:
+            oldest, expires = next(iter(self._anonymous.items()))
+            if expires > now and len(self._anonymous) < self.anonymous_max_keys:
+                break
+            del self._anonymous[oldest]
+
+        key = self.fingerprint(outfit_id, client_ip)
+        if key in self._anonymous:
+            self.anonymous_duplicates += 1
+            return False
+        self._anonymous[key] = now + self.anonymous_window
+        return True
+
+    def release_anonymous(self, outfit_id: Any, client_ip: str):
+        """Forget a claim whose vote was never written."""
+        self._anonymous.pop(self.fingerprint(outfit_id, client_ip), None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "outfits": len(self._filters),
+            "filter_bytes": sum(bloom.nbytes for bloom in self._filters.values()),
+            "filter_negatives": self.filter_negatives,
+            "filter_positives": self.filter_positives,
+            "false_positives": self.false_positives,
+            "duplicates": self.duplicates,
+            "anonymous_tracked": len(self._anonymous),
+            "anonymous_duplicates": self.anonymous_duplicates,
+        }
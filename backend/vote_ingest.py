@@ -0,0 +1,375 @@
+"""Write-behind vote ingestion.
+
+Votes are accepted into an in-process buffer, deduplicated on
+``(outfitId, fanId)`` and flushed to Mongo in batches: one unordered insert
+of the vote documents, then ``$inc`` updates for outfit vote counts; fan
+points are applied by a listener (see ``fan_scoring``).  A flush happens
+every ``flush_interval_ms`` or as soon as ``max_batch`` votes are waiting,
+whichever comes first.
+
+Once a vote document is inserted the vote counts as written: it is
+acknowledged and handed to the listeners even if the outfit ``$inc`` fails,
+and failed increments are carried into the next flush.  Only the documents
+the insert reports as failed are rejected.
+"""
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+ACK_ON_ENQUEUE = "enqueue"
+ACK_AFTER_FLUSH = "flush"
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+class VoteRejected(Exception):
+    """Base class for votes refused by the ingestor."""
+
+
+class DuplicateVote(VoteRejected):
+    pass
+
+
+class OutfitNotFound(VoteRejected):
+    pass
+
+
+class VoteWriteFailed(Exception):
+    """Mongo refused a vote document for a reason other than a duplicate."""
+
+
+def as_object_id(value: Optional[str]) -> Any:
+    """Mongoose stores references as ObjectIds; keep other ids untouched."""
+    if value is None:
+        return None
+    if isinstance(value, str) and ObjectId.is_valid(value):
+        return ObjectId(value)
+    return value
+
+
+@dataclass
+class PendingVote:
+    outfit_id: Any
+    fan_id: Any
+    reaction: str
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    future: Optional[asyncio.Future] = None
+
+    @property
+    def key(self) -> Optional[Tuple[Any, Any]]:
+        # Anonymous votes are not deduplicated here
+        if self.fan_id is None:
+            return None
+        return (self.outfit_id, self.fan_id)
+
+    def to_document(self) -> Dict[str, Any]:
+        return {
+            "_id": ObjectId(),
+            "outfitId": self.outfit_id,
+            "fanId": self.fan_id,
+            "reaction": self.reaction,
+            "createdAt": self.created_at,
+        }
+
+
+@dataclass
+class FlushMetrics:
+    flushes: int = 0
+    votes_enqueued: int = 0
+    votes_written: int = 0
+    duplicates: int = 0
+    unknown_outfits: int = 0
+    failed_votes: int = 0
+    failed_flushes: int = 0
+    counter_failures: int = 0
+    last_batch_size: int = 0
+    max_batch_size: int = 0
+    last_flush_ms: float = 0.0
+    total_flush_ms: float = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        data = dict(self.__dict__)
+        data["avg_flush_ms"] = (
+            round(self.total_flush_ms / self.flushes, 3) if self.flushes else 0.0
+        )
+        return data
+
+
+class VoteIngestor:
+    def __init__(
+        self,
+        db,
+        flush_interval_ms: int = 50,
+        max_batch: int = 500,
+        ack_mode: str = ACK_AFTER_FLUSH,
+        outfit_counter: Optional[Callable[[Any, int], None]] = None,
+    ):
+        if ack_mode not in (ACK_ON_ENQUEUE, ACK_AFTER_FLUSH):
+            raise ValueError(f"Unknown ack mode: {ack_mode}")
+        self.db = db
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_batch = max_batch
+        self.ack_mode = ack_mode
+        # Multi-worker mode hands outfit vote counts to the shared counter table
+        self.outfit_counter = outfit_counter
+        self.metrics = FlushMetrics()
+        self._buffer: List[PendingVote] = []
+        self._pending_keys = set()
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+        self._listeners: List[Callable[[List[PendingVote]], None]] = []
+        self._writers: List[Callable[[List[PendingVote]], Awaitable[None]]] = []
+        # Outfit vote increments whose $inc failed, retried on the next flush
+        self._unapplied: Dict[Any, int] = defaultdict(int)
+
+    def add_listener(self, callback: Callable[[List[PendingVote]], None]):
+        """Call ``callback`` with every batch of votes written to Mongo."""
+        self._listeners.append(callback)
+
+    def add_writer(self, callback: Callable[[List[PendingVote]], Awaitable[None]]):
+        """Await ``callback`` with every written batch before its votes are acknowledged.
+
+        For writes that must not lag the acknowledgement; a failure is
+        logged and left to the writer to retry, since the votes are stored.
+        """
+        self._writers.append(callback)
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._buffer)
+
+    @property
+    def unapplied_increments(self) -> int:
+        return sum(self._unapplied.values())
+
+    def start(self):
+        if self._task is None:
+            self._closed = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._closed = True
+        if self._task is not None:
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        # Drain anything that arrived while the loop was exiting
+        await self.flush()
+        if self._unapplied:
+            logger.error("Outfit vote counts left short by %d on shutdown: %s",
+                         self.unapplied_increments, dict(self._unapplied))
+
+    async def submit(self, outfit_id: str, fan_id: Optional[str] = None, reaction: str = "💖") -> Dict[str, Any]:
+        if self._closed:
+            raise RuntimeError("Vote ingestor is shut down")
+
+        vote = PendingVote(as_object_id(outfit_id), as_object_id(fan_id), reaction)
+        if vote.key is not None:
+            if vote.key in self._pending_keys:
+                self.metrics.duplicates += 1
+                raise DuplicateVote("You have already voted for this outfit")
+            self._pending_keys.add(vote.key)
+
+        if self.ack_mode == ACK_AFTER_FLUSH:
+            vote.future = asyncio.get_running_loop().create_future()
+
+        self._buffer.append(vote)
+        self.metrics.votes_enqueued += 1
+        if len(self._buffer) >= self.max_batch:
+            self._wakeup.set()
+
+        if vote.future is not None:
+            return await vote.future
+        return {"outfitId": str(vote.outfit_id), "queued": True}
+
+    async def _run(self):
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Vote flush loop error")
+
+    @asynccontextmanager
+    async def paused(self):
+        """Hold flushes; inside, every stored vote has reached the listeners."""
+        async with self._flush_lock:
+            yield
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._buffer and self._unapplied:
+                # Batches carry earlier failed increments along; quiet flushes retry them alone
+                await self._apply_outfit_incs({})
+            while self._buffer:
+                batch = self._buffer[: self.max_batch]
+                del self._buffer[: self.max_batch]
+                await self._flush_batch(batch)
+
+    async def _flush_batch(self, batch: List[PendingVote]):
+        started = time.perf_counter()
+        try:
+            accepted = await self._write(batch)
+        except Exception as exc:
+            logger.exception("Failed to flush %d votes", len(batch))
+            self.metrics.failed_flushes += 1
+            self.metrics.failed_votes += len(batch)
+            for vote in batch:
+                _reject(vote, exc)
+            return
+        finally:
+            for vote in batch:
+                if vote.key is not None:
+                    self._pending_keys.discard(vote.key)
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        m = self.metrics
+        m.flushes += 1
+        m.votes_written += len(accepted)
+        m.last_batch_size = len(batch)
+        m.max_batch_size = max(m.max_batch_size, len(batch))
+        m.last_flush_ms = round(elapsed_ms, 3)
+        m.total_flush_ms += elapsed_ms
+
+    async def _write(self, batch: List[PendingVote]) -> List[PendingVote]:
+        """Persist a batch and return the votes that were actually written."""
+        outfit_ids = list({vote.outfit_id for vote in batch})
+        known = {
+            doc["_id"]
+            async for doc in self.db.outfits.find({"_id": {"$in": outfit_ids}}, {"_id": 1})
+        }
+
+        candidates = []
+        for vote in batch:
+            if vote.outfit_id in known:
+                candidates.append(vote)
+            else:
+                self.metrics.unknown_outfits += 1
+                _reject(vote, OutfitNotFound("Outfit not found"))
+        if not candidates:
+            return []
+
+        documents = [vote.to_document() for vote in candidates]
+        # Unordered: every document not listed in writeErrors was inserted
+        failed: Dict[int, Exception] = {}
+        try:
+            await self.db.votes.bulk_write(
+                [InsertOne(doc) for doc in documents], ordered=False
+            )
+        except BulkWriteError as exc:
+            for error in exc.details.get("writeErrors", []):
+                if error.get("code") == DUPLICATE_KEY_ERROR:
+                    failed[error["index"]] = DuplicateVote("You have already voted for this outfit")
+                else:
+                    failed[error["index"]] = VoteWriteFailed(error.get("errmsg", "Vote write failed"))
+
+        accepted = []
+        for index, vote in enumerate(candidates):
+            error = failed.get(index)
+            if error is None:
+                accepted.append((vote, documents[index]))
+                continue
+            if isinstance(error, DuplicateVote):
+                self.metrics.duplicates += 1
+            else:
+                self.metrics.failed_votes += 1
+                logger.error("Vote for outfit %s not written: %s", vote.outfit_id, error)
+            _reject(vote, error)
+        if not accepted:
+            return []
+
+        # The votes are stored from here on; nothing below may fail them
+        outfit_incs: Dict[Any, int] = defaultdict(int)
+        for vote, _ in accepted:
+            outfit_incs[vote.outfit_id] += 1
+        await self._apply_outfit_incs(outfit_incs)
+
+        written = [vote for vote, _ in accepted]
+        for callback in self._listeners:
+            try:
+                callback(written)
+            except Exception:
+                logger.exception("Vote listener failed")
+        for writer in self._writers:
+            try:
+                await writer(written)
+            except Exception:
+                logger.exception("Vote writer failed")
+
+        for vote, doc in accepted:
+            if vote.future is not None and not vote.future.done():
+                vote.future.set_result(_serialize_vote(doc))
+        return written
+
+    async def _apply_outfit_incs(self, outfit_incs: Dict[Any, int]):
+        """Add vote counts to outfits, keeping whatever fails for the next flush.
+
+        Counts the shared counter cannot take are ``$inc``'d in Mongo directly.
+        """
+        for oid, n in self._unapplied.items():
+            outfit_incs[oid] = outfit_incs.get(oid, 0) + n
+        self._unapplied.clear()
+        if self.outfit_counter is not None:
+            direct: Dict[Any, int] = {}
+            for oid, n in outfit_incs.items():
+                try:
+                    self.outfit_counter(oid, n)
+                except Exception as exc:
+                    logger.warning("Shared vote counter unavailable for outfit %s (%s); writing to Mongo", oid, exc)
+                    self.metrics.counter_failures += 1
+                    direct[oid] = n
+            outfit_incs = direct
+        if not outfit_incs:
+            return
+        try:
+            await self.db.outfits.bulk_write(
+                [UpdateOne({"_id": oid}, {"$inc": {"votes": n}}) for oid, n in outfit_incs.items()],
+                ordered=False,
+            )
+        except BulkWriteError as exc:
+            # Unordered: only the listed updates failed
+            failed = {error["index"] for error in exc.details.get("writeErrors", [])}
+            for index, (oid, n) in enumerate(outfit_incs.items()):
+                if index in failed:
+                    self._unapplied[oid] += n
+            self.metrics.counter_failures += 1
+            logger.error("Outfit vote count update failed for %d outfits; retrying next flush", len(failed))
+        except Exception:
+            self.metrics.counter_failures += 1
+            for oid, n in outfit_incs.items():
+                self._unapplied[oid] += n
+            logger.exception("Outfit vote count update failed; retrying next flush")
+
+
+def _reject(vote: PendingVote, exc: Exception):
+    if vote.future is not None and not vote.future.done():
+        vote.future.set_exception(exc)
+    elif vote.future is None and not isinstance(exc, VoteRejected):
+        logger.warning("Dropped acknowledged vote for outfit %s: %s", vote.outfit_id, exc)
+
+
+def _serialize_vote(doc: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": str(doc["_id"]),
+        "outfitId": str(doc["outfitId"]),
+        "fanId": str(doc["fanId"]) if doc["fanId"] is not None else None,
+        "reaction": doc["reaction"],
+        "createdAt": doc["createdAt"],
+    }
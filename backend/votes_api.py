@@ -0,0 +1,328 @@
+"""Voting: ``/api/votes``, ``/api/outfits`` and ``/api/fans``.
+
+The outfit ranking, the live stream, fan points and the vote rollups are all
+fed by the vote ingestor's flushes, so they are served from one module.
+"""
+import asyncio
+import os
+from datetime import datetime
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from pydantic import BaseModel
+from starlette.responses import StreamingResponse
+
+from admission import require_admin
+from core import (
+    admission, client_ip, db, known_fan, page_or_400, queue_depths, read_db, response_cache, serialize_doc,
+    shared_table,
+)
+from fan_scoring import FanScoring, ScoringRules
+from fast_json import FastJSONResponse
+from images_api import attach_listeners, image_pipeline
+from leaderboard import Leaderboard, percentage
+from live_stream import LiveStream
+from metrics import registry
+from shared_counters import counter_key
+from vote_analytics import VoteAnalytics
+from vote_dedup import VoteDeduplicator
+from vote_ingest import DuplicateVote, OutfitNotFound, VoteIngestor, as_object_id
+
+# Votes are buffered and written to Mongo in batches
+vote_ingestor = VoteIngestor(
+    db,
+    flush_interval_ms=int(os.environ.get('VOTE_FLUSH_INTERVAL_MS', '50')),
+    max_batch=int(os.environ.get('VOTE_FLUSH_MAX_BATCH', '500')),
+    ack_mode=os.environ.get('VOTE_ACK_MODE', 'flush'),
+    outfit_counter=(
+        (lambda oid, n: shared_table.incr(counter_key("outfits", oid, "votes"), n))
+        if shared_table is not None else None
+    ),
+)
+queue_depths.append(lambda: vote_ingestor.queue_depth)
+
+# Outfit ranking is served from memory and kept current by the vote flushes
+leaderboard = Leaderboard()
+leaderboard_reconcile_interval = float(os.environ.get('LEADERBOARD_RECONCILE_INTERVAL_S', '300'))
+
+def _apply_votes_to_leaderboard(votes):
+    for vote in votes:
+        leaderboard.record_vote(vote.outfit_id)
+
+vote_ingestor.add_listener(_apply_votes_to_leaderboard)
+# Screens duplicate votes before they reach the ingestor or Mongo
+vote_dedup = VoteDeduplicator(
+    db,
+    anonymous_window=float(os.environ.get('ANON_VOTE_WINDOW_S', '3600')),
+)
+
+def _remember_votes(votes):
+    for vote in votes:
+        vote_dedup.add(vote.outfit_id, vote.fan_id)
+
+vote_ingestor.add_listener(_remember_votes)
+
+# Fan points are scored per batch of votes; top fans are served from memory
+fan_scoring = FanScoring(
+    db,
+    ScoringRules.from_env(),
+    top_k=int(os.environ.get('FAN_TOP_K', '100')),
+    refresh_interval=float(os.environ.get('FAN_TOP_REFRESH_S', '60')),
+)
+vote_ingestor.add_writer(fan_scoring.record)
+fan_scoring.add_listener(lambda: response_cache.invalidate('fans'))
+
+# Hourly per-outfit/per-reaction rollups answer the stats endpoints
+vote_analytics = VoteAnalytics(db)
+vote_ingestor.add_writer(vote_analytics.record)
+vote_ingestor.add_listener(lambda votes: response_cache.invalidate('votes'))
+
+# Ranking changes are pushed to subscribers once per tick
+live_stream = LiveStream(
+    leaderboard,
+    tick_ms=int(os.environ.get('LIVE_STREAM_TICK_MS', '250')),
+    buffer_size=int(os.environ.get('LIVE_STREAM_BUFFER_SIZE', '16')),
+    decorate=image_pipeline.decorate_cached,
+)
+vote_ingestor.add_listener(live_stream.mark_dirty)
+
+def _attach_outfit_image(collection, outfit_id, image_id):
+    entry = leaderboard.get(outfit_id) if collection == "outfits" else None
+    if entry is not None:
+        entry.image_id = image_id
+
+attach_listeners.append(_attach_outfit_image)
+
+registry.add_collector(lambda: {
+    "vote_ingest_queue_depth": vote_ingestor.queue_depth,
+    "live_stream_connections": live_stream.connections,
+})
+
+router = APIRouter(prefix="/api", default_response_class=FastJSONResponse)
+
+
+class VoteCreate(BaseModel):
+    outfitId: str
+    fanId: Optional[str] = None
+    reaction: Literal['💖', '🔥', '👏'] = '💖'
+
+@router.post("/votes")
+async def cast_vote(input: VoteCreate, request: Request):
+    admission.admit("votes", client_ip(request))
+    # A made-up fanId must not buy a fresh bucket; unknown fans are held to the IP limit alone
+    fan_id = await known_fan(input.fanId)
+    if fan_id is not None:
+        admission.admit_fan("votes", fan_id)
+    already_voted = HTTPException(status_code=400, detail="You have already voted for this outfit")
+    fingerprint = None
+    # An unknown fanId votes anonymously: only a stored fan gets a per-fan vote
+    if fan_id is not None:
+        if await vote_dedup.has_voted(as_object_id(input.outfitId), fan_id):
+            raise already_voted
+    else:
+        fingerprint = (as_object_id(input.outfitId), client_ip(request))
+        if not vote_dedup.claim_anonymous(*fingerprint):
+            raise already_voted
+
+    try:
+        vote = await vote_ingestor.submit(input.outfitId, fan_id, input.reaction)
+    except (DuplicateVote, OutfitNotFound) as e:
+        if fingerprint is not None:
+            vote_dedup.release_anonymous(*fingerprint)
+        if isinstance(e, DuplicateVote):
+            raise already_voted
+        raise HTTPException(status_code=404, detail=str(e))
+    data = {"vote": vote}
+    outfit = leaderboard.get(input.outfitId)
+    if outfit is not None:
+        data["outfit"] = {
+            "id": outfit.id,
+            "votes": outfit.votes,
+            "percentage": percentage(outfit.votes, leaderboard.total_votes),
+        }
+    return {"success": True, "data": data, "message": "Vote cast successfully!"}
+
+@router.get("/votes/stats")
+@response_cache.cached(ttl=10, tags=['votes'])
+async def get_vote_stats():
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    total_votes, today_votes = await asyncio.gather(
+        vote_analytics.totals(),
+        vote_analytics.totals(since=today),
+    )
+    top_outfits = await db.outfits.find({}, {"title": 1, "votes": 1, "imageUrl": 1}) \
+        .sort("votes", -1).limit(5).to_list(5)
+    return {
+        "success": True,
+        "data": {
+            "totalVotes": total_votes,
+            "todayVotes": today_votes,
+            "topOutfits": [serialize_doc(doc) for doc in top_outfits],
+        },
+    }
+
+@router.get("/votes/outfit/{outfit_id}")
+async def get_outfit_votes(outfit_id: str, limit: int = Query(50, ge=0, le=500)):
+    outfit_oid = as_object_id(outfit_id)
+    summary, votes = await asyncio.gather(
+        vote_analytics.outfit_reactions(outfit_oid),
+        db.votes.find({"outfitId": outfit_oid}).sort("createdAt", -1).limit(limit).to_list(limit),
+    )
+    fan_ids = list({vote["fanId"] for vote in votes if vote.get("fanId") is not None})
+    usernames = {}
+    if fan_ids:
+        async for fan in db.fans.find({"_id": {"$in": fan_ids}}, {"username": 1}):
+            usernames[fan["_id"]] = fan.get("username")
+    recent = []
+    for vote in votes:
+        fan_id = vote.get("fanId")
+        vote = serialize_doc(vote)
+        if fan_id in usernames:
+            vote["fanId"] = {"_id": str(fan_id), "username": usernames[fan_id]}
+        recent.append(vote)
+    return {"success": True, "data": {"votes": recent, **summary}}
+
+@router.get("/votes/timeline")
+@response_cache.cached(ttl=30, tags=['votes'])
+async def get_vote_timeline(outfitId: Optional[str] = None, hours: int = Query(24, ge=1, le=24 * 31)):
+    outfit_oid = as_object_id(outfitId) if outfitId else None
+    return {"success": True, "data": await vote_analytics.timeline(outfit_oid, hours)}
+
+@router.post("/votes/rollups/backfill", dependencies=[Depends(require_admin)])
+async def backfill_vote_rollups():
+    if vote_analytics.backfill_running:
+        raise HTTPException(status_code=409, detail="Backfill already running")
+    result = await vote_analytics.backfill(vote_ingestor.paused)
+    response_cache.invalidate('votes')
+    return {"success": True, "data": result}
+
+@router.get("/votes/ingest/metrics")
+async def get_vote_ingest_metrics():
+    return {
+        "ack_mode": vote_ingestor.ack_mode,
+        "queue_depth": vote_ingestor.queue_depth,
+        "unapplied_increments": vote_ingestor.unapplied_increments,
+        **vote_ingestor.metrics.as_dict(),
+        "dedup": vote_dedup.stats(),
+    }
+
+@router.get("/outfits")
+async def get_outfits(page: int = Query(1, ge=1), limit: Optional[int] = Query(None, ge=1, le=500)):
+    offset = (page - 1) * limit if limit else 0
+    data = await image_pipeline.decorate(leaderboard.page(offset, limit))
+    return {"success": True, "data": data, "total": len(leaderboard)}
+
+@router.get("/outfits/{outfit_id}/rank")
+async def get_outfit_rank(outfit_id: str):
+    outfit = leaderboard.get(outfit_id)
+    if outfit is None:
+        raise HTTPException(status_code=404, detail="Outfit not found")
+    ranking = leaderboard.rank(outfit_id)
+    data = await image_pipeline.decorate([leaderboard.serialize(outfit, ranking)])
+    return {"success": True, "data": data[0]}
+
+@router.post("/outfits/leaderboard/reconcile", dependencies=[Depends(require_admin)])
+async def reconcile_leaderboard():
+    result = await leaderboard.reconcile(db, vote_ingestor.paused)
+    live_stream.mark_dirty()
+    return {"success": True, "data": result}
+
+@router.get("/outfits/stream")
+async def stream_outfits():
+    subscriber = live_stream.subscribe()
+    return StreamingResponse(
+        live_stream.events(subscriber),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/outfits/stream/stats")
+async def get_stream_stats():
+    return live_stream.stats()
+
+@router.get("/fans")
+async def get_fans(
+    limit: int = Query(20, ge=1, le=100),
+    sort: Literal['points', 'recent', 'oldest'] = 'points',
+    cursor: Optional[str] = None,
+):
+    fans, pagination = await page_or_400(
+        read_db.fans, mode=sort, limit=limit, cursor=cursor, projection={"email": 0}
+    )
+    return {"success": True, "data": [serialize_doc(fan) for fan in fans], "pagination": pagination}
+
+@router.get("/fans/top")
+@response_cache.cached(ttl=30, tags=['fans'])
+async def get_top_fans(limit: int = Query(10, ge=1, le=100)):
+    data = []
+    for fan in fan_scoring.top(limit):
+        fan = serialize_doc(fan)
+        if "score" in fan:
+            fan["score"] = round(fan_scoring.decayed(fan["score"]), 2)
+        data.append(fan)
+    return {"success": True, "data": data, "type": "top_fans"}
+
+@router.post("/fans/scores/rebuild", dependencies=[Depends(require_admin)])
+async def rebuild_fan_scores():
+    if fan_scoring.rebuild_running:
+        raise HTTPException(status_code=409, detail="Rebuild already running")
+    result = await fan_scoring.rebuild(vote_ingestor.paused)
+    response_cache.invalidate('fans')
+    return {"success": True, "data": result}
+
+@router.get("/fans/scores/stats")
+async def get_fan_scoring_stats():
+    return fan_scoring.stats()
+
+background_tasks = []
+
+async def sync_shared_counters(interval: float):
+    """Apply other workers' votes and downloads to this worker's state."""
+    while True:
+        await asyncio.sleep(interval)
+        votes_changed = downloads_changed = False
+        for key, delta in shared_table.foreign_deltas().items():
+            collection, doc_id, field = key.split(":", 2)
+            if collection == "outfits" and field == "votes":
+                leaderboard.record_vote(doc_id, delta)
+                votes_changed = True
+            elif collection == "wallpapers":
+                downloads_changed = True
+        if votes_changed:
+            live_stream.mark_dirty()
+            response_cache.invalidate('votes', 'fans')
+        if downloads_changed:
+            response_cache.invalidate('wallpapers')
+
+async def startup(timer):
+    with timer.phase("indexes"):
+        await vote_analytics.ensure_indexes()
+        await fan_scoring.ensure_indexes()
+    with timer.phase("leaderboard"):
+        await leaderboard.rebuild(db)
+    with timer.phase("dedup"):
+        await vote_dedup.load()
+    with timer.phase("fan_scores"):
+        await fan_scoring.load()
+    if shared_table is not None:
+        # The rebuild already counted everything flushed so far
+        shared_table.foreign_deltas()
+        background_tasks.append(asyncio.create_task(
+            sync_shared_counters(float(os.environ.get('SHARED_SYNC_INTERVAL_MS', '100')) / 1000)
+        ))
+    if leaderboard_reconcile_interval > 0:
+        background_tasks.append(
+            asyncio.create_task(leaderboard.run_reconcile_loop(db, leaderboard_reconcile_interval, vote_ingestor.paused))
+        )
+    background_tasks.append(asyncio.create_task(live_stream.run()))
+    background_tasks.append(asyncio.create_task(vote_analytics.backfill_if_stale(vote_ingestor.paused)))
+    background_tasks.append(asyncio.create_task(fan_scoring.run_refresh_loop()))
+    vote_ingestor.start()
+
+async def shutdown():
+    for task in background_tasks:
+        task.cancel()
+    background_tasks.clear()
+    await vote_ingestor.stop()
+    await vote_analytics.retry()
+    await fan_scoring.retry()
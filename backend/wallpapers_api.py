@@ -0,0 +1,93 @@
+"""Wallpapers and their download counters: ``/api/wallpapers``."""
+import asyncio
+import os
+from typing import Literal, Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request
+
+from core import admission, client_ip, db, page_or_400, read_db, response_cache, shared_flusher, shared_table, worker
+from counters import CounterService
+from fast_json import FastJSONResponse
+from images_api import image_pipeline
+from vote_ingest import as_object_id
+
+# Download counters switch to sharded writes when a wallpaper goes viral
+counters = CounterService(
+    db,
+    shards=int(os.environ.get('COUNTER_SHARDS', '16')),
+    promote_rate=float(os.environ.get('COUNTER_PROMOTE_RATE', '50')),
+    fold_interval=float(os.environ.get('COUNTER_FOLD_INTERVAL_S', '5')),
+    shared=shared_table,
+)
+
+router = APIRouter(prefix="/api", default_response_class=FastJSONResponse)
+
+def format_wallpaper(w):
+    return {
+        "id": str(w["_id"]),
+        "title": w.get("title"),
+        "image": w.get("imageUrl"),
+        "imageId": w.get("imageId"),
+        "downloads": w.get("downloads", 0),
+        "category": "lifestyle",
+    }
+
+@router.get("/wallpapers")
+async def get_wallpapers(
+    limit: int = Query(12, ge=1, le=100),
+    sort: Literal['newest', 'oldest', 'popular'] = 'newest',
+    cursor: Optional[str] = None,
+):
+    wallpapers, pagination = await page_or_400(read_db.wallpapers, mode=sort, limit=limit, cursor=cursor)
+    data = [format_wallpaper(w) for w in wallpapers]
+    return {"success": True, "data": await image_pipeline.decorate(data), "pagination": pagination}
+
+@router.post("/wallpapers/{wallpaper_id}/download")
+async def track_wallpaper_download(wallpaper_id: str, request: Request):
+    admission.admit("downloads", client_ip(request))
+    wallpaper_oid = as_object_id(wallpaper_id)
+    wallpaper = await db.wallpapers.find_one({"_id": wallpaper_oid}, {"imageUrl": 1, "imageId": 1})
+    if wallpaper is None:
+        raise HTTPException(status_code=404, detail="Wallpaper not found")
+    downloads = await counters.incr("wallpapers", wallpaper_oid, "downloads")
+    download_url = wallpaper.get("imageUrl")
+    if wallpaper.get("imageId"):
+        manifest = (await image_pipeline.manifests([wallpaper["imageId"]])).get(wallpaper["imageId"])
+        if manifest is not None:
+            download_url = image_pipeline.original_url(manifest)
+    return {
+        "success": True,
+        "data": {"id": wallpaper_id, "downloads": downloads, "downloadUrl": download_url},
+        "message": "Download tracked successfully",
+    }
+
+@router.get("/wallpapers/popular")
+@response_cache.cached(ttl=30, tags=['wallpapers'])
+async def get_popular_wallpapers(limit: int = Query(20, ge=1, le=100)):
+    popular = await read_db.wallpapers.find().sort("downloads", -1).limit(limit).to_list(limit)
+    data = [format_wallpaper(w) for w in popular]
+    return {"success": True, "data": await image_pipeline.decorate(data), "type": "popular"}
+
+@router.get("/counters/stats")
+async def get_counter_stats():
+    data = counters.stats()
+    if shared_table is not None:
+        data["shared"] = {
+            "worker": worker["index"],
+            "workers": worker["workers"],
+            **shared_table.stats(),
+            "flusher": shared_flusher.stats() if shared_flusher is not None else None,
+        }
+    return data
+
+background_tasks = []
+
+async def startup(timer):
+    with timer.phase("indexes"):
+        await counters.ensure_indexes()
+    background_tasks.append(asyncio.create_task(counters.run()))
+
+async def shutdown():
+    for task in background_tasks:
+        task.cancel()
+    background_tasks.clear()
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Fan Hub Pro Backend Benchmark
+Drives the endpoints covered by backend_test.py concurrently and reports
+latency percentiles, error rate and throughput as JSON.
+
+    python backend_bench.py --scenario vote_storm --rps 500 --duration 30
+    python backend_bench.py --scenario mixed --in-process --output run.json
+"""
+
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+import typer
+
+from backend_test import API_BASE
+
+BACKEND_DIR = Path(__file__).parent / "backend"
+
+cli = typer.Typer(add_completion=False)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class Recorder:
+    """Collects per-endpoint latencies and errors"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.statuses: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+
+    async def request(self, client, method, path, name=None, expected=(200, 201, 304), **kwargs):
+        name = name or f"{method} {path}"
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, path, **kwargs)
+        except httpx.HTTPError:
+            self.latencies[name].append((time.perf_counter() - started) * 1000)
+            self.errors[name] += 1
+            self.statuses[name][0] += 1
+            return None
+        self.latencies[name].append((time.perf_counter() - started) * 1000)
+        self.statuses[name][response.status_code] += 1
+        if response.status_code not in expected:
+            self.errors[name] += 1
+        return response
+
+    def summarize(self, values: List[float], errors: int, elapsed: float):
+        values = sorted(values)
+        count = len(values)
+        return {
+            "requests": count,
+            "errors": errors,
+            "error_rate": round(errors / count, 4) if count else 0.0,
+            "throughput_rps": round(count / elapsed, 2) if elapsed else 0.0,
+            "latency_ms": {
+                "mean": round(sum(values) / count, 3) if count else 0.0,
+                "p50": round(percentile(values, 50), 3),
+                "p95": round(percentile(values, 95), 3),
+                "p99": round(percentile(values, 99), 3),
+                "max": round(values[-1], 3) if values else 0.0,
+            },
+        }
+
+    def report(self):
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        all_latencies = [v for values in self.latencies.values() for v in values]
+        return {
+            "elapsed_s": round(elapsed, 3),
+            "overall": self.summarize(all_latencies, sum(self.errors.values()), elapsed),
+            "endpoints": {
+                name: {
+                    **self.summarize(values, self.errors[name], elapsed),
+                    "statuses": dict(self.statuses[name]),
+                }
+                for name, values in sorted(self.latencies.items())
+            },
+        }
+
+
+class ScenarioContext:
+    """Ids discovered from the target so scenarios hit real documents"""
+
+    def __init__(self, outfit_ids, wallpaper_ids, fan_ids=()):
+        self.outfit_ids = outfit_ids
+        self.wallpaper_ids = wallpaper_ids
+        # Unknown fanIds vote anonymously, one vote per outfit and address,
+        # so every (outfit, fan) pair is used once, in random order
+        self.ballots = [(outfit_id, fan_id) for outfit_id in outfit_ids for fan_id in fan_ids]
+        random.shuffle(self.ballots)
+
+    @classmethod
+    async def discover(cls, client, max_fans=2000):
+        outfits = (await client.get("/outfits")).json().get("data", [])
+        wallpapers = (await client.get("/wallpapers", params={"limit": 100})).json().get("data", [])
+        fan_ids, cursor = [], None
+        while len(fan_ids) < max_fans:
+            params = {"limit": 100, "sort": "oldest", **({"cursor": cursor} if cursor else {})}
+            body = (await client.get("/fans", params=params)).json()
+            fan_ids += [fan["_id"] for fan in body.get("data", [])]
+            cursor = body.get("pagination", {}).get("nextCursor")
+            if not cursor:
+                break
+        return cls([o["id"] for o in outfits], [w["id"] for w in wallpapers], fan_ids)
+
+    def ballot(self):
+        return self.ballots.pop() if self.ballots else None
+
+
+async def vote_storm(client, rec, ctx):
+    """One vote from a fan who has not voted for that outfit yet, with the occasional ranking read"""
+    ballot = ctx.ballot()
+    if ballot is not None:
+        outfit_id, fan_id = ballot
+        await rec.request(client, "POST", "/votes", name="POST /votes", json={
+            "outfitId": outfit_id,
+            "fanId": fan_id,
+            "reaction": random.choice(["💖", "🔥", "👏"]),
+        })
+    if random.random() < 0.2:
+        await rec.request(client, "GET", "/outfits", name="GET /outfits")
+
+
+async def gallery_scroll(client, rec, ctx):
+    """Scroll a few pages of the wallpaper gallery and download one"""
+    cursor = None
+    sort = random.choice(["newest", "popular"])
+    for _ in range(random.randint(1, 5)):
+        params = {"limit": 12, "sort": sort}
+        if cursor:
+            params["cursor"] = cursor
+        response = await rec.request(client, "GET", "/wallpapers", name="GET /wallpapers", params=params)
+        if response is None or response.status_code != 200:
+            return
+        cursor = response.json().get("pagination", {}).get("nextCursor")
+        if not cursor:
+            break
+    if ctx.wallpaper_ids and random.random() < 0.3:
+        wallpaper_id = random.choice(ctx.wallpaper_ids)
+        await rec.request(client, "POST", f"/wallpapers/{wallpaper_id}/download",
+                          name="POST /wallpapers/:id/download")
+
+
+async def qa_browse(client, rec, ctx):
+    """Read answered questions page by page plus the vote stats widget"""
+    cursor = None
+    for _ in range(random.randint(1, 3)):
+        params = {"limit": 20}
+        if cursor:
+            params["cursor"] = cursor
+        response = await rec.request(client, "GET", "/questions", name="GET /questions", params=params)
+        if response is None or response.status_code != 200:
+            return
+        cursor = response.json().get("pagination", {}).get("nextCursor")
+        if not cursor:
+            break
+    await rec.request(client, "GET", "/votes/stats", name="GET /votes/stats")
+
+
+SCENARIOS = {
+    "vote_storm": [(vote_storm, 1.0)],
+    "gallery_scroll": [(gallery_scroll, 1.0)],
+    "qa_browse": [(qa_browse, 1.0)],
+    "mixed": [(vote_storm, 0.5), (gallery_scroll, 0.3), (qa_browse, 0.2)],
+}
+
+
+def _pick(mix):
+    steps, weights = zip(*mix)
+    return random.choices(steps, weights)[0]
+
+
+async def drive(client, scenario, rps, concurrency, duration):
+    """Run the scenario open-loop at ``rps`` (or closed-loop when rps is 0)"""
+    mix = SCENARIOS[scenario]
+    ctx = await ScenarioContext.discover(client)
+    rec = Recorder()
+    deadline = time.perf_counter() + duration
+
+    if rps <= 0:
+        async def worker():
+            while time.perf_counter() < deadline:
+                await _pick(mix)(client, rec, ctx)
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    else:
+        slots = asyncio.Semaphore(concurrency)
+        tasks = set()
+        interval = 1.0 / rps
+        next_at = time.perf_counter()
+
+        async def step():
+            async with slots:
+                await _pick(mix)(client, rec, ctx)
+
+        while next_at < deadline:
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            task = asyncio.create_task(step())
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            next_at += interval
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    rec.finished = time.perf_counter()
+    return rec.report()
+
+
+async def seed_database(db, outfits=12, wallpapers=120, questions=200, fans=2000):
+    """Small but realistic dataset for the in-process target"""
+    now = datetime.utcnow()
+    await db.fans.insert_many([
+        {"username": f"fan{i}", "points": 0, "isTopFan": False,
+         "createdAt": now - timedelta(minutes=i), "updatedAt": now}
+        for i in range(fans)
+    ])
+    await db.outfits.insert_many([
+        {"title": f"Outfit {i}", "imageUrl": f"https://example.com/outfit/{i}.jpg",
+         "votes": 0, "createdAt": now - timedelta(days=i)}
+        for i in range(outfits)
+    ])
+    await db.wallpapers.insert_many([
+        {"title": f"Wallpaper {i}", "imageUrl": f"https://example.com/wallpaper/{i}.jpg",
+         "downloads": random.randint(0, 500), "createdAt": now - timedelta(hours=i)}
+        for i in range(wallpapers)
+    ])
+    await db.questions.insert_many([
+        {"fanName": f"Fan {i}", "text": f"Pregunta {i}",
+         "answer": f"Respuesta {i}" if i % 3 else None, "createdAt": now - timedelta(minutes=i)}
+        for i in range(questions)
+    ])
+
+
+@asynccontextmanager
+async def in_process_client():
+    """ASGI client for the backend app backed by mongomock-motor"""
+    from mongomock_motor import AsyncMongoMockClient
+
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    os.environ.setdefault("DB_NAME", "bench")
+    # Files the app saves on shutdown belong to this run only
+    scratch = tempfile.TemporaryDirectory(prefix="bench-")
+    os.environ.setdefault("SEARCH_SNAPSHOT_PATH", os.path.join(scratch.name, "search_index.json.gz"))
+    # Every simulated fan shares one client address here
+    os.environ["ADMISSION_ENABLED"] = "false"
+    sys.path.insert(0, str(BACKEND_DIR))
+    from app_factory import create_app
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    mongo = AsyncMongoMockClient()
+    await seed_database(mongo[os.environ["DB_NAME"]])
+
+    app = create_app(mongo_client=mongo)
+    with scratch:
+        async with app.router.lifespan_context(app):
+            # Measure requests, not the features loading behind the first ones
+            await app.state.features.preload()
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench/api") as client:
+                yield client
+
+
+@asynccontextmanager
+async def remote_client(base_url, concurrency):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=10) as client:
+        yield client
+
+
+@cli.command()
+def main(
+    scenario: str = typer.Option("mixed", help=f"One of: {', '.join(SCENARIOS)}"),
+    rps: float = typer.Option(200.0, help="Target scenario steps per second; 0 runs closed-loop"),
+    concurrency: int = typer.Option(32, help="Maximum steps in flight"),
+    duration: float = typer.Option(10.0, help="Seconds to generate load"),
+    in_process: bool = typer.Option(False, "--in-process", help="Benchmark the backend app in process on mongomock"),
+    base_url: str = typer.Option(API_BASE, help="API base URL when not running in process"),
+    output: Optional[Path] = typer.Option(None, help="Write the JSON report here instead of stdout"),
+    seed: Optional[int] = typer.Option(None, help="Random seed for reproducible mixes"),
+):
+    """Run a load scenario and emit a JSON latency report"""
+    if scenario not in SCENARIOS:
+        raise typer.BadParameter(f"Unknown scenario {scenario!r}", param_hint="--scenario")
+    if seed is not None:
+        random.seed(seed)
+
+    async def run():
+        target = in_process_client() if in_process else remote_client(base_url, concurrency)
+        async with target as client:
+            return await drive(client, scenario, rps, concurrency, duration)
+
+    report = {
+        "scenario": scenario,
+        "target": "in-process" if in_process else base_url,
+        "rps": rps,
+        "concurrency": concurrency,
+        "duration_s": duration,
+        "started_at": datetime.now().isoformat(),
+        **asyncio.run(run()),
+    }
+    text = json.dumps(report, indent=2)
+    if output:
+        output.write_text(text + "\n")
+        print(f"📊 Report written to {output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    cli()
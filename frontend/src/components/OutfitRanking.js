@@ -1,12 +1,13 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { Heart, MessageCircle, TrendingUp, Award } from 'lucide-react';
 import { Button } from './ui/button';
 import { Card, CardContent } from './ui/card';
 import { Badge } from './ui/badge';
-import { outfitsAPI, votesAPI, sessionAPI } from '../services/api';
+import { outfitsAPI, votesAPI, sessionAPI, homeAPI } from '../services/api';
 import { useToast } from '../hooks/use-toast';
 import useScrollAnimation from '../hooks/useScrollAnimation';
 import Loader from './Loader';
+import ResponsiveImage from './ResponsiveImage';
 
 const OutfitRanking = () => {
   const [outfits, setOutfits] = useState([]);
@@ -15,16 +16,42 @@ const OutfitRanking = () => {
   const [votingLoading, setVotingLoading] = useState({});
   const { toast } = useToast();
   const sectionRef = useScrollAnimation();
+  const streamConnected = useRef(false);
 
   useEffect(() => {
     fetchOutfits();
     setUserVotes(sessionAPI.getStoredVotes());
   }, []);
 
+  // Live ranking updates; falls back to refetching after votes if unavailable
+  useEffect(() => {
+    if (typeof EventSource === 'undefined') return undefined;
+    const source = outfitsAPI.stream();
+
+    source.addEventListener('snapshot', (event) => {
+      streamConnected.current = true;
+      setOutfits(JSON.parse(event.data).outfits);
+    });
+
+    source.addEventListener('delta', (event) => {
+      const { changed, removed } = JSON.parse(event.data);
+      const updates = Object.fromEntries(changed.map(item => [item.id, item]));
+      setOutfits(prev => prev
+        .filter(outfit => !removed.includes(outfit.id))
+        .map(outfit => (updates[outfit.id] ? { ...outfit, ...updates[outfit.id] } : outfit)));
+    });
+
+    source.onerror = () => {
+      if (!streamConnected.current) source.close();
+    };
+
+    return () => source.close();
+  }, []);
+
   const fetchOutfits = async () => {
     try {
       setLoading(true);
-      const response = await outfitsAPI.getAll();
+      const response = await homeAPI.section('outfits', outfitsAPI.getAll);
       if (response.data.success) {
         setOutfits(response.data.data);
       }
@@ -65,7 +92,9 @@ const OutfitRanking = () => {
         sessionAPI.storeVote(outfitId);
 
         // Refresh outfits to get updated vote counts
-        await fetchOutfits();
+        if (!streamConnected.current) {
+          await fetchOutfits();
+        }
 
         toast({
           title: "¡Voto registrado!",
@@ -98,7 +127,9 @@ const OutfitRanking = () => {
       });
 
       // Refresh outfits to show new reaction
-      await fetchOutfits();
+      if (!streamConnected.current) {
+        await fetchOutfits();
+      }
     } catch (error) {
       console.error('Error adding emoji:', error);
       toast({
@@ -159,8 +190,11 @@ const OutfitRanking = () => {
                 )}
                 
                 <div className="aspect-[3/4] overflow-hidden">
-                  <img 
-                    src={outfit.image} 
+                  <ResponsiveImage
+                    src={outfit.image}
+                    srcset={outfit.srcset}
+                    imageSize={outfit.imageSize}
+                    sizes="(min-width: 1024px) 33vw, (min-width: 768px) 50vw, 100vw"
                     alt={outfit.title}
                     className="outfit-image w-full h-full object-cover"
                   />
@@ -4,7 +4,7 @@ import { Button } from './ui/button';
 import { Card, CardContent, CardHeader } from './ui/card';
 import { Textarea } from './ui/textarea';
 import { Badge } from './ui/badge';
-import { questionsAPI, sessionAPI } from '../services/api';
+import { questionsAPI, sessionAPI, homeAPI } from '../services/api';
 import { useToast } from '../hooks/use-toast';
 import useScrollAnimation from '../hooks/useScrollAnimation';
 import Loader from './Loader';
@@ -26,7 +26,7 @@ const QASection = () => {
   const fetchQuestions = async () => {
     try {
       setLoading(true);
-      const response = await questionsAPI.getAll();
+      const response = await homeAPI.section('questions', questionsAPI.getAll);
       if (response.data.success) {
         setQuestions(response.data.data);
       }
@@ -0,0 +1,34 @@
+import React from 'react';
+import { assetURL } from '../services/api';
+
+const MEDIA_TYPES = {
+  avif: 'image/avif',
+  webp: 'image/webp',
+  jpeg: 'image/jpeg',
+};
+
+const absoluteSrcSet = (srcSet) => srcSet
+  .split(', ')
+  .map(candidate => assetURL(candidate))
+  .join(', ');
+
+// Picks the smallest derivative in the best format the browser supports from
+// the `srcset` data list endpoints return; plain image URLs render as before.
+const ResponsiveImage = ({ src, srcset, imageSize, sizes, alt, className }) => (
+  <picture className="contents">
+    {Object.entries(srcset || {}).map(([format, candidates]) => (
+      <source key={format} type={MEDIA_TYPES[format]} srcSet={absoluteSrcSet(candidates)} sizes={sizes} />
+    ))}
+    <img
+      src={assetURL(src)}
+      alt={alt}
+      width={imageSize?.width}
+      height={imageSize?.height}
+      loading="lazy"
+      decoding="async"
+      className={className}
+    />
+  </picture>
+);
+
+export default ResponsiveImage;
@@ -3,10 +3,11 @@ import { Download, Image, Filter, Eye } from 'lucide-react';
 import { Button } from './ui/button';
 import { Card, CardContent } from './ui/card';
 import { Badge } from './ui/badge';
-import { wallpapersAPI, sessionAPI } from '../services/api';
+import { wallpapersAPI, sessionAPI, homeAPI, assetURL } from '../services/api';
 import { useToast } from '../hooks/use-toast';
 import useScrollAnimation from '../hooks/useScrollAnimation';
 import Loader from './Loader';
+import ResponsiveImage from './ResponsiveImage';
 
 const WallpaperGallery = () => {
   const [wallpapers, setWallpapers] = useState([]);
@@ -23,7 +24,7 @@ const WallpaperGallery = () => {
   const fetchWallpapers = async () => {
     try {
       setLoading(true);
-      const response = await wallpapersAPI.getAll();
+      const response = await homeAPI.section('wallpapers', wallpapersAPI.getAll);
       if (response.data.success) {
         setWallpapers(response.data.data);
       }
@@ -57,7 +58,7 @@ const WallpaperGallery = () => {
         
         // Create download link
         const a = document.createElement('a');
-        a.href = response.data.data.downloadUrl;
+        a.href = assetURL(response.data.data.downloadUrl);
         a.download = `${wallpaper.title.replace(/\s+/g, '_')}_StephanieG.jpg`;
         document.body.appendChild(a);
         a.click();
@@ -151,8 +152,11 @@ const WallpaperGallery = () => {
               className="group overflow-hidden bg-white/70 backdrop-blur-sm border-amber-200/50 hover:shadow-xl transition-all duration-300"
             >
               <div className="relative aspect-[9/16] overflow-hidden">
-                <img 
+                <ResponsiveImage
                   src={wallpaper.image}
+                  srcset={wallpaper.srcset}
+                  imageSize={wallpaper.imageSize}
+                  sizes="(min-width: 1024px) 25vw, (min-width: 768px) 33vw, 50vw"
                   alt={wallpaper.title}
                   className="w-full h-full object-cover group-hover:scale-105 transition-transform duration-300"
                 />
@@ -31,6 +31,9 @@ export const outfitsAPI = {
   
   // Create new outfit (admin)
   create: (outfitData) => api.post('/outfits', outfitData),
+
+  // Subscribe to live ranking updates (server-sent events)
+  stream: () => new EventSource(`${API_BASE}/outfits/stream`),
 };
 
 // Votes API
@@ -49,15 +52,21 @@ export const votesAPI = {
 export const questionsAPI = {
   // Get all answered questions
   getAll: (params = {}) => api.get('/questions', { params }),
-  
+
+  // Search answered questions; the last word matches as a prefix for type-ahead
+  search: (q, params = {}) => api.get('/questions/search', { params: { q, ...params } }),
+
   // Submit new question
   submit: (questionData) => api.post('/questions', questionData),
   
-  // Get pending questions (admin)
-  getPending: () => api.get('/questions/pending'),
+  // Get pending questions in priority order, one page at a time (admin)
+  getPending: (params = {}) => api.get('/questions/pending', { params }),
   
   // Answer question (admin)
   answer: (id, answerData) => api.put(`/questions/${id}/answer`, answerData),
+
+  // Answer and reject many questions, with their duplicates, at once (admin)
+  moderate: ({ answers = [], reject = [] }) => api.post('/questions/bulk', { answers, reject }),
 };
 
 // Wallpapers API
@@ -90,12 +99,44 @@ export const fansAPI = {
   getById: (id) => api.get(`/fans/${id}`),
 };
 
+// Home feed: every first-paint section in one request
+let homeRequest = null;
+const servedSections = new Set();
+
+export const homeAPI = {
+  get: () => api.get('/home'),
+
+  // Run several GET paths in one round-trip: [{ id, path }]
+  batch: (requests, timeoutMs) => api.post('/batch', { requests, timeoutMs }),
+
+  // The first section requested on a page load starts a single /home call
+  // that the other components share. Each section is served from it once;
+  // later refreshes, and sections that failed or timed out, use `fallback`.
+  section: async (name, fallback) => {
+    if (!servedSections.has(name)) {
+      servedSections.add(name);
+      if (!homeRequest) {
+        homeRequest = api.get('/home').catch(() => null);
+      }
+      const home = await homeRequest;
+      const section = home?.data?.data?.[name];
+      if (section && section.status === 200) {
+        return { data: section.data };
+      }
+    }
+    return fallback();
+  },
+};
+
 // Health check
 export const healthAPI = {
   check: () => api.get('/health'),
   status: () => api.get('/status'),
 };
 
+// Stored images are returned as paths on the API host
+export const assetURL = (url) => (url && url.startsWith('/api/') ? `${BACKEND_URL}${url}` : url);
+
 // Helper function to handle API errors
 export const handleAPIError = (error, defaultMessage = 'Something went wrong') => {
   if (error.response?.data?.error) {
@@ -0,0 +1,59 @@
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+# The backend is a flat set of modules run from its own directory
+sys.path.insert(0, str(ROOT / "backend"))
+sys.path.insert(0, str(ROOT))
+
+ADMIN_TOKEN = "test-admin-token"
+
+
+class Api:
+    """The in-process app from backend_bench, running on its own loop thread.
+
+    The feature modules keep process-wide state bound to that loop, so every
+    API test shares the one app; ``run`` awaits a coroutine on its loop.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def run(self, coro, timeout=30):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def start(self):
+        import backend_bench
+
+        self._context = backend_bench.in_process_client()
+        self.client = self.run(self._context.__aenter__())
+        import core
+
+        self.db = core.db
+        self.admin_headers = {"X-Admin-Token": os.environ["ADMIN_TOKEN"]}
+
+    def stop(self):
+        self.run(self._context.__aexit__(None, None, None))
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+@pytest.fixture(scope="session")
+def api():
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.setdefault("SEARCH_SNAPSHOT_PATH", str(Path(tmp) / "search_index.json.gz"))
+        os.environ.setdefault("ADMIN_TOKEN", ADMIN_TOKEN)
+        api = Api()
+        api.start()
+        try:
+            yield api
+        finally:
+            api.stop()
@@ -0,0 +1,57 @@
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from admission import AdminGuard, RateRule, forwarded_client, parse_networks
+
+TRUSTED = parse_networks("127.0.0.1, 10.0.0.0/8")
+
+
+def test_untrusted_peer_ignores_forwarded_for():
+    assert forwarded_client("203.0.113.7", "198.51.100.1", TRUSTED) == "203.0.113.7"
+
+
+def test_trusted_proxy_uses_right_most_untrusted_hop():
+    # The client prepended a fake address; the proxies appended the real one
+    forwarded = "198.51.100.1, 203.0.113.7, 10.0.0.5"
+    assert forwarded_client("10.0.0.9", forwarded, TRUSTED) == "203.0.113.7"
+
+
+def test_all_trusted_hops_fall_back_to_left_most():
+    assert forwarded_client("127.0.0.1", "10.0.0.2, 10.0.0.3", TRUSTED) == "10.0.0.2"
+
+
+def admin_request(token=None, peer="203.0.113.7"):
+    headers = [(b"x-admin-token", token.encode())] if token else []
+    return Request({"type": "http", "headers": headers, "client": (peer, 1234)})
+
+
+def test_admin_guard_rate_limits_before_checking_the_token():
+    guard = AdminGuard("secret", TRUSTED, RateRule(rate=0.001, burst=2))
+    guard.check(admin_request("secret"))
+    with pytest.raises(HTTPException) as refused:
+        guard.check(admin_request("guess"))
+    assert refused.value.status_code == 403
+    with pytest.raises(HTTPException) as limited:
+        guard.check(admin_request("secret"))
+    assert limited.value.status_code == 429
+    # Buckets are per client
+    guard.check(admin_request("secret", peer="203.0.113.8"))
+
+
+def test_admin_guard_without_a_token_refuses_everyone():
+    with pytest.raises(HTTPException) as refused:
+        AdminGuard("", TRUSTED).check(admin_request(""))
+    assert refused.value.status_code == 403
+
+
+def test_admin_endpoints_need_the_token(api):
+    async def scenario():
+        client = api.client
+        assert (await client.get("/export")).status_code == 401
+        assert (await client.post("/fans/scores/rebuild", headers={"X-Admin-Token": "guess"})).status_code == 403
+        assert (await client.get("/metrics/profiler")).status_code == 401
+        exports = await client.get("/export", headers=api.admin_headers)
+        assert exports.status_code == 200 and "votes" in exports.json()["exports"]
+
+    api.run(scenario())
@@ -0,0 +1,101 @@
+import sys
+import time
+from textwrap import dedent
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app_factory import AppSettings, Feature, StartupTimer, create_app, enabled_features
+
+FEATURE = dedent('''
+    import asyncio
+
+    from fastapi import APIRouter
+
+    router = APIRouter(prefix="/api/{name}")
+
+    @router.get("/ping")
+    async def ping():
+        return {{"pong": "{name}"}}
+
+    async def startup(timer):
+        with timer.phase("warm"):
+            await asyncio.sleep(0.02)
+
+    def health():
+        return {{"{name}": "ok"}}
+''')
+
+
+def test_timer_orders_phases_and_keeps_first_marks():
+    timer = StartupTimer()
+    with timer.phase("outer"):
+        with timer.scoped("votes").phase("import"):
+            time.sleep(0.01)
+    timer.mark("serving")
+    first = timer.marks["serving"]
+    timer.mark("serving")
+
+    snapshot = timer.snapshot()
+    assert snapshot["serving_ms"] == first
+    names = [phase["name"] for phase in snapshot["phases"] if phase["name"] != "boot"]
+    assert names == ["outer", "votes.import"]
+    outer, inner = snapshot["phases"][-2:]
+    assert outer["ms"] >= inner["ms"] >= 10
+    assert snapshot["since"] in ("process_start", "app_import")
+
+
+def test_features_load_lazily_and_report_startup_phases(tmp_path, monkeypatch):
+    for name in ("demo_fast", "demo_lazy"):
+        (tmp_path / f"{name}.py").write_text(FEATURE.format(name=name))
+    (tmp_path / "demo_broken.py").write_text("raise RuntimeError('no config')\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    features = (
+        Feature("fast", "demo_fast", ("/api/demo_fast",)),
+        Feature("broken", "demo_broken", ("/api/demo_broken",)),
+        Feature("lazy", "demo_lazy", ("/api/demo_lazy",), requires=("fast",), preload=False),
+    )
+
+    with TestClient(create_app(AppSettings(), features)) as client:
+        deadline = time.monotonic() + 5
+        while "preloaded_ms" not in client.get("/api/health").json()["data"]["startup"]:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        assert "demo_lazy" not in sys.modules
+
+        health = client.get("/api/health").json()
+        assert health["success"] is False
+        data = health["data"]
+        assert data["demo_fast"] == "ok"
+        assert {name: f["status"] for name, f in data["features"].items()} == {
+            "fast": "loaded", "broken": "failed", "lazy": "idle",
+        }
+        assert data["features"]["broken"]["error"] == "RuntimeError: no config"
+        startup = data["startup"]
+        assert startup["first_request_ms"] >= startup["serving_ms"]
+        phases = {phase["name"]: phase for phase in startup["phases"]}
+        assert {"create_app", "fast.import", "fast.startup", "fast.warm"} <= set(phases)
+        assert phases["fast.startup"]["ms"] >= phases["fast.warm"]["ms"] >= 20
+
+        broken = client.get("/api/demo_broken/anything")
+        assert broken.status_code == 503 and broken.headers["retry-after"]
+
+        # First use imports the feature and routes the request to it
+        assert client.get("/api/demo_lazy/ping").json() == {"pong": "demo_lazy"}
+        assert "lazy.startup" in {phase["name"] for phase in client.get("/api/health").json()["data"]["startup"]["phases"]}
+
+    for name in ("demo_fast", "demo_lazy", "demo_broken"):
+        sys.modules.pop(name, None)
+
+
+def test_enabled_features_pull_in_requirements():
+    features = (
+        Feature("core", "core"),
+        Feature("images", "images_api", requires=("core",)),
+        Feature("votes", "votes_api", requires=("core", "images")),
+        Feature("questions", "questions_api", requires=("core",)),
+    )
+    assert [f.name for f in enabled_features(features, ("votes",))] == ["core", "images", "votes"]
+    assert len(enabled_features(features, None)) == 4
+    with pytest.raises(ValueError):
+        enabled_features(features, ("votes", "polls"))
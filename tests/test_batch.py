@@ -0,0 +1,111 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+from fastapi.testclient import TestClient
+
+from batch import SubrequestError, SubrequestRunner
+
+
+def batch_app(runner):
+    app = FastAPI()
+
+    @app.get("/api/sleep")
+    async def sleep(ms: int):
+        await asyncio.sleep(ms / 1000)
+        return {"slept": ms}
+
+    @app.get("/api/missing")
+    async def missing():
+        raise HTTPException(status_code=404, detail="Not here")
+
+    @app.get("/api/text")
+    async def text():
+        return PlainTextResponse("plain")
+
+    @app.get("/api/whoami")
+    async def whoami(request: Request):
+        return {"encoding": request.headers.get("accept-encoding"), "tag": request.headers.get("x-tag")}
+
+    @app.post("/api/run")
+    async def run(request: Request):
+        pairs = [tuple(pair) for pair in await request.json()]
+        runner.validate(pairs)
+        return runner.respond(request, {"data": await runner.run(request, pairs, timeout_ms=200)})
+
+    return TestClient(app)
+
+
+def test_sections_run_concurrently_and_fail_independently():
+    runner = SubrequestRunner()
+    client = batch_app(runner)
+    started = time.perf_counter()
+    sections = client.post("/api/run", json=[
+        ["a", "/api/sleep?ms=100"],
+        ["b", "/api/sleep?ms=100"],
+        ["slow", "/api/sleep?ms=1000"],
+        ["missing", "/api/missing"],
+        ["text", "/api/text"],
+        ["who", "/api/whoami"],
+    ], headers={"X-Tag": "home", "Accept-Encoding": "identity"}).json()["data"]
+    # One request pays for the slowest section within its timeout, not the sum
+    assert time.perf_counter() - started < 0.6
+
+    assert sections["a"]["data"] == sections["b"]["data"] == {"slept": 100}
+    assert sections["slow"]["status"] == 504
+    assert sections["missing"] == {"status": 404, "ms": sections["missing"]["ms"], "data": {"detail": "Not here"}}
+    assert sections["text"]["data"] == "plain"
+    # Parent headers are forwarded, except the ones describing the parent's own body
+    assert sections["who"]["data"] == {"encoding": None, "tag": "home"}
+    assert runner.stats()["timeouts"] == 1 and runner.stats()["failures"] == 1
+
+
+def test_large_payloads_are_gzipped_when_accepted():
+    runner = SubrequestRunner(gzip_min_size=64)
+    client = batch_app(runner)
+    pairs = [[f"s{i}", "/api/sleep?ms=0"] for i in range(10)]
+    response = client.post("/api/run", json=pairs, headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert len(response.json()["data"]) == 10
+    assert response.headers["vary"] == "Accept-Encoding"
+
+    plain = client.post("/api/run", json=pairs[:1], headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in plain.headers
+
+
+def test_validate_rejects_unsafe_batches():
+    runner = SubrequestRunner(max_requests=2)
+    for pairs in (
+        [],
+        [("a", "/api/outfits"), ("b", "/api/questions"), ("c", "/api/fans")],
+        [("a", "/api/outfits"), ("a", "/api/questions")],
+        [("a", "/api/batch")],
+        [("a", "/api/home?x=1")],
+        [("a", "/api/outfits/stream")],
+        [("a", "/docs")],
+    ):
+        with pytest.raises(SubrequestError):
+            runner.validate(pairs)
+    runner.validate([("a", "/api/outfits?sort=new"), ("b", "/api/questions")])
+
+
+def test_home_returns_every_section(api):
+    async def scenario():
+        client = api.client
+        home = await client.get("/home")
+        assert home.status_code == 200
+        body = home.json()
+        assert body["partial"] is False
+        assert {name: section["status"] for name, section in body["data"].items()} == {
+            "outfits": 200, "questions": 200, "wallpapers": 200, "topFans": 200, "voteStats": 200,
+        }
+        # Sections embed the same body the endpoint serves directly
+        outfits = (await client.get("/outfits")).json()
+        assert {o["id"] for o in body["data"]["outfits"]["data"]["data"]} == {o["id"] for o in outfits["data"]}
+
+        refused = await client.post("/batch", json={"requests": [{"id": "a", "path": "/api/home"}]})
+        assert refused.status_code == 400
+
+    api.run(scenario())
@@ -0,0 +1,79 @@
+import asyncio
+import json
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+from typer.testing import CliRunner
+
+import bulk_load
+from database import use_client
+
+SMALL = ["--outfits", "5", "--fans", "40", "--votes", "120", "--questions", "10", "--wallpapers", "3"]
+
+
+@pytest.fixture
+def mongo(monkeypatch):
+    monkeypatch.setenv("MONGO_URL", "mongodb://unused")
+    monkeypatch.setenv("DB_NAME", "bulk_load_test")
+    monkeypatch.setenv("MONGO_PREWARM_CONNECTIONS", "1")
+    client = AsyncMongoMockClient()
+    use_client(client)
+    yield client["bulk_load_test"]
+    use_client(None)
+
+
+def invoke(*args):
+    result = CliRunner().invoke(bulk_load.cli, [str(arg) for arg in args])
+    assert result.exit_code == 0, result.output
+    return result.output
+
+
+def test_loading_a_snapshot_twice_does_not_duplicate(mongo, tmp_path):
+    invoke("generate", *SMALL, "--no-load", "--snapshot", tmp_path, "--compress")
+    manifest = json.loads((tmp_path / "manifest.json").read_text())
+    expected = {entry["name"]: entry["count"] for entry in manifest["collections"]}
+    assert expected == {"outfits": 5, "fans": 40, "wallpapers": 3, "questions": 10, "votes": 120}
+
+    async def counts():
+        return {name: await mongo[name].count_documents({}) for name in expected}
+
+    invoke("load", tmp_path, "--index", "--batch-size", "25")
+    first = asyncio.run(counts())
+    assert first == expected
+
+    # A rerun into the populated collections skips every document
+    output = invoke("load", tmp_path, "--index", "--batch-size", "25")
+    assert "votes: 0/120" in output and "120 duplicates skipped" in output
+    assert asyncio.run(counts()) == expected
+
+    # Votes are unique per (outfit, fan) and outfit totals match them
+    async def consistency():
+        pairs = {(vote["outfitId"], vote["fanId"]) async for vote in mongo.votes.find()}
+        outfits = {outfit["_id"]: outfit["votes"] async for outfit in mongo.outfits.find()}
+        per_outfit = {}
+        async for vote in mongo.votes.find():
+            per_outfit[vote["outfitId"]] = per_outfit.get(vote["outfitId"], 0) + 1
+        return len(pairs), outfits, per_outfit
+
+    distinct, outfits, per_outfit = asyncio.run(consistency())
+    assert distinct == 120
+    assert {k: v for k, v in outfits.items() if v} == per_outfit
+
+
+def test_snapshot_round_trips_extended_json(tmp_path):
+    dataset = bulk_load.Dataset(bulk_load.Params(outfits=3, fans=10, votes=20, questions=4, wallpapers=2))
+    writer = bulk_load.SnapshotWriter(tmp_path, compress=False)
+    originals = {}
+    for name in bulk_load.COLLECTIONS:
+        writer.open(name)
+        originals[name] = []
+        for batch in dataset.batches(name, 7):
+            writer.write(name, batch)
+            originals[name].extend(batch)
+    writer.finish(dataset.params)
+
+    for entry in json.loads((tmp_path / "manifest.json").read_text())["collections"]:
+        name = entry["name"]
+        loaded = [doc for batch in bulk_load.read_snapshot(tmp_path, name, entry["file"], 7) for doc in batch]
+        # Snapshot dates are kept to the millisecond, which generated ones already are
+        assert loaded == originals[name], name
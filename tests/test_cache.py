@@ -0,0 +1,126 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+from cache import ResponseCache
+
+
+def cached_app(cache, handler):
+    app = FastAPI()
+
+    @app.get("/api/outfits")
+    @cache.cached(ttl=60, tags=["outfits"])
+    async def outfits(sort: str = "popular"):
+        return await handler(sort)
+
+    return TestClient(app)
+
+
+def test_cancelled_leader_does_not_fail_followers():
+    async def scenario():
+        cache = ResponseCache()
+        calls = 0
+
+        async def compute():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return {"ok": True}, {}
+
+        leader = asyncio.create_task(cache.lookup("/api/outfits", 10, (), compute))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(cache.lookup("/api/outfits", 10, (), compute))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+
+        entry = await follower
+        assert entry.body == b'{"ok":true}'
+        assert calls == 1
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        # The fill finished and was stored despite the cancellation
+        assert (await cache.lookup("/api/outfits", 10, (), compute)) is entry
+
+    asyncio.run(scenario())
+
+
+def test_fill_error_reaches_every_waiter_and_is_not_cached():
+    async def scenario():
+        cache = ResponseCache()
+
+        async def compute():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(
+            cache.lookup("/api/fans", 10, (), compute),
+            cache.lookup("/api/fans", 10, (), compute),
+            return_exceptions=True,
+        )
+        assert all(isinstance(result, ValueError) for result in results)
+        assert cache.stats()["entries"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_invalidation_drops_tagged_entries():
+    cache = ResponseCache()
+    calls = 0
+
+    async def handler(sort):
+        nonlocal calls
+        calls += 1
+        return {"sort": sort, "calls": calls}
+
+    client = cached_app(cache, handler)
+    first = client.get("/api/outfits?sort=newest")
+    assert client.get("/api/outfits?sort=newest").json() == first.json()
+    assert calls == 1
+    assert client.get("/api/outfits", headers={"If-None-Match": first.headers["etag"]}).status_code == 200
+    assert client.get("/api/outfits?sort=newest", headers={"If-None-Match": first.headers["etag"]}).status_code == 304
+
+    cache.invalidate("outfits")
+    fresh = client.get("/api/outfits?sort=newest")
+    assert fresh.json()["calls"] == 3
+    assert fresh.headers["etag"] != first.headers["etag"]
+    # Other tags leave the entry alone
+    cache.invalidate("wallpapers")
+    assert client.get("/api/outfits?sort=newest").json()["calls"] == 3
+
+
+def test_result_invalidated_while_computing_is_not_stored():
+    async def scenario():
+        cache = ResponseCache()
+
+        async def compute():
+            await asyncio.sleep(0)
+            cache.invalidate("votes")
+            return {"stale": True}, {}
+
+        await cache.lookup("/api/votes/stats", 10, ("votes",), compute)
+        assert cache.stats()["entries"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_only_200_responses_are_cached():
+    cache = ResponseCache()
+    calls = 0
+
+    async def handler(sort):
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            return JSONResponse({"detail": "Outfits are being reloaded"}, status_code=503, headers={"Retry-After": "1"})
+        return {"calls": calls}
+
+    client = cached_app(cache, handler)
+    unavailable = client.get("/api/outfits")
+    assert unavailable.status_code == 503
+    assert unavailable.headers["retry-after"] == "1"
+    assert "etag" not in unavailable.headers
+    assert client.get("/api/outfits").json() == {"calls": 2}
+    assert client.get("/api/outfits").json() == {"calls": 2}
@@ -0,0 +1,60 @@
+import asyncio
+
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockClient
+
+from counters import CounterService
+
+
+async def make_service(**kwargs):
+    db = AsyncMongoMockClient()["counters_test"]
+    wallpaper = ObjectId()
+    await db.wallpapers.insert_one({"_id": wallpaper, "downloads": 0})
+    service = CounterService(db, **kwargs)
+    await service.ensure_indexes()
+    return db, service, wallpaper
+
+
+def test_direct_mode_increments_the_document():
+    async def scenario():
+        db, service, wallpaper = await make_service(promote_rate=1000)
+        assert await service.incr("wallpapers", wallpaper, "downloads") == 1
+        assert await service.incr("wallpapers", wallpaper, "downloads", 2) == 3
+        assert (await db.wallpapers.find_one({"_id": wallpaper}))["downloads"] == 3
+        assert await db.counter_shards.count_documents({}) == 0
+        assert await service.incr("wallpapers", ObjectId(), "downloads") is None
+
+    asyncio.run(scenario())
+
+
+def test_hot_counter_is_sharded_and_folded_back():
+    async def scenario():
+        db, service, wallpaper = await make_service(shards=4, promote_rate=5, read_ttl=0)
+        for _ in range(40):
+            await service.incr("wallpapers", wallpaper, "downloads")
+        assert service.stats()["promotions"] == 1
+        assert service.stats()["sharded"][0]["counter"] == f"wallpapers:{wallpaper}:downloads"
+
+        # Increments spread over the shards; reads add them to the document
+        shards = await db.counter_shards.find().to_list(None)
+        owned = (await db.wallpapers.find_one({"_id": wallpaper}))["downloads"]
+        assert 1 < len(shards) <= 4
+        assert owned + sum(shard["n"] for shard in shards) == 40
+        assert await service.read("wallpapers", wallpaper, "downloads") == 40
+
+        assert await service.fold() == len(shards)
+        assert (await db.wallpapers.find_one({"_id": wallpaper}))["downloads"] == 40
+        assert await db.counter_shards.count_documents({"n": {"$ne": 0}}) == 0
+        assert await service.read("wallpapers", wallpaper, "downloads") == 40
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_increments_are_not_lost():
+    async def scenario():
+        db, service, wallpaper = await make_service(shards=8, promote_rate=20)
+        await asyncio.gather(*(service.incr("wallpapers", wallpaper, "downloads") for _ in range(200)))
+        await service.fold()
+        assert (await db.wallpapers.find_one({"_id": wallpaper}))["downloads"] == 200
+
+    asyncio.run(scenario())
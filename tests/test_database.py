@@ -0,0 +1,85 @@
+import asyncio
+import threading
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+from pymongo.errors import ServerSelectionTimeoutError
+
+from database import Database, DatabaseSettings, PoolStats
+
+
+def test_pool_stats_track_checkouts_across_driver_threads():
+    stats = PoolStats()
+    for _ in range(3):
+        stats.connection_created(None)
+
+    def checkout():
+        stats.connection_check_out_started(None)
+        stats.connection_checked_out(None)
+
+    threads = [threading.Thread(target=checkout) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats.connection_check_out_started(None)
+
+    snapshot = stats.snapshot()
+    assert (snapshot["open"], snapshot["in_use"], snapshot["waiting"], snapshot["checkouts"]) == (3, 2, 1, 2)
+    assert snapshot["checkout_ms_max"] >= snapshot["checkout_ms_avg"] >= 0
+
+    # A timed-out checkout leaves the wait queue without taking a connection
+    stats.connection_check_out_failed(None)
+    stats.connection_checked_in(None)
+    stats.connection_closed(None)
+    snapshot = stats.snapshot()
+    assert (snapshot["open"], snapshot["in_use"], snapshot["waiting"]) == (2, 1, 0)
+    assert snapshot["checkout_failures"] == 1
+
+
+def test_settings_from_env(monkeypatch):
+    monkeypatch.setenv("MONGO_URL", "mongodb://db:27017")
+    monkeypatch.setenv("DB_NAME", "outfits")
+    monkeypatch.setenv("MONGO_MAX_POOL_SIZE", "250")
+    monkeypatch.setenv("MONGO_READ_PREFERENCE", "secondaryPreferred")
+    settings = DatabaseSettings.from_env()
+    assert (settings.url, settings.name, settings.max_pool_size) == ("mongodb://db:27017", "outfits", 250)
+    assert settings.read_preference == "secondaryPreferred"
+    assert settings.wait_queue_timeout_ms == 2000
+
+
+class FlakyDb:
+    def __init__(self, db, failures):
+        self._db = db
+        self.failures = failures
+        self.pings = 0
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+    async def command(self, name, *args, **kwargs):
+        self.pings += 1
+        if self.failures:
+            self.failures -= 1
+            raise ServerSelectionTimeoutError("no primary")
+        return {"ok": 1.0}
+
+
+def test_connect_retries_until_the_server_answers_then_prewarms(monkeypatch):
+    async def no_sleep(delay):
+        pass
+
+    monkeypatch.setattr(asyncio, "sleep", no_sleep)
+    settings = DatabaseSettings(url="", name="database_test", prewarm_connections=4, connect_retries=3)
+    database = Database(settings, client=AsyncMongoMockClient())
+    database.db = FlakyDb(database.db, failures=2)
+    asyncio.run(database.connect())
+    assert database.ready and database.db.pings == 3 + 4
+    assert database.stats()["status"] == "connected"
+
+    # Out of retries: the last error surfaces
+    database = Database(settings, client=AsyncMongoMockClient())
+    database.db = FlakyDb(database.db, failures=3)
+    with pytest.raises(ServerSelectionTimeoutError):
+        asyncio.run(database.connect())
+    assert not database.ready
@@ -0,0 +1,104 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockClient
+
+from fan_scoring import FanScoring, ScoringRules
+from vote_ingest import PendingVote
+
+
+class FlakyFans:
+    def __init__(self, collection, failures):
+        self._collection = collection
+        self.failures = failures
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+    async def bulk_write(self, requests, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("primary stepped down")
+        return await self._collection.bulk_write(requests, **kwargs)
+
+
+class Db:
+    def __init__(self, db, fans):
+        self._db = db
+        self.fans = fans
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+
+def test_failed_points_are_kept_and_retried():
+    async def scenario():
+        db = AsyncMongoMockClient()["scoring_test"]
+        fan = ObjectId()
+        await db.fans.insert_one({"_id": fan, "username": "ana", "points": 0})
+        scoring = FanScoring(Db(db, FlakyFans(db.fans, failures=1)), ScoringRules(default_points=10))
+        votes = [PendingVote(ObjectId(), fan, "💖", created_at=datetime.utcnow())]
+
+        try:
+            await scoring.record(votes)
+        except ConnectionError:
+            pass
+        assert (await db.fans.find_one({"_id": fan}))["points"] == 0
+        assert scoring.stats()["unwritten_fans"] == 1
+
+        # The next batch carries the failed increments along
+        await scoring.record(votes)
+        assert (await db.fans.find_one({"_id": fan}))["points"] == 20
+        assert scoring.stats()["unwritten_fans"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_rules_reject_a_half_life_that_overflows_the_weights():
+    try:
+        ScoringRules(half_life_days=0.5)
+    except ValueError as error:
+        assert "FAN_SCORE_EPOCH" in str(error)
+    else:
+        raise AssertionError("expected ValueError")
+    rules = ScoringRules(half_life_days=30, epoch=datetime(2026, 1, 1))
+    assert rules.weight(datetime(2026, 1, 31)) == 2.0
+
+
+def test_rebuild_keeps_points_scored_while_it_runs():
+    async def scenario():
+        db = AsyncMongoMockClient()["scoring_test"]
+        fan = ObjectId()
+        await db.fans.insert_one({"_id": fan, "username": "ana", "points": 0})
+        scoring = FanScoring(db, ScoringRules(default_points=10))
+
+        async def score(outfit):
+            vote = PendingVote(outfit, fan, "💖", created_at=datetime.utcnow())
+            await db.votes.insert_one(vote.to_document())
+            await scoring.record([vote])
+
+        for _ in range(2):
+            await score(ObjectId())
+        # Points the scan will find but that never reached the fan document
+        await db.fans.update_one({"_id": fan}, {"$set": {"points": 5}})
+        pauses = 0
+
+        @asynccontextmanager
+        async def pause():
+            nonlocal pauses
+            pauses += 1
+            yield
+            if pauses == 1:
+                # A flush scores a vote between the cutoff and the rewrite
+                await score(ObjectId())
+
+        result = await scoring.rebuild(pause)
+        assert result["votes_scanned"] == 2
+        assert (await db.fans.find_one({"_id": fan}))["points"] == 30
+
+        await score(ObjectId())
+        assert (await db.fans.find_one({"_id": fan}))["points"] == 40
+
+    asyncio.run(scenario())
@@ -0,0 +1,66 @@
+import asyncio
+import json
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+from pydantic import BaseModel
+
+import serialization_bench
+from fast_json import FastJSONResponse, build_models, dumps, projection_for, serialization_mode
+
+
+class Look(BaseModel):
+    name: str
+    tags: list
+
+
+class Outfit(BaseModel):
+    id: str
+    look: Look
+    created_at: datetime
+
+
+def test_dumps_encodes_models_object_ids_and_sets():
+    outfit_id = ObjectId()
+    outfit = Outfit(id="o1", look=Look(name="Gala", tags=["red"]), created_at=datetime(2024, 1, 1, 12, 30))
+    body = json.loads(dumps({"outfit": outfit, "owner": outfit_id, "colors": {"red"}, 7: "seven"}))
+    assert body == {
+        "outfit": {"id": "o1", "look": {"name": "Gala", "tags": ["red"]}, "created_at": "2024-01-01T12:30:00"},
+        "owner": str(outfit_id),
+        "colors": ["red"],
+        "7": "seven",
+    }
+    with pytest.raises(TypeError):
+        dumps({"when": object()})
+
+
+def test_every_serialization_mode_matches_the_validated_response():
+    docs = serialization_bench.make_documents(50)
+
+    async def bodies():
+        return {name: json.loads(await path(docs)) for name, path in serialization_bench.PATHS.items()}
+
+    results = asyncio.run(bodies())
+    assert len(results["original"]) == 50
+    for name, body in results.items():
+        assert body == results["original"], name
+
+
+def test_build_models_only_keeps_declared_fields():
+    docs = [{"_id": ObjectId(), "id": "o1", "look": {"name": "Gala", "tags": []}, "created_at": datetime(2024, 1, 1)}]
+    assert projection_for(Outfit) == {"id": 1, "look": 1, "created_at": 1}
+    raw = build_models(Outfit, docs, "raw")
+    assert raw == [{"id": "o1", "look": {"name": "Gala", "tags": []}, "created_at": datetime(2024, 1, 1)}]
+    constructed = build_models(Outfit, docs, "construct")
+    validated = build_models(Outfit, docs, "validated")
+    assert isinstance(validated[0].look, Look)
+    assert FastJSONResponse(constructed).body == FastJSONResponse(validated).body == FastJSONResponse(raw).body
+
+
+def test_serialization_mode_is_validated(monkeypatch):
+    monkeypatch.setenv("SERIALIZATION_MODE", "construct")
+    assert serialization_mode() == "construct"
+    monkeypatch.setenv("SERIALIZATION_MODE", "fast")
+    with pytest.raises(ValueError):
+        serialization_mode()
@@ -0,0 +1,123 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from mongomock_motor import AsyncMongoMockClient
+from pymongo.errors import BulkWriteError
+
+from heartbeats import CLIENTS, RAW, HeartbeatIngestor
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class FlakyCollection:
+    """Wraps a collection so its next ``failures`` writes raise ``error``."""
+
+    def __init__(self, collection, error, failures=1):
+        self._collection = collection
+        self._error = error
+        self.failures = failures
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+    async def bulk_write(self, requests, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise self._error
+        return await self._collection.bulk_write(requests, **kwargs)
+
+    async def insert_many(self, documents, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            await self._collection.insert_many(documents[1:], **kwargs)
+            raise self._error
+        return await self._collection.insert_many(documents, **kwargs)
+
+
+class Database:
+    """A mongomock database with some collections swapped out."""
+
+    def __init__(self, db, **overrides):
+        self._db = db
+        self._overrides = overrides
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+    def __getitem__(self, name):
+        return self._overrides.get(name) or self._db[name]
+
+
+def beats(client, start, n):
+    return [{"client_name": client, "timestamp": start + timedelta(seconds=i)} for i in range(n)]
+
+
+def test_falls_back_to_a_regular_collection_with_a_ttl():
+    async def scenario():
+        db = AsyncMongoMockClient()["heartbeats_test"]
+        ingestor = HeartbeatIngestor(db)
+        await ingestor.ensure_collections()
+        indexes = await db[RAW].index_information()
+        assert indexes["timestamp_ttl"]["expireAfterSeconds"] == ingestor.retention.raw_s
+
+        for heartbeat in beats("a", datetime.utcnow() - timedelta(minutes=1), 3):
+            ingestor.record(heartbeat)
+        await ingestor.flush()
+        assert await db[RAW].count_documents({}) == 3
+        assert (await ingestor.latest())[0]["count"] == 3
+
+    run(scenario())
+
+
+def test_failed_rollups_are_retried_on_the_next_flush():
+    async def scenario():
+        mock = AsyncMongoMockClient()["heartbeats_test"]
+        clients = FlakyCollection(mock[CLIENTS], RuntimeError("primary stepped down"))
+        minutes = FlakyCollection(mock["heartbeats_1m"], RuntimeError("primary stepped down"))
+        ingestor = HeartbeatIngestor(Database(mock, **{CLIENTS: clients, "heartbeats_1m": minutes}))
+        start = datetime(2024, 1, 1, 12)
+
+        for heartbeat in beats("a", start, 3):
+            ingestor.record(heartbeat)
+        await ingestor.flush()
+        assert ingestor.written == 3 and ingestor.dropped == 0
+        assert await mock[CLIENTS].count_documents({}) == 0
+        # The hourly rollup is written independently of the failed ones
+        assert (await mock["heartbeats_1h"].find_one())["count"] == 3
+        assert ingestor.unapplied_rollups == 2
+
+        # A quiet flush retries the carried updates
+        await ingestor.flush()
+        assert ingestor.unapplied_rollups == 0
+        assert (await mock[CLIENTS].find_one({"_id": "a"}))["count"] == 3
+
+        # Later batches merge with anything still carried
+        minutes.failures = 1
+        for heartbeat in beats("a", start + timedelta(seconds=3), 2):
+            ingestor.record(heartbeat)
+        await ingestor.flush()
+        for heartbeat in beats("a", start + timedelta(seconds=5), 1):
+            ingestor.record(heartbeat)
+        await ingestor.flush()
+        bucket = await mock["heartbeats_1m"].find_one()
+        assert bucket["count"] == 6
+        assert bucket["first"] == start and bucket["last"] == start + timedelta(seconds=5)
+
+    run(scenario())
+
+
+def test_partial_insert_only_drops_the_failed_points():
+    async def scenario():
+        mock = AsyncMongoMockClient()["heartbeats_test"]
+        error = BulkWriteError({"writeErrors": [{"index": 0, "code": 11000, "errmsg": "duplicate"}]})
+        ingestor = HeartbeatIngestor(Database(mock, **{RAW: FlakyCollection(mock[RAW], error)}))
+
+        for heartbeat in beats("a", datetime(2024, 1, 1, 12), 4):
+            ingestor.record(heartbeat)
+        await ingestor.flush()
+        assert ingestor.dropped == 1 and ingestor.written == 3
+        assert (await mock[CLIENTS].find_one({"_id": "a"}))["count"] == 3
+
+    run(scenario())
@@ -0,0 +1,15 @@
+import pytest
+from PIL import Image
+
+from images import ImageError, render
+
+
+def test_render_rejects_images_over_the_pixel_limit(tmp_path):
+    source = tmp_path / "source.png"
+    Image.new("RGB", (20, 20)).save(source)
+    with pytest.raises(ImageError):
+        render(str(source), str(tmp_path), [320], ["jpeg"], {"jpeg": 80}, max_pixels=399)
+    assert not list(tmp_path.glob("*w.jpg"))
+
+    result = render(str(source), str(tmp_path), [320], ["jpeg"], {"jpeg": 80}, max_pixels=400)
+    assert [variant["width"] for variant in result["variants"]] == [20]
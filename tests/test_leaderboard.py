@@ -0,0 +1,89 @@
+import asyncio
+
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockClient
+
+from leaderboard import Leaderboard
+from vote_ingest import ACK_AFTER_FLUSH, VoteIngestor
+
+
+class SlowVotes:
+    """Signals once a batch is stored, then holds it before the listeners run."""
+
+    def __init__(self, collection):
+        self._collection = collection
+        self.stored = asyncio.Event()
+        self.release = asyncio.Event()
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+    async def bulk_write(self, requests, **kwargs):
+        result = await self._collection.bulk_write(requests, **kwargs)
+        self.stored.set()
+        await self.release.wait()
+        return result
+
+
+class Db:
+    def __init__(self, db, votes):
+        self._db = db
+        self.votes = votes
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+
+async def make_leaderboard():
+    db = AsyncMongoMockClient()["leaderboard_test"]
+    outfit, deleted = ObjectId(), ObjectId()
+    await db.outfits.insert_one({"_id": outfit, "title": "kept", "votes": 0})
+    await db.votes.insert_many([{"outfitId": outfit} for _ in range(2)])
+    leaderboard = Leaderboard()
+    leaderboard.upsert_outfit(outfit, "kept", "", votes=2)
+    leaderboard.upsert_outfit(deleted, "deleted", "", votes=5)
+    return db, leaderboard, outfit, deleted
+
+
+def test_vote_stored_before_reconcile_is_counted_once():
+    async def scenario():
+        db, leaderboard, outfit, deleted = await make_leaderboard()
+        votes = SlowVotes(db.votes)
+        ingestor = VoteIngestor(Db(db, votes), ack_mode=ACK_AFTER_FLUSH)
+        ingestor.add_listener(lambda written: [leaderboard.record_vote(vote.outfit_id) for vote in written])
+
+        submitted = asyncio.ensure_future(ingestor.submit(str(outfit), str(ObjectId())))
+        await asyncio.sleep(0)
+        flushing = asyncio.ensure_future(ingestor.flush())
+        # Stored in Mongo, but the listener has not recorded it in memory yet
+        await votes.stored.wait()
+        reconciling = asyncio.ensure_future(leaderboard.reconcile(db, ingestor.paused))
+        await asyncio.sleep(0.01)
+        votes.release.set()
+        await asyncio.gather(submitted, flushing)
+        result = await reconciling
+
+        assert leaderboard.get(outfit).votes == 3
+        assert result["corrected"] == {}
+        assert result["removed"] == 1
+        assert str(deleted) not in leaderboard
+        assert leaderboard.total_votes == 3
+
+    asyncio.run(scenario())
+
+
+def test_drift_is_corrected_and_later_votes_kept():
+    async def scenario():
+        db, leaderboard, outfit, _ = await make_leaderboard()
+        # Written by another process and never seen in memory
+        await db.votes.insert_one({"outfitId": outfit})
+        result = await leaderboard.reconcile(db)
+        # Stored after the cutoff: recorded in memory, left for the next reconcile
+        await db.votes.insert_one({"_id": ObjectId(), "outfitId": outfit})
+        leaderboard.record_vote(outfit)
+
+        assert result["corrected"] == {str(outfit): 1}
+        assert leaderboard.get(outfit).votes == 4
+        assert (await leaderboard.reconcile(db))["corrected"] == {}
+
+    asyncio.run(scenario())
@@ -0,0 +1,86 @@
+import asyncio
+import json
+from datetime import datetime
+
+from leaderboard import Leaderboard
+from live_stream import LiveStream
+
+
+def parse(message):
+    fields = dict(line.split(": ", 1) for line in message.decode().strip().split("\n"))
+    return fields["event"], int(fields["id"]), json.loads(fields["data"])
+
+
+def make_stream(buffer_size=16):
+    leaderboard = Leaderboard()
+    leaderboard.upsert_outfit("a", "First", "a.jpg", 5, datetime(2024, 1, 1))
+    leaderboard.upsert_outfit("b", "Second", "b.jpg", 3, datetime(2024, 1, 2))
+    stream = LiveStream(leaderboard, buffer_size=buffer_size)
+    stream._compute_delta()
+    return leaderboard, stream
+
+
+def test_ticks_publish_coalesced_deltas_to_every_subscriber():
+    async def scenario():
+        leaderboard, stream = make_stream()
+        first, second = stream.subscribe(), stream.subscribe()
+        event, seq, payload = parse(first.queue.get_nowait())
+        assert (event, seq, payload["total_votes"]) == ("snapshot", 0, 8)
+        second.queue.get_nowait()
+
+        # Nothing marked dirty: nothing published
+        stream.tick()
+        assert first.queue.empty()
+
+        for _ in range(3):
+            leaderboard.record_vote("b")
+            stream.mark_dirty()
+        stream.tick()
+        message = first.queue.get_nowait()
+        # Every subscriber gets the same encoded bytes
+        assert second.queue.get_nowait() is message
+        event, seq, payload = parse(message)
+        assert (event, seq, payload["total_votes"]) == ("delta", 1, 11)
+        assert {row["id"]: row["ranking"] for row in payload["changed"]} == {"b": 1, "a": 2}
+
+        leaderboard.remove_outfit("a")
+        stream.mark_dirty()
+        stream.tick()
+        assert parse(first.queue.get_nowait())[2]["removed"] == ["a"]
+
+    asyncio.run(scenario())
+
+
+def test_slow_consumer_is_resynced_with_a_snapshot():
+    async def scenario():
+        leaderboard, stream = make_stream(buffer_size=2)
+        subscriber = stream.subscribe()
+        for _ in range(2):
+            leaderboard.record_vote("a")
+            stream.mark_dirty()
+            stream.tick()
+        # The full backlog was replaced by one snapshot at the latest sequence
+        assert subscriber.queue.qsize() == 1
+        assert stream.stats()["slow_consumer_resyncs"] == 1
+        leaderboard.record_vote("a")
+        stream.mark_dirty()
+        stream.tick()
+        event, seq, payload = parse(subscriber.queue.get_nowait())
+        assert (event, seq, payload["total_votes"]) == ("snapshot", 2, 10)
+        # Deltas carry on from the snapshot
+        assert parse(subscriber.queue.get_nowait())[:2] == ("delta", 3)
+
+    asyncio.run(scenario())
+
+
+def test_events_unsubscribe_when_the_client_goes_away():
+    async def scenario():
+        _, stream = make_stream()
+        subscriber = stream.subscribe()
+        events = stream.events(subscriber)
+        assert parse(await events.__anext__())[0] == "snapshot"
+        assert stream.connections == 1
+        await events.aclose()
+        assert stream.connections == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,98 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+from metrics import MetricsMiddleware, Registry, SamplingProfiler, http_requests
+
+
+def busy(ms):
+    deadline = time.perf_counter() + ms / 1000
+    while time.perf_counter() < deadline:
+        pass
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    latency = registry.histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe('/a"b', value=value)
+    registry.add_collector(lambda: {"queue_depth": 7})
+
+    lines = registry.render().splitlines()
+    assert 'latency_seconds_bucket{route="/a\\"b",le="0.1"} 2' in lines
+    assert 'latency_seconds_bucket{route="/a\\"b",le="1.0"} 3' in lines
+    assert 'latency_seconds_bucket{route="/a\\"b",le="+Inf"} 4' in lines
+    assert 'latency_seconds_count{route="/a\\"b"} 4' in lines
+    assert 'latency_seconds_sum{route="/a\\"b"} 3.65' in lines
+    assert lines[-2:] == ["# TYPE queue_depth gauge", "queue_depth 7"]
+
+
+def test_profiler_keeps_folded_stacks_for_slow_requests_only():
+    profiler = SamplingProfiler(interval_ms=1, threshold_ms=20)
+    assert profiler.status()["enabled"] is False
+    profiler.start()
+    try:
+        started = time.perf_counter()
+        busy(5)
+        profiler.request_finished("GET", "/fast", started, time.perf_counter())
+        started = time.perf_counter()
+        busy(60)
+        profiler.request_finished("GET", "/slow", started, time.perf_counter())
+    finally:
+        profiler.stop()
+
+    assert [profile["route"] for profile in profiler.profiles] == ["/slow"]
+    profile = profiler.profiles[0]
+    assert profile["duration_ms"] >= 60 and profile["samples"] > 0
+    stack, count = profile["folded"][0].rsplit(" ", 1)
+    assert "busy (test_metrics.py" in stack.split(";")[-1] and int(count) > 0
+
+    # Stopped: nothing more is recorded
+    profiler.request_finished("GET", "/slow", 0.0, 1.0)
+    assert len(profiler.profiles) == 1
+
+
+def test_middleware_labels_by_route_template():
+    async def app(scope, receive, send):
+        if scope["path"].startswith("/items/"):
+            scope["route"] = SimpleNamespace(path="/items/{id}")
+            status = 200
+        else:
+            status = 404
+        await send({"type": "http.response.start", "status": status, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def send(message):
+        pass
+
+    async def scenario():
+        middleware = MetricsMiddleware(app)
+        for path in ("/items/1", "/items/2", "/wp-login.php"):
+            await middleware({"type": "http", "method": "GET", "path": path}, None, send)
+
+    asyncio.run(scenario())
+    lines = http_requests.render()
+    assert 'http_request_duration_seconds_count{method="GET",route="/items/{id}",status="200"} 2' in lines
+    assert 'http_request_duration_seconds_count{method="GET",route="unmatched",status="404"} 1' in lines
+
+
+def test_profiler_endpoints(api):
+    async def scenario():
+        client = api.client
+        assert (await client.get("/metrics/profiler")).status_code == 401
+        enabled = await client.post(
+            "/metrics/profiler", headers=api.admin_headers, json={"enabled": True, "threshold_ms": 0, "interval_ms": 1}
+        )
+        assert enabled.json()["enabled"] is True
+        try:
+            await client.get("/health")
+            profiles = (await client.get("/metrics/profiles", headers=api.admin_headers)).json()["data"]
+            assert "/api/health" in {profile["route"] for profile in profiles}
+        finally:
+            disabled = await client.post("/metrics/profiler", headers=api.admin_headers, json={"enabled": False})
+        assert disabled.json()["enabled"] is False
+
+        scrape = (await client.get("/metrics")).text
+        assert 'http_request_duration_seconds_count{method="GET",route="/api/health",status="200"}' in scrape
+
+    api.run(scenario())
@@ -0,0 +1,70 @@
+import asyncio
+
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockClient
+
+from moderation import ANSWERED, DUPLICATE, PENDING, ModerationQueue
+
+QUESTION = "What lipstick shade did you wear in the summer lookbook video"
+REWORDED = "What lipstick shade did you wear in the summer lookbook video?!"
+
+
+async def make_queue():
+    db = AsyncMongoMockClient()["moderation_test"]
+    queue = ModerationQueue(db)
+    await queue.ensure_indexes()
+    return db, queue
+
+
+def test_submit_clusters_near_duplicates_and_resolve_answers_them():
+    async def scenario():
+        db, queue = await make_queue()
+        head = await queue.submit({"text": QUESTION})
+        copy = await queue.submit({"text": REWORDED})
+        other = await queue.submit({"text": "Where do you buy your running shoes"})
+        assert (head["status"], copy["status"], other["status"]) == (PENDING, DUPLICATE, PENDING)
+        assert copy["clusterId"] == head["_id"]
+        assert (await db.questions.find_one({"_id": head["_id"]}))["clusterSize"] == 2
+
+        result = await queue.resolve(answers=[(head["_id"], "Ruby Woo")])
+        assert result["answered"] == 2
+        assert (await db.questions.find_one({"_id": copy["_id"]}))["answer"] == "Ruby Woo"
+        # A later copy opens a new cluster rather than joining the answered one
+        again = await queue.submit({"text": REWORDED})
+        assert again["status"] == PENDING
+
+    asyncio.run(scenario())
+
+
+def test_adopt_does_not_join_a_head_answered_elsewhere():
+    async def scenario():
+        db, queue = await make_queue()
+        head = await queue.submit({"text": QUESTION})
+        # Answered by another worker; this process still holds the cluster
+        await db.questions.update_one({"_id": head["_id"]}, {"$set": {"status": ANSWERED, "answer": "Ruby Woo"}})
+        node_id = ObjectId()
+        await db.questions.insert_one({"_id": node_id, "text": REWORDED})
+
+        assert await queue.adopt() == 1
+        adopted = await db.questions.find_one({"_id": node_id})
+        assert adopted["status"] == PENDING and adopted["clusterId"] == node_id
+
+    asyncio.run(scenario())
+
+
+def test_refresh_resolves_node_answers_and_drops_closed_heads():
+    async def scenario():
+        db, queue = await make_queue()
+        head = await queue.submit({"text": QUESTION})
+        copy = await queue.submit({"text": REWORDED})
+        gone = await queue.submit({"text": "Where do you buy your running shoes"})
+        # PUT /api/questions/:id/answer on the Node API only sets the answer
+        await db.questions.update_one({"_id": head["_id"]}, {"$set": {"answer": "Ruby Woo"}})
+        await db.questions.delete_one({"_id": gone["_id"]})
+
+        assert await queue.refresh() == {"answered": 2, "closed": 1}
+        assert await db.questions.count_documents({"status": PENDING}) == 0
+        assert (await db.questions.find_one({"_id": copy["_id"]}))["status"] == ANSWERED
+        assert queue.stats()["pending_clusters"] == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,71 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockClient
+
+from pagination import InvalidCursor, decode_cursor, encode_cursor, paginate
+
+
+async def walk(collection, mode, limit, query=None):
+    ids, cursor = [], None
+    while True:
+        docs, page = await paginate(collection, query=query, mode=mode, limit=limit, cursor=cursor)
+        ids.extend(doc["_id"] for doc in docs)
+        cursor = page["nextCursor"]
+        if cursor is None:
+            assert not page["hasMore"]
+            return ids
+
+
+async def make_fans():
+    db = AsyncMongoMockClient()["pagination_test"]
+    start = datetime(2024, 1, 1)
+    fans = []
+    for i in range(11):
+        fan = {"_id": ObjectId(), "username": f"fan{i}", "createdAt": start + timedelta(days=i // 2)}
+        # Ties, nulls and documents without the sort field at all
+        if i % 4 == 1:
+            fan["points"] = None
+        elif i % 4 != 3:
+            fan["points"] = (i // 3) * 10
+        fans.append(fan)
+    await db.fans.insert_many(fans)
+    return db, fans
+
+
+def test_pages_cover_every_document_once_in_sort_order():
+    async def scenario():
+        db, fans = await make_fans()
+        for mode, field, reverse in (("points", "points", True), ("oldest", "createdAt", False)):
+            expected = sorted(
+                fans,
+                # Missing and null sort lowest, ties break on _id in the same direction
+                key=lambda fan: (fan.get(field) is not None, fan.get(field) or 0, fan["_id"]),
+                reverse=reverse,
+            )
+            for limit in (1, 2, 3, 20):
+                assert await walk(db.fans, mode, limit) == [fan["_id"] for fan in expected], (mode, limit)
+
+    asyncio.run(scenario())
+
+
+def test_query_is_kept_on_every_page():
+    async def scenario():
+        db, fans = await make_fans()
+        query = {"username": {"$in": ["fan1", "fan2", "fan3", "fan4"]}}
+        ids = await walk(db.fans, "points", 1, query)
+        assert sorted(ids) == sorted(fan["_id"] for fan in fans[1:5])
+
+    asyncio.run(scenario())
+
+
+def test_cursor_is_bound_to_its_sort_mode():
+    cursor = encode_cursor("points", {"_id": ObjectId(), "points": 5})
+    assert decode_cursor(cursor, "points")[0] == 5
+    for bad, mode in ((cursor, "oldest"), ("not-a-cursor", "points")):
+        try:
+            decode_cursor(bad, mode)
+        except InvalidCursor:
+            continue
+        raise AssertionError(f"{bad!r} accepted for {mode}")
@@ -0,0 +1,66 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockClient
+
+from search import SearchIndex
+
+
+def test_sync_follows_answers_rejections_and_deletions():
+    async def scenario():
+        db = AsyncMongoMockClient()["search_test"]
+        start = datetime(2026, 1, 1)
+        ids = [ObjectId() for _ in range(4)]
+        await db.questions.insert_many([
+            {"_id": oid, "text": f"pregunta numero {i}", "createdAt": start + timedelta(minutes=i)}
+            for i, oid in enumerate(ids)
+        ])
+        index = SearchIndex()
+        await index.rebuild(db)
+        assert len(index) == 4
+        assert index.last_id == ids[3]
+
+        later = start + timedelta(hours=1)
+        await db.questions.update_one({"_id": ids[0]}, {"$set": {"answer": "concierto", "updatedAt": later}})
+        # Answered by the Node API: no answeredAt
+        await db.questions.update_one({"_id": ids[1]}, {"$set": {"answer": "vestido"}})
+        await db.questions.update_one({"_id": ids[2]}, {"$set": {"status": "rejected", "updatedAt": later}})
+        await db.questions.delete_one({"_id": ids[3]})
+        added = ObjectId()
+        await db.questions.insert_one({"_id": added, "text": "nueva pregunta", "createdAt": later})
+        # Restored with an old id and date: only the count check finds it
+        restored = ObjectId.from_datetime(start - timedelta(days=30))
+        await db.questions.insert_one({"_id": restored, "text": "restaurada", "answer": "disco", "createdAt": start})
+
+        result = await index.sync(db)
+
+        assert result == {"added": 2, "answered": 2, "removed": 2}
+        assert len(index) == 4
+        assert {hit["id"] for hit in index.search("concierto")} == {str(ids[0])}
+        assert {hit["id"] for hit in index.search("vestido")} == {str(ids[1])}
+        assert index.pending_ids() == [added]
+        assert {hit["id"] for hit in index.search("disco")} == {str(restored)}
+        assert index.watermark == later
+
+    asyncio.run(scenario())
+
+
+def test_snapshot_from_another_dataset_is_not_trusted(tmp_path):
+    async def scenario():
+        first = AsyncMongoMockClient()["search_test"]
+        await first.questions.insert_one({"_id": ObjectId(), "text": "pregunta vieja"})
+        index = SearchIndex()
+        await index.rebuild(first)
+        index.save(tmp_path / "index.json.gz")
+
+        # Same database name and size, different questions
+        second = AsyncMongoMockClient()["search_test"]
+        await second.questions.insert_one({"_id": ObjectId(), "text": "pregunta nueva"})
+        loaded = SearchIndex()
+        assert loaded.load(tmp_path / "index.json.gz")
+        assert not await loaded.validate(second)
+        assert not await loaded.validate(AsyncMongoMockClient()["other"])
+        assert await loaded.validate(first)
+
+    asyncio.run(scenario())
@@ -0,0 +1,34 @@
+import multiprocessing
+import os
+
+from shared_counters import SharedCounterTable, StripeLocked, _hash
+
+
+def make_table():
+    return SharedCounterTable.create(multiprocessing.get_context("fork"), capacity=64, stripes=4, lock_timeout=0.05)
+
+
+def hold_stripe_and_die(table, key):
+    # Exits inside the critical section, as a killed worker would
+    with table._stripe(_hash(key.encode())):
+        os._exit(1)
+
+
+def test_locks_of_a_dead_worker_are_released():
+    ctx = multiprocessing.get_context("fork")
+    table = make_table()
+    try:
+        worker = ctx.Process(target=hold_stripe_and_die, args=(table, "outfits:a:votes"))
+        worker.start()
+        worker.join()
+        try:
+            table.incr("outfits:a:votes")
+        except StripeLocked:
+            pass
+        else:
+            raise AssertionError("expected StripeLocked")
+        assert table.release_locks_of(worker.pid) == 1
+        assert table.incr("outfits:a:votes") == (1, False)
+        assert table.take_pending() == {"outfits:a:votes": 1}
+    finally:
+        table.close(unlink=True)
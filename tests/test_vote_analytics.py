@@ -0,0 +1,109 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockClient
+
+from vote_analytics import VoteAnalytics, hour_bucket
+from vote_ingest import PendingVote
+
+
+class FlakyRollups:
+    def __init__(self, collection, failures):
+        self._collection = collection
+        self.failures = failures
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+    async def bulk_write(self, requests, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("primary stepped down")
+        return await self._collection.bulk_write(requests, **kwargs)
+
+
+class Db:
+    def __init__(self, db, vote_rollups):
+        self._db = db
+        self.vote_rollups = vote_rollups
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+
+async def store(db, analytics, outfit, reaction="💖", live=True):
+    """Insert a vote the way the ingestor does; ``live=False`` skips the rollups, like a bulk load."""
+    vote = PendingVote(outfit, None, reaction, created_at=datetime.utcnow())
+    await db.votes.insert_one(vote.to_document())
+    if live:
+        await analytics.record([vote])
+
+
+def test_failed_increments_are_kept_and_retried():
+    async def scenario():
+        db = AsyncMongoMockClient()["analytics_test"]
+        analytics = VoteAnalytics(Db(db, FlakyRollups(db.vote_rollups, failures=1)))
+        outfit = ObjectId()
+        votes = [PendingVote(outfit, None, "🔥", created_at=datetime.utcnow())]
+
+        try:
+            await analytics.record(votes)
+        except ConnectionError:
+            pass
+        assert await analytics.totals() == 0
+
+        # The next batch carries the failed increments along
+        await analytics.record(votes)
+        assert await analytics.totals() == 2
+        assert (await analytics.outfit_reactions(outfit)) == {"reactions": {"🔥": 2}, "total": 2}
+
+    asyncio.run(scenario())
+
+
+def test_backfill_counts_the_current_hour_and_keeps_live_votes():
+    async def scenario():
+        db = AsyncMongoMockClient()["analytics_test"]
+        analytics = VoteAnalytics(db)
+        outfit = ObjectId()
+        for _ in range(3):
+            await store(db, analytics, outfit, live=False)
+        pauses = 0
+
+        @asynccontextmanager
+        async def pause():
+            nonlocal pauses
+            pauses += 1
+            yield
+            if pauses == 1:
+                # A flush lands between the cutoff and the rollup rewrite
+                await store(db, analytics, outfit, "👏")
+
+        await analytics.backfill(pause)
+        assert await analytics.totals() == 4
+        assert await analytics.totals(since=hour_bucket(datetime.utcnow())) == 4
+        assert (await analytics.outfit_reactions(outfit))["reactions"] == {"💖": 3, "👏": 1}
+
+        # Later votes add to the rebuilt buckets
+        await store(db, analytics, outfit)
+        assert await analytics.totals() == 5
+
+    asyncio.run(scenario())
+
+
+def test_votes_loaded_behind_the_rollups_trigger_a_backfill():
+    async def scenario():
+        db = AsyncMongoMockClient()["analytics_test"]
+        analytics = VoteAnalytics(db)
+        outfit = ObjectId()
+        await store(db, analytics, outfit)
+        await analytics.backfill_if_stale()
+        assert analytics.last_backfill is None
+
+        await store(db, analytics, outfit, live=False)
+        await analytics.backfill_if_stale()
+        assert analytics.last_backfill["votes_scanned"] == 2
+        assert await analytics.totals() == 2
+
+    asyncio.run(scenario())
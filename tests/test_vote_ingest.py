@@ -0,0 +1,191 @@
+import asyncio
+
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockClient
+from pymongo.errors import BulkWriteError
+
+from shared_counters import TableFull
+from vote_ingest import ACK_AFTER_FLUSH, DuplicateVote, OutfitNotFound, VoteIngestor, VoteWriteFailed
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def make_db(outfits=2):
+    db = AsyncMongoMockClient()["votes_test"]
+    await db.votes.create_index([("outfitId", 1), ("fanId", 1)], unique=True)
+    ids = [ObjectId() for _ in range(outfits)]
+    await db.outfits.insert_many([{"_id": oid, "votes": 0} for oid in ids])
+    return db, ids
+
+
+def make_ingestor(db, **kwargs):
+    ingestor = VoteIngestor(db, flush_interval_ms=10_000, ack_mode=ACK_AFTER_FLUSH, **kwargs)
+    written = []
+    ingestor.add_listener(written.extend)
+    return ingestor, written
+
+
+async def submit_all(ingestor, votes):
+    tasks = [asyncio.ensure_future(ingestor.submit(*vote)) for vote in votes]
+    await asyncio.sleep(0)
+    await ingestor.flush()
+    return await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class FailingCollection:
+    """Wraps a collection so ``bulk_write`` raises ``error`` after (optionally) running."""
+
+    def __init__(self, collection, error, run_first=False):
+        self._collection = collection
+        self._error = error
+        self._run_first = run_first
+        self.calls = 0
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+    async def bulk_write(self, requests, **kwargs):
+        self.calls += 1
+        if self._run_first:
+            await self._collection.bulk_write(requests, **kwargs)
+        raise self._error
+
+
+class PatchedDb:
+    def __init__(self, db, **collections):
+        self._db = db
+        self.__dict__.update(collections)
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+
+def test_duplicate_in_batch_rejects_only_the_duplicate():
+    async def scenario():
+        db, (outfit, _) = await make_db()
+        fan = str(ObjectId())
+        await db.votes.insert_one({"outfitId": outfit, "fanId": ObjectId(fan)})
+        ingestor, written = make_ingestor(db)
+        results = await submit_all(ingestor, [(str(outfit), fan), (str(outfit), str(ObjectId()))])
+        assert isinstance(results[0], DuplicateVote)
+        assert results[1]["outfitId"] == str(outfit)
+        assert len(written) == 1
+        assert (await db.outfits.find_one({"_id": outfit}))["votes"] == 1
+        assert ingestor.metrics.duplicates == 1
+
+    run(scenario())
+
+
+def test_unknown_outfit_is_rejected_and_others_written():
+    async def scenario():
+        db, (outfit, _) = await make_db()
+        ingestor, written = make_ingestor(db)
+        results = await submit_all(ingestor, [(str(ObjectId()), None), (str(outfit), None)])
+        assert isinstance(results[0], OutfitNotFound)
+        assert results[1]["outfitId"] == str(outfit)
+        assert await db.votes.count_documents({}) == 1
+        assert len(written) == 1
+
+    run(scenario())
+
+
+def test_counter_failure_still_acknowledges_and_retries():
+    async def scenario():
+        db, (outfit, _) = await make_db()
+        failing = FailingCollection(db.outfits, RuntimeError("network"))
+        ingestor, written = make_ingestor(PatchedDb(db, outfits=failing))
+        results = await submit_all(ingestor, [(str(outfit), str(ObjectId())), (str(outfit), str(ObjectId()))])
+        assert all(isinstance(result, dict) for result in results)
+        assert len(written) == 2
+        assert await db.votes.count_documents({}) == 2
+        assert ingestor.unapplied_increments == 2
+        assert ingestor.metrics.counter_failures == 1
+
+        # The next flush applies the carried-over increments
+        ingestor.db = db
+        await ingestor.flush()
+        assert ingestor.unapplied_increments == 0
+        assert (await db.outfits.find_one({"_id": outfit}))["votes"] == 2
+
+    run(scenario())
+
+
+def test_shared_counter_failure_falls_back_to_mongo():
+    async def scenario():
+        db, (outfit, _) = await make_db()
+        calls = []
+
+        def counter(oid, n):
+            calls.append((oid, n))
+            raise TableFull("stripe 3 is full")
+
+        ingestor, written = make_ingestor(db, outfit_counter=counter)
+        results = await submit_all(ingestor, [(str(outfit), None)])
+        assert isinstance(results[0], dict)
+        assert len(written) == 1
+        assert calls == [(outfit, 1)]
+        assert ingestor.unapplied_increments == 0
+        assert (await db.outfits.find_one({"_id": outfit}))["votes"] == 1
+
+    run(scenario())
+
+
+def test_other_write_error_rejects_only_the_failed_document():
+    async def scenario():
+        db, (outfit, other) = await make_db()
+        error = BulkWriteError({"writeErrors": [{"index": 0, "code": 121, "errmsg": "Document failed validation"}]})
+        # The second document is stored by the real insert; the first is reported failed
+        votes = FailingCollection(db.votes, error)
+        ingestor, written = make_ingestor(PatchedDb(db, votes=votes))
+        tasks = [asyncio.ensure_future(ingestor.submit(str(oid), None)) for oid in (outfit, other)]
+        await asyncio.sleep(0)
+        await ingestor.flush()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        assert isinstance(results[0], VoteWriteFailed)
+        assert isinstance(results[1], dict)
+        assert [vote.outfit_id for vote in written] == [other]
+        assert (await db.outfits.find_one({"_id": other}))["votes"] == 1
+        assert (await db.outfits.find_one({"_id": outfit}))["votes"] == 0
+        assert ingestor.metrics.failed_votes == 1
+
+    run(scenario())
+
+
+def test_insert_exception_rejects_the_batch():
+    async def scenario():
+        db, (outfit, _) = await make_db()
+        votes = FailingCollection(db.votes, RuntimeError("connection reset"))
+        ingestor, written = make_ingestor(PatchedDb(db, votes=votes))
+        results = await submit_all(ingestor, [(str(outfit), None)])
+        assert isinstance(results[0], RuntimeError)
+        assert written == []
+        assert ingestor.metrics.failed_flushes == 1
+
+    run(scenario())
+
+
+def test_votes_are_acknowledged_after_writers_finish():
+    async def scenario():
+        db, (outfit, _) = await make_db()
+        ingestor, _ = make_ingestor(db)
+        order = []
+
+        async def writer(votes):
+            await asyncio.sleep(0.01)
+            order.append("writer")
+
+        async def failing_writer(votes):
+            raise RuntimeError("fans unavailable")
+
+        ingestor.add_writer(writer)
+        ingestor.add_writer(failing_writer)
+        task = asyncio.ensure_future(ingestor.submit(str(outfit), str(ObjectId())))
+        task.add_done_callback(lambda _: order.append("ack"))
+        await asyncio.sleep(0)
+        await ingestor.flush()
+        assert isinstance(await task, dict)
+        assert order == ["writer", "ack"]
+
+    run(scenario())
@@ -0,0 +1,22 @@
+from bson import ObjectId
+
+
+def test_made_up_fan_id_votes_anonymously(api):
+    async def scenario():
+        client = api.client
+        outfit = (await client.get("/outfits")).json()["data"][0]["id"]
+        headers = {"X-Forwarded-For": "203.0.113.8"}
+
+        first = await client.post("/votes", headers=headers, json={"outfitId": outfit, "fanId": str(ObjectId())})
+        second = await client.post("/votes", headers=headers, json={"outfitId": outfit, "fanId": str(ObjectId())})
+        assert first.status_code == 200
+        assert first.json()["data"]["vote"]["fanId"] is None
+        assert second.status_code == 400
+
+        # A stored fan still gets their own vote from the same address
+        fan = (await client.get("/fans")).json()["data"][0]["_id"]
+        known = await client.post("/votes", headers=headers, json={"outfitId": outfit, "fanId": fan})
+        assert known.status_code == 200
+        assert known.json()["data"]["vote"]["fanId"] == fan
+
+    api.run(scenario())